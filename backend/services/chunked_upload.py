@@ -0,0 +1,351 @@
+import os
+import json
+import uuid
+import time
+import shutil
+import logging
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "static", "chunk_uploads"))
+SAMPLE_RATE = 16000
+# Decoded audio is cut into segments of about this length for transcription
+SEGMENT_SECONDS = float(os.getenv("CHUNK_SEGMENT_SECONDS", "15"))
+# Cuts are placed at the quietest 20 ms frame in the last part of a segment
+CUT_SEARCH_SECONDS = 2.0
+CUT_FRAME_SAMPLES = SAMPLE_RATE // 50
+TRANSCRIBE_WORKERS = int(os.getenv("CHUNK_TRANSCRIBE_WORKERS", "2"))
+# Live decoders that receive no chunk for this long are aborted (abandoned
+# uploads, or uploads finalized and processed by another worker)
+LIVE_IDLE_SECONDS = float(os.getenv("CHUNK_LIVE_IDLE_SECONDS", "600"))
+# Upload directories untouched for this long are deleted
+UPLOAD_RETENTION_SECONDS = float(os.getenv("CHUNK_UPLOAD_RETENTION_SECONDS", str(24 * 3600)))
+SWEEP_INTERVAL_SECONDS = 60
+
+STATE_OPEN = "open"
+STATE_FINALIZED = "finalized"
+
+
+def quiet_cut(samples: np.ndarray, search: int = int(CUT_SEARCH_SECONDS * SAMPLE_RATE)) -> int:
+    """
+    Sample index at which to cut `samples`: the start of the lowest-energy
+    frame among the last `search` samples, so words are not split.
+    """
+    start = max(0, len(samples) - search)
+    tail = samples[start:start + (len(samples) - start) // CUT_FRAME_SAMPLES * CUT_FRAME_SAMPLES]
+    if not len(tail):
+        return len(samples)
+    energy = np.square(tail.reshape(-1, CUT_FRAME_SAMPLES).astype(np.float32)).mean(axis=1)
+    return start + int(np.argmin(energy)) * CUT_FRAME_SAMPLES
+
+
+class LiveTranscript:
+    """
+    Decodes a growing WebM/MP4 stream with a single long-running ffmpeg
+    process and transcribes the audio in segments while the upload is still
+    in progress.
+
+    transcribe is called with a float32 16 kHz segment and returns a
+    Whisper-style dict with "text" and optionally "segments" (times are
+    relative to the segment and shifted to the whole answer here).
+    """
+
+    def __init__(self, transcribe, segment_seconds: float = SEGMENT_SECONDS):
+        self.transcribe = transcribe
+        self.segment_samples = int(segment_seconds * SAMPLE_RATE)
+        self.pcm = bytearray()
+        self.cut_at = 0  # samples already handed to transcription
+        self.touched = time.monotonic()
+        self.futures = []
+        self.pool = ThreadPoolExecutor(max_workers=TRANSCRIBE_WORKERS, thread_name_prefix="live-transcribe")
+        self.proc = subprocess.Popen(
+            ["ffmpeg", "-loglevel", "error", "-i", "pipe:0",
+             "-f", "s16le", "-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE), "-ac", "1", "pipe:1"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        self.reader = threading.Thread(target=self._read_pcm, daemon=True)
+        self.reader.start()
+
+    def feed(self, data: bytes) -> None:
+        self.touched = time.monotonic()
+        self.proc.stdin.write(data)
+        self.proc.stdin.flush()
+
+    def _samples(self) -> np.ndarray:
+        return np.frombuffer(bytes(self.pcm[self.cut_at * 2:]), dtype=np.int16)
+
+    def _submit(self, samples: np.ndarray) -> None:
+        offset = self.cut_at / SAMPLE_RATE
+        audio = samples.astype(np.float32) / 32768.0
+        self.futures.append((offset, len(samples) / SAMPLE_RATE, self.pool.submit(self.transcribe, audio)))
+        self.cut_at += len(samples)
+
+    def _read_pcm(self) -> None:
+        while True:
+            data = self.proc.stdout.read(SAMPLE_RATE * 2)
+            if not data:
+                return
+            self.pcm.extend(data)
+            while len(self.pcm) // 2 - self.cut_at >= self.segment_samples:
+                pending = self._samples()
+                self._submit(pending[:max(1, quiet_cut(pending[:self.segment_samples]))])
+
+    def finish(self) -> dict:
+        """
+        Flushes the decoder, transcribes the remaining audio and returns
+        {"text", "segments", "audio"} where audio is the full float32 signal.
+        """
+        self.proc.stdin.close()
+        self.reader.join()
+        self.proc.wait()
+        tail = self._samples()
+        if len(tail):
+            self._submit(tail)
+
+        texts, segments = [], []
+        for offset, duration, future in self.futures:
+            result = future.result()
+            text = result.get("text", "").strip()
+            if text:
+                texts.append(text)
+            parts = result.get("segments") or ([{"start": 0.0, "end": duration, "text": text}] if text else [])
+            segments.extend(
+                dict(seg, start=seg["start"] + offset, end=seg["end"] + offset) for seg in parts
+            )
+        self.pool.shutdown()
+        audio = np.frombuffer(bytes(self.pcm), dtype=np.int16).astype(np.float32) / 32768.0
+        return {"text": " ".join(texts), "segments": segments, "audio": audio}
+
+    def abort(self) -> None:
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        self.proc.kill()
+        self.proc.wait()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self.pcm = bytearray()
+
+
+class ChunkedUploadStore:
+    """
+    Resumable uploads of a recording sent in ordered chunks (e.g. MediaRecorder
+    timeslices). Chunks are appended to one file on disk, and the
+    upload state lives next to it, so any worker can accept the next chunk
+    or report where to resume.
+
+    When a transcribe callable is given, the worker that receives chunk 0
+    also feeds every chunk it accepts into a LiveTranscript, so most of the
+    audio is already transcribed by the time the upload is finalized.
+    Uploads whose chunks were spread across processes fall back to
+    processing the finished file.
+
+    Live decoders idle for LIVE_IDLE_SECONDS and upload directories
+    untouched for UPLOAD_RETENTION_SECONDS are removed by sweep(), which
+    runs in the background at most once per SWEEP_INTERVAL_SECONDS.
+    """
+
+    def __init__(self, root: str = UPLOAD_ROOT, transcribe=None):
+        self.root = root
+        self.transcribe = transcribe
+        self.live = {}
+        # Last chunk time of each entry in self.live (entries may be None)
+        self.live_touched = {}
+        self.live_lock = threading.Lock()
+        self.last_sweep = 0.0
+        os.makedirs(root, exist_ok=True)
+
+    def _dir(self, upload_id: str) -> str:
+        return os.path.join(self.root, os.path.basename(upload_id))
+
+    def _read_state(self, upload_id: str):
+        try:
+            with open(os.path.join(self._dir(upload_id), "state.json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_state(self, upload_id: str, state: dict) -> None:
+        path = os.path.join(self._dir(upload_id), "state.json")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(path + ".tmp", path)
+
+    def _locked(self, upload_id: str):
+        lock_file = open(os.path.join(self._dir(upload_id), "lock"), "a")
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+
+    def init(self, meta: dict, extension: str = ".webm") -> str:
+        """
+        Starts an upload and returns its ID.
+        """
+        self._schedule_sweep()
+        upload_id = str(uuid.uuid4())
+        os.makedirs(self._dir(upload_id))
+        self._write_state(upload_id, {
+            "upload_id": upload_id,
+            "state": STATE_OPEN,
+            "next_index": 0,
+            "bytes": 0,
+            "file": f"recording{extension}",
+            "created_at": time.time(),
+            "meta": meta,
+        })
+        return upload_id
+
+    def status(self, upload_id: str):
+        """
+        Returns the upload state (including next_index to resume from), or
+        None for an unknown upload.
+        """
+        return self._read_state(upload_id)
+
+    def append(self, upload_id: str, index: int, data: bytes):
+        """
+        Appends chunk `index`. Re-sent chunks below next_index are ignored,
+        so clients can retry safely. Returns the new state, or None for an
+        unknown upload.
+
+        Raises:
+            ValueError: if the upload is finalized or the chunk is out of order
+        """
+        if self._read_state(upload_id) is None:
+            return None
+        self._schedule_sweep()
+        with self._locked(upload_id):
+            state = self._read_state(upload_id)
+            if state["state"] != STATE_OPEN:
+                raise ValueError("Upload is already finalized")
+            if index < state["next_index"]:
+                return state
+            if index > state["next_index"]:
+                raise ValueError(f"Expected chunk {state['next_index']}, got {index}")
+
+            with open(os.path.join(self._dir(upload_id), state["file"]), "ab") as f:
+                f.write(data)
+            state["next_index"] += 1
+            state["bytes"] += len(data)
+            self._write_state(upload_id, state)
+            # Still under the lock, so the decoder sees chunks in order
+            self._feed_live(upload_id, index, data)
+        return state
+
+    def _feed_live(self, upload_id: str, index: int, data: bytes) -> None:
+        if self.transcribe is None:
+            return
+        with self.live_lock:
+            live = self.live.get(upload_id)
+            if live is None and index == 0:
+                try:
+                    live = self.live[upload_id] = LiveTranscript(self.transcribe)
+                except OSError as e:
+                    logger.warning(f"Live decoding unavailable for upload {upload_id}: {e}")
+                    return
+            if live is None:
+                return
+            self.live_touched[upload_id] = time.monotonic()
+            try:
+                live.feed(data)
+            except (BrokenPipeError, OSError) as e:
+                logger.warning(f"Live decoding stopped for upload {upload_id}: {e}")
+                live.abort()
+                # A gap would corrupt the stream; process the file at finalize instead
+                self.live[upload_id] = None
+
+    def finalize(self, upload_id: str, start_job=None, key: str = "job_id"):
+        """
+        Closes the upload. Returns (recording_path, state), or None for an
+        unknown upload. Finalizing twice returns the same result.
+
+        start_job(recording_path, state), if given, is called to start
+        processing and returns a job ID, which is stored as state[key].
+        The check and the call happen under the upload's lock, so concurrent
+        or retried finalize calls start a single job. If start_job raises,
+        nothing is stored and the next call tries again.
+        """
+        if self._read_state(upload_id) is None:
+            return None
+        with self._locked(upload_id):
+            state = self._read_state(upload_id)
+            path = os.path.join(self._dir(upload_id), state["file"])
+            changed = False
+            if state["state"] == STATE_OPEN:
+                state["state"] = STATE_FINALIZED
+                state["finalized_at"] = time.time()
+                changed = True
+            if start_job is not None and not state.get(key):
+                state[key] = start_job(path, state)
+                changed = True
+            if changed:
+                self._write_state(upload_id, state)
+        return path, state
+
+    def finish_transcript(self, upload_id: str):
+        """
+        Waits for the incremental transcript of a finalized upload and
+        returns {"text", "segments", "audio"}, or None if this process did
+        not decode the upload live (the caller then processes the file).
+        """
+        with self.live_lock:
+            live = self.live.pop(upload_id, None)
+            self.live_touched.pop(upload_id, None)
+        if live is None:
+            return None
+        try:
+            return live.finish()
+        except Exception as e:
+            logger.error(f"Incremental transcription failed for upload {upload_id}: {e}")
+            live.abort()
+            return None
+
+    def sweep(self) -> dict:
+        """
+        Aborts live decoders idle for more than LIVE_IDLE_SECONDS (killing
+        their ffmpeg process and freeing the decoded audio) and deletes
+        upload directories untouched for more than UPLOAD_RETENTION_SECONDS.
+        Returns the number of each removed.
+        """
+        now = time.monotonic()
+        with self.live_lock:
+            idle = [upload_id for upload_id, touched in self.live_touched.items()
+                    if now - touched > LIVE_IDLE_SECONDS]
+            stale = [(upload_id, self.live.pop(upload_id, None)) for upload_id in idle]
+            for upload_id in idle:
+                del self.live_touched[upload_id]
+        for upload_id, live in stale:
+            if live is not None:
+                logger.info(f"Aborting idle live decoding for upload {upload_id}")
+                live.abort()
+
+        removed = 0
+        cutoff = time.time() - UPLOAD_RETENTION_SECONDS
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                touched = max(os.path.getmtime(os.path.join(path, entry)) for entry in os.listdir(path) or ["."])
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            if touched < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+        return {"live_aborted": sum(live is not None for _, live in stale), "uploads_removed": removed}
+
+    def _schedule_sweep(self) -> None:
+        now = time.time()
+        with self.live_lock:
+            if now - self.last_sweep < SWEEP_INTERVAL_SECONDS:
+                return
+            self.last_sweep = now
+        threading.Thread(target=self.sweep, daemon=True).start()
@@ -1,16 +1,49 @@
+import os
 import cv2
 import mediapipe as mp
 import time
 from datetime import datetime
-from json_utils import load_sessions, save_sessions, remove_old_sessions
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from json_utils import append_session
+from landmark_timeline import LandmarkTimeline, load_timeline, timeline_path
+from gesture_classifiers import classify_window, gesture_counts
 
 mp_hands = mp.solutions.hands
 mp_face_mesh = mp.solutions.face_mesh
 mp_pose = mp.solutions.pose
 
+# Default sampling rate for coach_video_file; 0 analyzes every frame
+GESTURE_TARGET_FPS = float(os.getenv("GESTURE_TARGET_FPS", "0"))
+# Worker processes for coach_video_file; 1 analyzes in a single pass
+GESTURE_WORKERS = int(os.getenv("GESTURE_WORKERS", "1"))
+# Save per-frame landmarks next to each analyzed video for later re-analysis
+GESTURE_RECORD_LANDMARKS = os.getenv("GESTURE_RECORD_LANDMARKS", "0") == "1"
+# Frames buffered before the vectorized classifiers run
+CLASSIFY_WINDOW = 64
+
+class MediaClock:
+    """
+    Clock that reports the presentation timestamp of the frame being
+    analyzed, so offline metrics follow the video timeline rather than
+    processing speed.
+    """
+
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def set(self, timestamp):
+        self.now = timestamp
+
+    def __call__(self):
+        return self.now
+
 class InterviewAnalytics:
-    def __init__(self):
-        self.session_start_time = time.time()
+    def __init__(self, clock=None):
+        # Wall clock for live use; pass a MediaClock for recorded video
+        self.clock = clock or time.time
+        self.session_start_time = self.clock()
+        self.session_end_time = None
         self.eye_contact_duration = 0
         self.last_eye_contact_time = None
         self.hand_gesture_counts = {
@@ -26,7 +59,7 @@ class InterviewAnalytics:
         self.last_poor_posture_time = None
 
     def update_eye_contact(self, has_contact):
-        current_time = time.time()
+        current_time = self.clock()
         if has_contact:
             if self.last_eye_contact_time is not None:
                 self.eye_contact_duration += (current_time - self.last_eye_contact_time)
@@ -34,12 +67,45 @@ class InterviewAnalytics:
         else:
             self.last_eye_contact_time = None
 
-    def update_gesture(self, gesture_type):
+    def update_gesture(self, gesture_type, count=1):
         if gesture_type in self.hand_gesture_counts:
-            self.hand_gesture_counts[gesture_type] += 1
+            self.hand_gesture_counts[gesture_type] += count
+
+    @staticmethod
+    def _contiguous_duration(timestamps, active, last_time):
+        # Vectorized form of the per-frame update: add the gap to the previous
+        # frame wherever both frames are active
+        previous_time = np.concatenate(([last_time if last_time is not None else 0.0], timestamps[:-1]))
+        previous_active = np.concatenate(([last_time is not None], active[:-1]))
+        duration = float(np.sum((timestamps - previous_time)[active & previous_active]))
+        return duration, (float(timestamps[-1]) if active[-1] else None)
+
+    def add_eye_contact(self, timestamps, has_contact):
+        """
+        Bulk update_eye_contact over consecutive frames (NumPy arrays).
+        """
+        if len(timestamps):
+            duration, self.last_eye_contact_time = self._contiguous_duration(
+                timestamps, has_contact, self.last_eye_contact_time
+            )
+            self.eye_contact_duration += duration
+
+    def add_posture(self, timestamps, is_good_posture):
+        """
+        Bulk update_posture over consecutive frames (NumPy arrays).
+        """
+        if len(timestamps):
+            duration, self.last_poor_posture_time = self._contiguous_duration(
+                timestamps, ~is_good_posture, self.last_poor_posture_time
+            )
+            self.poor_posture_duration += duration
+
+    def add_gesture_counts(self, counts):
+        for gesture_type, count in counts.items():
+            self.update_gesture(gesture_type, count)
 
     def update_posture(self, is_good_posture):
-        current_time = time.time()
+        current_time = self.clock()
         if not is_good_posture:
             if self.last_poor_posture_time is not None:
                 self.poor_posture_duration += (current_time - self.last_poor_posture_time)
@@ -47,8 +113,34 @@ class InterviewAnalytics:
         else:
             self.last_poor_posture_time = None
 
+    def stop(self, end_time=None):
+        """
+        Freezes the session duration, e.g. before handing results to another
+        process. end_time defaults to the clock's current time.
+        """
+        if self.session_end_time is None:
+            self.session_end_time = end_time if end_time is not None else self.clock()
+
     def get_session_duration(self):
-        return time.time() - self.session_start_time
+        end_time = self.session_end_time if self.session_end_time is not None else self.clock()
+        return end_time - self.session_start_time
+
+    @classmethod
+    def merge(cls, parts):
+        """
+        Combines stopped analytics of consecutive video segments into one:
+        durations and gesture counts add up.
+        """
+        merged = cls(clock=MediaClock())
+        merged.session_start_time = 0.0
+        merged.session_end_time = 0.0
+        for part in parts:
+            merged.session_end_time += part.get_session_duration()
+            merged.eye_contact_duration += part.eye_contact_duration
+            merged.poor_posture_duration += part.poor_posture_duration
+            for gesture, count in part.hand_gesture_counts.items():
+                merged.hand_gesture_counts[gesture] = merged.hand_gesture_counts.get(gesture, 0) + count
+        return merged
 
     def get_eye_contact_percentage(self):
         duration = self.get_session_duration()
@@ -62,8 +154,11 @@ class InterviewAnalytics:
         return max(self.hand_gesture_counts, key=self.hand_gesture_counts.get)
 
 class InterviewAnalyzer:
-    def __init__(self):
-        self.analytics = InterviewAnalytics()
+    def __init__(self, clock=None, record_landmarks=False, capacity=1024):
+        self.analytics = InterviewAnalytics(clock=clock)
+        self.window = LandmarkTimeline(capacity=CLASSIFY_WINDOW)
+        self.timeline = LandmarkTimeline(capacity=capacity) if record_landmarks else None
+        self.classifier_state = None
         self.gesture_history = []
         self.eye_contact_history = []
         self.posture_history = []
@@ -72,7 +167,11 @@ class InterviewAnalyzer:
         self.face_model = mp_face_mesh.FaceMesh(static_image_mode=False, max_num_faces=1, min_detection_confidence=0.5)
         self.pose_model = mp_pose.Pose(static_image_mode=False, min_detection_confidence=0.5)
 
-    def analyze_frame(self, image):
+    def analyze_frame(self, image, weight=1):
+        """
+        Analyzes one frame. weight is the number of source frames it stands
+        for when sampling, so gesture counts stay comparable to full rate.
+        """
         image = cv2.resize(image, (0, 0), fx=0.5, fy=0.5)
         image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
 
@@ -80,59 +179,275 @@ class InterviewAnalyzer:
         face_results = self.face_model.process(image_rgb)
         pose_results = self.pose_model.process(image_rgb)
 
-        # Hand gesture analysis (dummy example)
-        if hand_results.multi_hand_landmarks:
-            landmarks = hand_results.multi_hand_landmarks[0]
-            self.analytics.update_gesture("open_palm")
-
-        # Eye contact (dummy logic for example)
-        if face_results.multi_face_landmarks:
-            self.analytics.update_eye_contact(True)
+        self.window.append(self.analytics.clock(), weight, hand_results, face_results, pose_results)
+        if self.window.size >= CLASSIFY_WINDOW:
+            self.flush()
 
-        # Posture (dummy logic for example)
-        if pose_results.pose_landmarks:
-            self.analytics.update_posture(True)
+    def flush(self):
+        """
+        Classifies buffered frames in one vectorized pass and records them
+        in the landmark timeline. Seed-only frames (weight 0) are not recorded.
+        """
+        frames = self.window.to_array()
+        if not len(frames):
+            return
+        self.classifier_state = apply_classification(self.analytics, frames, self.classifier_state)
+        if self.timeline is not None:
+            self.timeline.extend(frames[frames["weight"] > 0])
+        self.window.clear()
 
     def generate_report(self):
-        report = {
-            "timestamp": datetime.now().isoformat(),
-            "duration": int(self.analytics.get_session_duration()),
-            "eye_contact": int(self.analytics.get_eye_contact_percentage()),
-            "posture": 100 - int(self.analytics.get_poor_posture_percentage()),
-            "gestures": {g: c for g, c in self.analytics.hand_gesture_counts.items() if c > 0},
-            "recommendations": self._generate_recommendations()
-        }
-        return report
-
-    def _generate_recommendations(self):
-        recs = []
-        if self.analytics.get_eye_contact_percentage() < 60:
-            recs.append("Improve eye contact")
-        if self.analytics.get_poor_posture_percentage() > 30:
-            recs.append("Maintain better posture")
-        if self.analytics.hand_gesture_counts["hand_near_face"] > 5:
-            recs.append("Avoid touching face during interviews")
-        if self.analytics.hand_gesture_counts["excessive_movement"] > 10:
-            recs.append("Reduce hand movement to show confidence")
-        return recs
-
-def coach_video_file(path):
+        self.flush()
+        return build_report(self.analytics)
+
+
+def apply_classification(analytics, frames, state=None):
+    """
+    Classifies a window of landmark timeline rows and feeds the results to
+    analytics in bulk. Returns the classifier state for the next window.
+    """
+    result = classify_window(frames, state)
+    timestamps = frames["timestamp"].astype(np.float64)
+    analytics.add_gesture_counts(gesture_counts(result["gestures"], frames["weight"].astype(np.float64)))
+    analytics.add_eye_contact(timestamps, result["eye_contact"])
+    # Frames with unknown posture do not count as poor posture
+    analytics.add_posture(timestamps, result["good_posture"] | ~result["posture_known"])
+    return result["state"]
+
+
+def reanalyze_timeline(path):
+    """
+    Rebuilds a report from a saved landmark timeline without decoding the
+    video or running MediaPipe. The timeline is memory-mapped.
+    """
+    frames = load_timeline(path)
+    clock = MediaClock()
+    analytics = InterviewAnalytics(clock=clock)
+    state = None
+    for start in range(0, len(frames), 4096):
+        state = apply_classification(analytics, frames[start:start + 4096], state)
+    if len(frames):
+        clock.set(float(frames["timestamp"][-1]))
+    analytics.stop()
+    return build_report(analytics)
+
+
+def build_report(analytics):
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "duration": int(analytics.get_session_duration()),
+        "eye_contact": int(analytics.get_eye_contact_percentage()),
+        "posture": 100 - int(analytics.get_poor_posture_percentage()),
+        "gestures": {g: c for g, c in analytics.hand_gesture_counts.items() if c > 0},
+        "recommendations": _generate_recommendations(analytics)
+    }
+    return report
+
+def _generate_recommendations(analytics):
+    recs = []
+    if analytics.get_eye_contact_percentage() < 60:
+        recs.append("Improve eye contact")
+    if analytics.get_poor_posture_percentage() > 30:
+        recs.append("Maintain better posture")
+    if analytics.hand_gesture_counts["hand_near_face"] > 5:
+        recs.append("Avoid touching face during interviews")
+    if analytics.hand_gesture_counts["excessive_movement"] > 10:
+        recs.append("Reduce hand movement to show confidence")
+    return recs
+
+class FrameSampler:
+    """
+    Picks which decoded frames to analyze, using container timestamps.
+
+    Modes can be combined; the sparsest wins:
+      - target_fps: analyze at most this many frames per second of video
+      - stride: analyze every Nth frame
+      - time_budget: spread analysis so it takes about this many seconds,
+        adapting to the measured per-frame cost (needs the video duration)
+    """
+
+    def __init__(self, target_fps=None, stride=None, time_budget=None, duration=None):
+        self.min_interval = 1.0 / target_fps if target_fps else 0.0
+        self.stride = max(1, int(stride or 1))
+        self.time_budget = time_budget if time_budget and duration else None
+        self.duration = duration
+        self.next_time = 0.0
+        self.spent = 0.0
+        self.analyzed = 0
+
+    def _interval(self, timestamp):
+        interval = self.min_interval
+        if self.time_budget is not None and self.analyzed:
+            remaining_budget = self.time_budget - self.spent
+            remaining_duration = max(self.duration - timestamp, 0.0)
+            affordable = remaining_budget / (self.spent / self.analyzed)
+            interval = max(interval, remaining_duration / max(affordable, 1.0))
+        return interval
+
+    def should_analyze(self, index, timestamp):
+        if index % self.stride:
+            return False
+        return timestamp >= self.next_time
+
+    def record(self, timestamp, cost):
+        self.spent += cost
+        self.analyzed += 1
+        self.next_time = timestamp + self._interval(timestamp)
+
+
+def _video_duration(cap):
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    frame_count = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+    return frame_count / fps if fps > 0 and frame_count > 0 else None
+
+
+def _seek(cap, path, start):
+    """
+    Positions cap at or before `start` seconds. Falls back to decoding from
+    the beginning when the container cannot seek precisely.
+    """
+    if start <= 0:
+        return cap
+    # Land a little early so the frame just before `start` is still decoded
+    cap.set(cv2.CAP_PROP_POS_MSEC, max(start - 1.0, 0.0) * 1000.0)
+    if cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0 < start:
+        return cap
+    cap.release()
+    return cv2.VideoCapture(path)
+
+
+def analyze_segment(path, start=0.0, end=None, target_fps=None, stride=None, time_budget=None,
+                    record_landmarks=False):
+    """
+    Runs a fresh InterviewAnalyzer over the frames with timestamps in
+    [start, end) and returns its stopped InterviewAnalytics together with
+    the recorded landmark frames (None unless record_landmarks).
+
+    Metrics use a MediaClock fed by frame timestamps, so results do not
+    depend on processing speed. For a segment after the first, the frame
+    just before `start` is analyzed without counting gestures to seed the
+    eye-contact and posture state, and the segment is closed at `end`, so
+    merged segments add up to the single-pass result.
+    """
     cap = cv2.VideoCapture(path)
-    analyzer = InterviewAnalyzer()
+    duration = _video_duration(cap)
+    if duration is not None and end is not None:
+        duration = min(duration, end) - start
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    capacity = int(duration * fps) + 1 if duration and 0 < fps < 240 else 1024
+    cap = _seek(cap, path, start)
+    clock = MediaClock(start)
+    analyzer = InterviewAnalyzer(clock=clock, record_landmarks=record_landmarks, capacity=capacity)
+    sampler = FrameSampler(target_fps=target_fps, stride=stride, time_budget=time_budget, duration=duration)
 
+    index = 0
+    skipped = 0
+    previous = None
+    last_timestamp = None
     while cap.isOpened():
-        success, frame = cap.read()
-        if not success:
+        if not cap.grab():
             break
-        analyzer.analyze_frame(frame)
+        timestamp = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+        if timestamp < start:
+            success, frame = cap.retrieve()
+            previous = (timestamp, frame) if success else None
+            continue
+        if end is not None and timestamp >= end:
+            break
+        last_timestamp = timestamp
+        if previous is not None:
+            clock.set(previous[0])
+            analyzer.analyze_frame(previous[1], weight=0)
+            previous = None
+        if sampler.should_analyze(index, timestamp - start):
+            success, frame = cap.retrieve()
+            if not success:
+                break
+            clock.set(timestamp)
+            began = time.perf_counter()
+            analyzer.analyze_frame(frame, weight=skipped + 1)
+            sampler.record(timestamp - start, time.perf_counter() - began)
+            skipped = 0
+        else:
+            skipped += 1
+        index += 1
 
     cap.release()
-    session_data = analyzer.generate_report()
+    analyzer.flush()
+    # Cover frames skipped by the sampler at the end of the segment too
+    if last_timestamp is not None:
+        clock.set(last_timestamp)
+    analyzer.analytics.stop(end_time=end)
+    frames = analyzer.timeline.to_array() if analyzer.timeline is not None else None
+    return analyzer.analytics, frames
+
+
+def analyze_video_file(path, target_fps=None, stride=None, time_budget=None, landmarks_path=None):
+    """
+    Runs InterviewAnalyzer over a video file and returns its report.
+    Frames not selected by the sampler are grabbed but never converted or
+    passed through the MediaPipe models. With landmarks_path, the per-frame
+    landmarks are saved there for reanalyze_timeline.
+    """
+    analytics, frames = analyze_segment(
+        path, target_fps=target_fps, stride=stride, time_budget=time_budget,
+        record_landmarks=landmarks_path is not None
+    )
+    if landmarks_path is not None:
+        np.save(landmarks_path, frames, allow_pickle=False)
+    return build_report(analytics)
+
+
+def analyze_video_file_parallel(path, workers=None, target_fps=None, stride=None, time_budget=None,
+                                landmarks_path=None):
+    """
+    Splits the video into one time segment per worker, analyzes each in its
+    own process with its own MediaPipe models, and merges the partial
+    InterviewAnalytics into a single report. A time_budget applies to each
+    segment. Falls back to a single pass when the duration is unknown.
+    """
+    workers = workers or os.cpu_count() or 1
+    cap = cv2.VideoCapture(path)
+    duration = _video_duration(cap)
+    cap.release()
+    if workers < 2 or duration is None:
+        return analyze_video_file(
+            path, target_fps=target_fps, stride=stride, time_budget=time_budget, landmarks_path=landmarks_path
+        )
+
+    bounds = [duration * i / workers for i in range(workers)] + [None]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(
+                analyze_segment, path, bounds[i], bounds[i + 1], target_fps, stride, time_budget,
+                landmarks_path is not None
+            )
+            for i in range(workers)
+        ]
+        parts = [future.result() for future in futures]
+    if landmarks_path is not None:
+        np.save(landmarks_path, np.concatenate([frames for _, frames in parts]), allow_pickle=False)
+    return build_report(InterviewAnalytics.merge([analytics for analytics, _ in parts]))
+
+
+def coach_video_file(path, target_fps=None, stride=None, time_budget=None, workers=None, record_landmarks=None):
+    target_fps = target_fps if target_fps is not None else (GESTURE_TARGET_FPS or None)
+    workers = workers if workers is not None else GESTURE_WORKERS
+    record_landmarks = record_landmarks if record_landmarks is not None else GESTURE_RECORD_LANDMARKS
+    landmarks_path = timeline_path(path) if record_landmarks else None
+    if workers > 1:
+        session_data = analyze_video_file_parallel(
+            path, workers=workers, target_fps=target_fps, stride=stride, time_budget=time_budget,
+            landmarks_path=landmarks_path
+        )
+    else:
+        session_data = analyze_video_file(
+            path, target_fps=target_fps, stride=stride, time_budget=time_budget, landmarks_path=landmarks_path
+        )
+    if landmarks_path is not None:
+        session_data["landmarks_path"] = landmarks_path
 
-    # Save to JSON with 5-year cleanup
-    sessions = load_sessions()
-    sessions.append(session_data)
-    sessions = remove_old_sessions(sessions)
-    save_sessions(sessions)
+    # Append to the session log; 5-year cleanup runs in the background
+    append_session(session_data)
 
     return session_data
@@ -0,0 +1,141 @@
+"""
+Benchmarks for gesture analysis settings against full-rate analysis.
+
+Usage (from backend/services):
+    python gesture_benchmark.py answer.webm --fps 15 10 5 2 --stride 2 4 --budget 10 --workers 2 4
+    python gesture_benchmark.py --classifiers 9000
+"""
+import sys
+import time
+import argparse
+
+import numpy as np
+
+from landmark_timeline import FRAME_DTYPE, HAS_HAND_0, HAS_HAND_1, HAS_FACE, HAS_POSE
+from gesture_classifiers import classify_window
+
+
+def compare_reports(reference: dict, report: dict) -> dict:
+    """
+    Absolute errors of a report's metrics against a full-rate reference.
+    Gesture error is the total count difference relative to the reference total.
+    """
+    gestures = set(reference["gestures"]) | set(report["gestures"])
+    gesture_diff = sum(abs(reference["gestures"].get(g, 0) - report["gestures"].get(g, 0)) for g in gestures)
+    gesture_total = sum(reference["gestures"].values())
+    return {
+        "duration_error": abs(reference["duration"] - report["duration"]),
+        "eye_contact_error": abs(reference["eye_contact"] - report["eye_contact"]),
+        "posture_error": abs(reference["posture"] - report["posture"]),
+        "gesture_error": round(gesture_diff / gesture_total, 3) if gesture_total else float(gesture_diff > 0),
+    }
+
+
+def benchmark_sampling(path: str, settings: list) -> list:
+    """
+    Runs full-rate analysis once, then each setting (a dict of
+    analyze_video_file keyword arguments, or analyze_video_file_parallel
+    ones when it has "workers"), and returns one row per setting with its
+    runtime, speedup and metric errors.
+    """
+    # Imported here so the classifier benchmark needs only NumPy
+    from facial_gesture_analysis import analyze_video_file, analyze_video_file_parallel
+
+    start = time.perf_counter()
+    reference = analyze_video_file(path)
+    reference_time = time.perf_counter() - start
+    rows = [{"setting": "full", "seconds": round(reference_time, 2), "speedup": 1.0}]
+
+    for setting in settings:
+        start = time.perf_counter()
+        analyze = analyze_video_file_parallel if "workers" in setting else analyze_video_file
+        report = analyze(path, **setting)
+        elapsed = time.perf_counter() - start
+        row = {
+            "setting": ", ".join(f"{k}={v}" for k, v in setting.items()),
+            "seconds": round(elapsed, 2),
+            "speedup": round(reference_time / elapsed, 2) if elapsed > 0 else float("inf"),
+        }
+        row.update(compare_reports(reference, report))
+        rows.append(row)
+    return rows
+
+
+def synthetic_frames(n_frames: int, fps: float = 30.0, seed: int = 0) -> np.ndarray:
+    """
+    Random landmark timeline rows with realistic presence rates.
+    """
+    rng = np.random.default_rng(seed)
+    frames = np.zeros(n_frames, dtype=FRAME_DTYPE)
+    frames["timestamp"] = np.arange(n_frames) / fps
+    frames["weight"] = 1
+    flags = np.full(n_frames, HAS_FACE | HAS_POSE, dtype=np.uint8)
+    flags[rng.random(n_frames) < 0.6] |= HAS_HAND_0
+    flags[rng.random(n_frames) < 0.3] |= HAS_HAND_1
+    frames["flags"] = flags
+    frames["hands"] = rng.random(frames["hands"].shape)
+    frames["face"] = rng.random(frames["face"].shape)
+    frames["pose"] = rng.random(frames["pose"].shape)
+    return frames
+
+
+def benchmark_classifiers(n_frames: int, window: int = 64) -> list:
+    """
+    Frames/sec of the vectorized classifiers over windows versus calling
+    them one frame at a time, and whether both give identical labels.
+    """
+    frames = synthetic_frames(n_frames)
+    rows = []
+    labels = {}
+    for name, size in (("per_frame", 1), (f"window_{window}", window), ("whole", n_frames)):
+        state = None
+        gestures = []
+        start = time.perf_counter()
+        for i in range(0, n_frames, size):
+            result = classify_window(frames[i:i + size], state)
+            state = result["state"]
+            gestures.append(result["gestures"])
+        elapsed = time.perf_counter() - start
+        labels[name] = np.concatenate(gestures)
+        rows.append({"mode": name, "frames": n_frames, "seconds": round(elapsed, 4),
+                     "frames_per_sec": int(n_frames / elapsed) if elapsed > 0 else float("inf")})
+    for row in rows:
+        row["matches_per_frame"] = bool(np.array_equal(labels[row["mode"]], labels["per_frame"]))
+    return rows
+
+
+def print_rows(rows: list) -> None:
+    columns = list(dict.fromkeys(key for row in rows for key in row))
+    print("\t".join(columns))
+    for row in rows:
+        print("\t".join(str(row.get(c, "")) for c in columns))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare sampled gesture analysis with full-rate analysis.")
+    parser.add_argument("video", nargs="?")
+    parser.add_argument("--fps", type=float, nargs="*", default=[10, 5, 2], help="target analysis fps values")
+    parser.add_argument("--stride", type=int, nargs="*", default=[], help="frame strides")
+    parser.add_argument("--budget", type=float, nargs="*", default=[], help="time budgets in seconds")
+    parser.add_argument("--workers", type=int, nargs="*", default=[], help="worker counts for chunked analysis")
+    parser.add_argument("--classifiers", type=int, metavar="FRAMES",
+                        help="micro-benchmark the vectorized classifiers on synthetic frames instead")
+    args = parser.parse_args(argv)
+
+    if args.classifiers:
+        print_rows(benchmark_classifiers(args.classifiers))
+        return
+    if not args.video:
+        parser.error("a video path is required unless --classifiers is given")
+
+    settings = (
+        [{"target_fps": fps} for fps in args.fps]
+        + [{"stride": stride} for stride in args.stride]
+        + [{"time_budget": budget} for budget in args.budget]
+        + [{"workers": workers} for workers in args.workers]
+    )
+    print_rows(benchmark_sampling(args.video, settings))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+import numpy as np
+from landmark_timeline import HAS_HAND_0, HAS_HAND_1, HAS_FACE, HAS_POSE
+
+# Gesture labels, indexed by the codes returned from classify_window
+GESTURE_LABELS = [
+    "open_palm", "closed_fist", "pointing", "hand_near_face",
+    "excessive_movement", "neutral", "thumbs_up",
+]
+NO_HAND = -1
+OPEN_PALM, CLOSED_FIST, POINTING, HAND_NEAR_FACE, EXCESSIVE_MOVEMENT, NEUTRAL, THUMBS_UP = range(7)
+
+# Landmark indices (MediaPipe Hands / FaceMesh / Pose)
+WRIST = 0
+THUMB_IP, THUMB_TIP = 3, 4
+FINGER_PIPS = [6, 10, 14, 18]
+FINGER_TIPS = [8, 12, 16, 20]
+INDEX_MCP = 5
+FACE_NOSE_TIP, FACE_RIGHT_EYE_OUTER, FACE_LEFT_EYE_OUTER = 1, 33, 263
+POSE_NOSE, POSE_LEFT_SHOULDER, POSE_RIGHT_SHOULDER = 0, 11, 12
+
+# Thresholds in normalized image coordinates
+GAZE_MAX_YAW = 0.2
+GAZE_PITCH_RANGE = (0.25, 0.85)
+SHOULDER_MAX_TILT = 0.12
+MIN_HEAD_HEIGHT = 0.35
+MIN_VISIBILITY = 0.5
+HAND_FACE_MARGIN = 0.2
+EXCESSIVE_SPEED = 1.5  # wrist travel in image widths per second
+
+
+def _primary_hand(frames: np.ndarray):
+    # First detected hand per frame, falling back to the second slot
+    has_first = (frames["flags"] & HAS_HAND_0) > 0
+    present = has_first | ((frames["flags"] & HAS_HAND_1) > 0)
+    hand = np.where(has_first[:, None, None], frames["hands"][:, 0], frames["hands"][:, 1])
+    return present, hand.astype(np.float32)
+
+
+def eye_contact_mask(frames: np.ndarray) -> np.ndarray:
+    """
+    Gaze proxy per frame: the nose tip sits centred between the outer eye
+    corners and at a frontal height below them, relative to eye distance.
+    """
+    face = frames["face"][:, :, :2].astype(np.float32)
+    right, left, nose = face[:, FACE_RIGHT_EYE_OUTER], face[:, FACE_LEFT_EYE_OUTER], face[:, FACE_NOSE_TIP]
+    middle = (right + left) / 2
+    eye_distance = np.linalg.norm(left - right, axis=1)
+    valid = ((frames["flags"] & HAS_FACE) > 0) & (eye_distance > 1e-3)
+    eye_distance = np.where(valid, eye_distance, 1.0)
+    yaw = (nose[:, 0] - middle[:, 0]) / eye_distance
+    pitch = (nose[:, 1] - middle[:, 1]) / eye_distance
+    return valid & (np.abs(yaw) < GAZE_MAX_YAW) & (pitch > GAZE_PITCH_RANGE[0]) & (pitch < GAZE_PITCH_RANGE[1])
+
+
+def posture_masks(frames: np.ndarray):
+    """
+    Returns (known, good) per frame. Posture is known when both shoulders
+    are visible; it is good when the shoulders are level and the head is
+    held well above the shoulder line.
+    """
+    pose = frames["pose"].astype(np.float32)
+    left, right, nose = pose[:, POSE_LEFT_SHOULDER], pose[:, POSE_RIGHT_SHOULDER], pose[:, POSE_NOSE]
+    known = (
+        ((frames["flags"] & HAS_POSE) > 0)
+        & (left[:, 3] > MIN_VISIBILITY) & (right[:, 3] > MIN_VISIBILITY)
+    )
+    width = np.abs(left[:, 0] - right[:, 0])
+    known &= width > 1e-3
+    width = np.where(known, width, 1.0)
+    tilt = np.abs(left[:, 1] - right[:, 1]) / width
+    head_height = ((left[:, 1] + right[:, 1]) / 2 - nose[:, 1]) / width
+    return known, known & (tilt < SHOULDER_MAX_TILT) & (head_height > MIN_HEAD_HEIGHT)
+
+
+def hand_near_face_mask(frames: np.ndarray) -> np.ndarray:
+    """
+    True where any fingertip of either hand lies inside the face bounding
+    box grown by HAND_FACE_MARGIN of its width.
+    """
+    face = frames["face"][:, :, :2].astype(np.float32)
+    low, high = face.min(axis=1), face.max(axis=1)
+    margin = (high[:, 0] - low[:, 0])[:, None] * HAND_FACE_MARGIN
+    low, high = low - margin, high + margin
+
+    tips = frames["hands"][:, :, [THUMB_TIP] + FINGER_TIPS, :2].astype(np.float32)
+    inside = np.all((tips >= low[:, None, None]) & (tips <= high[:, None, None]), axis=-1).any(axis=-1)
+    present = np.stack([(frames["flags"] & HAS_HAND_0) > 0, (frames["flags"] & HAS_HAND_1) > 0], axis=1)
+    return ((frames["flags"] & HAS_FACE) > 0) & (inside & present).any(axis=1)
+
+
+def hand_speed(frames: np.ndarray, previous=None):
+    """
+    Wrist speed of the primary hand between consecutive frames where it is
+    present, in image widths per second (0 where unknown).
+
+    previous is the (timestamp, wrist_xy) of the last frame of the prior
+    window, or None. Returns (speeds, new_previous).
+    """
+    if not len(frames):
+        return np.zeros(0), previous
+    present, hand = _primary_hand(frames)
+    wrist = hand[:, WRIST, :2]
+    timestamps = frames["timestamp"].astype(np.float64)
+
+    prev_present = np.concatenate(([previous is not None], present[:-1]))
+    prev_wrist = np.concatenate(([previous[1] if previous is not None else (0.0, 0.0)], wrist[:-1]))
+    prev_time = np.concatenate(([previous[0] if previous is not None else 0.0], timestamps[:-1]))
+
+    dt = timestamps - prev_time
+    valid = present & prev_present & (dt > 0)
+    distance = np.linalg.norm(wrist - prev_wrist, axis=1)
+    speeds = np.where(valid, distance / np.where(valid, dt, 1.0), 0.0)
+
+    previous = (float(timestamps[-1]), wrist[-1].copy()) if present[-1] else None
+    return speeds, previous
+
+
+def hand_shape_codes(frames: np.ndarray) -> np.ndarray:
+    """
+    Static shape of the primary hand from finger extension: open palm,
+    closed fist, pointing, thumbs up, otherwise neutral.
+    """
+    hand = _primary_hand(frames)[1][:, :, :2]
+    wrist = hand[:, WRIST][:, None]
+    tip_reach = np.linalg.norm(hand[:, FINGER_TIPS] - wrist, axis=-1)
+    pip_reach = np.linalg.norm(hand[:, FINGER_PIPS] - wrist, axis=-1)
+    extended = tip_reach > pip_reach * 1.1
+    thumb_extended = (
+        np.linalg.norm(hand[:, THUMB_TIP] - hand[:, INDEX_MCP], axis=-1)
+        > np.linalg.norm(hand[:, THUMB_IP] - hand[:, INDEX_MCP], axis=-1)
+    )
+    thumb_up = thumb_extended & (hand[:, THUMB_TIP, 1] < hand[:, WRIST, 1])
+
+    n_extended = extended.sum(axis=1)
+    codes = np.full(len(frames), NEUTRAL, dtype=np.int8)
+    codes[n_extended == 4] = OPEN_PALM
+    codes[(n_extended == 0) & ~thumb_extended] = CLOSED_FIST
+    codes[(n_extended == 0) & thumb_up] = THUMBS_UP
+    codes[extended[:, 0] & (n_extended == 1)] = POINTING
+    return codes
+
+
+def classify_window(frames: np.ndarray, state=None) -> dict:
+    """
+    Classifies N landmark timeline rows at once.
+
+    Returns a dict with per-frame "gestures" (codes into GESTURE_LABELS,
+    NO_HAND where no hand is visible), "eye_contact", "posture_known",
+    "good_posture", and "state" to pass to the next window.
+    """
+    speeds, state = hand_speed(frames, state)
+    gestures = hand_shape_codes(frames)
+    gestures[speeds > EXCESSIVE_SPEED] = EXCESSIVE_MOVEMENT
+    gestures[hand_near_face_mask(frames)] = HAND_NEAR_FACE
+    gestures[(frames["flags"] & (HAS_HAND_0 | HAS_HAND_1)) == 0] = NO_HAND
+
+    known, good = posture_masks(frames)
+    return {
+        "gestures": gestures,
+        "eye_contact": eye_contact_mask(frames),
+        "posture_known": known,
+        "good_posture": good,
+        "state": state,
+    }
+
+
+def gesture_counts(gestures: np.ndarray, weights: np.ndarray) -> dict:
+    """
+    Weighted gesture totals for a window, keyed by label.
+    """
+    seen = gestures >= 0
+    totals = np.bincount(gestures[seen], weights=weights[seen], minlength=len(GESTURE_LABELS))
+    return {GESTURE_LABELS[i]: int(round(total)) for i, total in enumerate(totals) if total}
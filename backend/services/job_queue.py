@@ -0,0 +1,295 @@
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Persistent job table shared by every worker process on this host
+JOB_DB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "static", "jobs.db"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Streamed handler output is written to the job row at most this often
+JOB_PARTIAL_INTERVAL = float(os.getenv("JOB_PARTIAL_INTERVAL", "0.2"))
+# How often watch() re-reads jobs run by other processes
+JOB_WATCH_POLL = float(os.getenv("JOB_WATCH_POLL", "0.25"))
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+
+
+def _process_start(pid: int):
+    # Start time in clock ticks since boot, or None where /proc is unavailable
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # The command name in parentheses may itself contain spaces
+    return stat[stat.rindex(")") + 2:].split()[19]
+
+
+def _owner_id() -> str:
+    # The start time tells this process apart from a later one reusing its PID (e.g. after a container restart)
+    return f"{socket.gethostname()}:{os.getpid()}:{_process_start(os.getpid()) or ''}"
+
+
+def _owner_alive(owner: str) -> bool:
+    """
+    Returns False only when the owner is a process on this host that no longer exists.
+    """
+    host, _, rest = (owner or "").partition(":")
+    pid, _, started = rest.partition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    current = _process_start(int(pid))
+    return not (started and current and current != started)
+
+
+class _Progress:
+    """
+    The progress callback handed to job handlers. progress(stage, **details)
+    records a completed stage (details are stored with it); progress.token(text) appends streamed output (e.g. LLM
+    tokens) to the job's partial text, flushed every JOB_PARTIAL_INTERVAL.
+    """
+
+    def __init__(self, queue, job_id: str):
+        self.queue = queue
+        self.job_id = job_id
+        self.partial = []
+        self.flushed_at = 0.0
+
+    def __call__(self, stage: str, **details) -> None:
+        self.flush()
+        self.queue._set_stage(self.job_id, stage, details)
+
+    def token(self, text: str) -> None:
+        self.partial.append(text)
+        if time.monotonic() - self.flushed_at >= JOB_PARTIAL_INTERVAL:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.partial:
+            self.queue._set_partial(self.job_id, "".join(self.partial))
+            self.flushed_at = time.monotonic()
+
+
+class JobQueue:
+    """
+    SQLite-backed job queue with a bounded thread pool.
+
+    Jobs are stored with their payload, so queued or interrupted jobs are
+    picked up again by `recover()` after a worker restart. Handlers receive
+    the payload and a `progress(stage)` callback (which also takes streamed
+    output via `progress.token(text)`) and return a JSON-serialisable result.
+    """
+
+    def __init__(self, db_path: str = JOB_DB_PATH, max_workers: int = JOB_WORKERS):
+        self.db_path = db_path
+        self._handlers = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job-worker")
+        self._lock = threading.Lock()
+        # Wakes watch() when a job run by this process changes
+        self._changed = threading.Condition()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    stage TEXT,
+                    stages TEXT NOT NULL DEFAULT '[]',
+                    payload TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    owner TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status)")
+            # Added after the first release; older databases lack the column
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "partial" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN partial TEXT")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def register(self, kind: str, handler) -> None:
+        """
+        Registers the callable that runs jobs of the given kind.
+        """
+        self._handlers[kind] = handler
+
+    def enqueue(self, kind: str, payload: dict) -> str:
+        """
+        Persists a new job and schedules it on the worker pool.
+
+        Returns:
+            str: The job id.
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"No handler registered for job kind: {kind}")
+
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, status, payload, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, kind, STATUS_QUEUED, json.dumps(payload), now, now)
+            )
+        self._executor.submit(self._run, job_id)
+        return job_id
+
+    def get(self, job_id: str):
+        """
+        Returns the job record as a dict, or None if the id is unknown.
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "job_id": row["id"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "stage": row["stage"],
+            "stages": json.loads(row["stages"]),
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "partial": row["partial"],
+            "error": row["error"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+
+    def watch(self, job_id: str, timeout: float = None, keepalive: float = None):
+        """
+        Yields the job record each time it changes (stage, partial output,
+        status), starting with its current state, until the job succeeds or
+        fails or `timeout` seconds pass. Jobs run by this process wake the
+        watcher immediately; others are polled every JOB_WATCH_POLL seconds.
+        With keepalive set, None is yielded after that many seconds without
+        a change.
+        """
+        deadline = time.monotonic() + timeout if timeout else None
+        last = None
+        yielded_at = time.monotonic()
+        while True:
+            job = self.get(job_id)
+            if job is None:
+                return
+            if job["updated_at"] != last:
+                last = job["updated_at"]
+                yielded_at = time.monotonic()
+                yield job
+            elif keepalive and time.monotonic() - yielded_at >= keepalive:
+                yielded_at = time.monotonic()
+                yield None
+            if job["status"] in (STATUS_SUCCEEDED, STATUS_FAILED):
+                return
+            if deadline is not None and time.monotonic() >= deadline:
+                return
+            with self._changed:
+                self._changed.wait(JOB_WATCH_POLL)
+
+    def _notify(self) -> None:
+        with self._changed:
+            self._changed.notify_all()
+
+    def recover(self) -> int:
+        """
+        Re-schedules queued jobs and jobs whose owning process has died.
+        Call once after all handlers are registered.
+
+        Returns:
+            int: Number of jobs scheduled.
+        """
+        with self._lock, self._connect() as conn:
+            running = conn.execute(
+                "SELECT id, owner FROM jobs WHERE status = ?", (STATUS_RUNNING,)
+            ).fetchall()
+            for row in running:
+                if not _owner_alive(row["owner"]):
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, owner = NULL, updated_at = ? WHERE id = ? AND status = ?",
+                        (STATUS_QUEUED, time.time(), row["id"], STATUS_RUNNING)
+                    )
+            queued = conn.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY created_at", (STATUS_QUEUED,)
+            ).fetchall()
+
+        for row in queued:
+            self._executor.submit(self._run, row["id"])
+        return len(queued)
+
+    def _claim(self, job_id: str):
+        # Atomic queued -> running transition so only one worker runs a job; a recovered job starts its stages afresh
+        with self._connect() as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET status = ?, owner = ?, stage = NULL, stages = '[]', partial = NULL, updated_at = ? "
+                "WHERE id = ? AND status = ?",
+                (STATUS_RUNNING, _owner_id(), time.time(), job_id, STATUS_QUEUED)
+            )
+            if cur.rowcount != 1:
+                return None
+            return conn.execute("SELECT kind, payload FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+    def _set_stage(self, job_id: str, stage: str, details: dict = None) -> None:
+        with self._connect() as conn:
+            row = conn.execute("SELECT stages FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            stages = json.loads(row["stages"]) if row else []
+            stages.append(dict(details or {}, stage=stage, at=time.time()))
+            conn.execute(
+                "UPDATE jobs SET stage = ?, stages = ?, updated_at = ? WHERE id = ?",
+                (stage, json.dumps(stages), time.time(), job_id)
+            )
+        self._notify()
+
+    def _set_partial(self, job_id: str, partial: str) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET partial = ?, updated_at = ? WHERE id = ?",
+                (partial, time.time(), job_id)
+            )
+        self._notify()
+
+    def _finish(self, job_id: str, status: str, result=None, error=None) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id)
+            )
+        self._notify()
+
+    def _run(self, job_id: str) -> None:
+        row = self._claim(job_id)
+        if row is None:
+            return
+
+        handler = self._handlers.get(row["kind"])
+        if handler is None:
+            self._finish(job_id, STATUS_FAILED, error=f"No handler registered for job kind: {row['kind']}")
+            return
+
+        progress = _Progress(self, job_id)
+        try:
+            result = handler(json.loads(row["payload"]), progress)
+            progress.flush()
+            self._finish(job_id, STATUS_SUCCEEDED, result=result)
+        except Exception as e:
+            self._finish(job_id, STATUS_FAILED, error=str(e))
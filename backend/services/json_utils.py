@@ -1,19 +1,125 @@
+import os
 import json
+import glob
+import threading
+import time
 from datetime import datetime, timedelta
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Legacy single-file store, migrated into segments on first append
 SESSIONS_FILE = "gesture_sessions.json"
+# Append-only JSONL segments, one file per month: gesture_sessions/YYYY-MM.jsonl
+SESSIONS_DIR = "gesture_sessions"
+RETENTION_YEARS = 5
+RETENTION_INTERVAL_SECONDS = 24 * 3600
+
+_write_lock = threading.Lock()
+_last_retention_run = 0.0
+_legacy_checked = False
+
+
+def _segment_path(timestamp: datetime) -> str:
+    return os.path.join(SESSIONS_DIR, f"{timestamp:%Y-%m}.jsonl")
+
+
+def _segment_month(path: str) -> datetime:
+    return datetime.strptime(os.path.splitext(os.path.basename(path))[0], "%Y-%m")
+
+
+def _append_line(path: str, line: str) -> None:
+    # One write per record under an exclusive lock, so concurrent writers
+    # (threads or processes) never interleave or drop records
+    with _write_lock, open(path, "a", encoding="utf-8") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            f.write(line)
+            f.flush()
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
 
-def load_sessions():
+def _migrate_legacy_file() -> None:
+    global _legacy_checked
+    if _legacy_checked:
+        return
+    _legacy_checked = True
+    # Claim the legacy file with an atomic rename so only one process imports it
+    migrated = SESSIONS_FILE + ".migrated"
     try:
-        with open(SESSIONS_FILE, "r") as f:
-            return json.load(f)
+        os.replace(SESSIONS_FILE, migrated)
     except FileNotFoundError:
-        return []
+        return
+    with open(migrated, "r") as f:
+        sessions = json.load(f)
+    for session in sessions:
+        timestamp = datetime.fromisoformat(session["timestamp"])
+        _append_line(_segment_path(timestamp), json.dumps(session) + "\n")
+
+
+def append_session(session: dict) -> None:
+    """
+    Appends one session record to its monthly segment in O(1) and kicks off
+    background retention at most once per RETENTION_INTERVAL_SECONDS.
+    """
+    os.makedirs(SESSIONS_DIR, exist_ok=True)
+    _migrate_legacy_file()
+    timestamp = datetime.fromisoformat(session["timestamp"])
+    _append_line(_segment_path(timestamp), json.dumps(session) + "\n")
+    _schedule_retention()
+
+
+def load_sessions(since: datetime = None) -> list:
+    """
+    Returns stored session records in time order, optionally only those with
+    a timestamp after `since`. Segments older than `since` are not read.
+    """
+    sessions = []
+    for path in sorted(glob.glob(os.path.join(SESSIONS_DIR, "*.jsonl"))):
+        if since is not None and _segment_month(path) < since.replace(day=1, hour=0, minute=0, second=0, microsecond=0):
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                session = json.loads(line)
+                if since is None or datetime.fromisoformat(session["timestamp"]) > since:
+                    sessions.append(session)
+    return sessions
+
+
+def remove_old_segments(years=RETENTION_YEARS) -> int:
+    """
+    Deletes whole monthly segments that end before the retention cutoff.
+    Returns the number of segments removed.
+    """
+    cutoff = datetime.now() - timedelta(days=365 * years)
+    removed = 0
+    for path in glob.glob(os.path.join(SESSIONS_DIR, "*.jsonl")):
+        month = _segment_month(path)
+        next_month = (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+        if next_month <= cutoff:
+            os.remove(path)
+            removed += 1
+    return removed
+
+
+def _schedule_retention() -> None:
+    global _last_retention_run
+    now = time.time()
+    with _write_lock:
+        if now - _last_retention_run < RETENTION_INTERVAL_SECONDS:
+            return
+        _last_retention_run = now
+    threading.Thread(target=remove_old_segments, daemon=True).start()
 
-def save_sessions(sessions):
-    with open(SESSIONS_FILE, "w") as f:
-        json.dump(sessions, f, indent=2)
 
-def remove_old_sessions(sessions, years=5):
+def remove_old_sessions(sessions, years=RETENTION_YEARS):
     cutoff = datetime.now() - timedelta(days=365 * years)
     return [s for s in sessions if datetime.fromisoformat(s["timestamp"]) > cutoff]
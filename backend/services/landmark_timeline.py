@@ -0,0 +1,122 @@
+import os
+import numpy as np
+
+HAND_POINTS = 21
+FACE_POINTS = 468
+POSE_POINTS = 33
+
+# Bits of the per-frame "flags" field
+HAS_HAND_0 = 1
+HAS_HAND_1 = 2
+HAS_FACE = 4
+HAS_POSE = 8
+
+# Fixed per-frame schema; normalized coordinates fit comfortably in float16.
+# Timestamps stay float64: live sessions record wall-clock seconds, which
+# float32 only resolves to about two minutes.
+FRAME_DTYPE = np.dtype([
+    ("timestamp", "<f8"),
+    ("weight", "<u2"),
+    ("flags", "u1"),
+    ("hands", "<f2", (2, HAND_POINTS, 3)),
+    ("face", "<f2", (FACE_POINTS, 3)),
+    ("pose", "<f2", (POSE_POINTS, 4)),
+])
+# Timelines saved before timestamps were widened
+_FRAME_DTYPE_F4 = np.dtype([("timestamp", "<f4")] + [(name, FRAME_DTYPE.fields[name][0]) for name in FRAME_DTYPE.names[1:]])
+
+
+class LandmarkTimeline:
+    """
+    Per-frame hand, face and pose landmarks in a preallocated structured
+    array (FRAME_DTYPE). With keep=False rows go to a single scratch row,
+    so callers can classify from the same layout without retaining history.
+    """
+
+    def __init__(self, capacity: int = 1024, keep: bool = True):
+        self.keep = keep
+        self.frames = np.zeros(max(1, capacity) if keep else 0, dtype=FRAME_DTYPE)
+        self.size = 0
+        self._scratch = np.zeros(1, dtype=FRAME_DTYPE)
+
+    def _next_row(self, keep):
+        if not (self.keep and keep):
+            return self._scratch[0]
+        if self.size == len(self.frames):
+            grown = np.zeros(len(self.frames) * 2, dtype=FRAME_DTYPE)
+            grown[:self.size] = self.frames
+            self.frames = grown
+        row = self.frames[self.size]
+        self.size += 1
+        return row
+
+    def append(self, timestamp, weight, hand_results, face_results, pose_results, keep=True):
+        """
+        Copies MediaPipe results into the next row and returns it.
+        keep=False fills the scratch row instead of recording the frame.
+        """
+        row = self._next_row(keep)
+        row["timestamp"] = timestamp
+        row["weight"] = weight
+        flags = 0
+
+        for i, hand in enumerate((hand_results.multi_hand_landmarks or [])[:2]):
+            row["hands"][i] = [(p.x, p.y, p.z) for p in hand.landmark]
+            flags |= HAS_HAND_0 if i == 0 else HAS_HAND_1
+        if face_results.multi_face_landmarks:
+            row["face"] = [(p.x, p.y, p.z) for p in face_results.multi_face_landmarks[0].landmark[:FACE_POINTS]]
+            flags |= HAS_FACE
+        if pose_results.pose_landmarks:
+            row["pose"] = [(p.x, p.y, p.z, p.visibility) for p in pose_results.pose_landmarks.landmark]
+            flags |= HAS_POSE
+
+        row["flags"] = flags
+        return row
+
+    def extend(self, rows: np.ndarray) -> None:
+        """
+        Appends already-filled rows (e.g. a classified window).
+        """
+        if not self.keep:
+            return
+        needed = self.size + len(rows)
+        if needed > len(self.frames):
+            grown = np.zeros(max(needed, len(self.frames) * 2), dtype=FRAME_DTYPE)
+            grown[:self.size] = self.frames[:self.size]
+            self.frames = grown
+        self.frames[self.size:needed] = rows
+        self.size = needed
+
+    def clear(self) -> None:
+        self.size = 0
+
+    def to_array(self) -> np.ndarray:
+        return self.frames[:self.size]
+
+    def save(self, path: str) -> str:
+        """
+        Writes the recorded frames as an uncompressed .npy, which
+        load_timeline can memory-map. Returns the path.
+        """
+        np.save(path, self.to_array(), allow_pickle=False)
+        return path
+
+
+def load_timeline(path: str, mmap: bool = True) -> np.ndarray:
+    """
+    Opens a saved timeline; with mmap the frames are paged in on demand.
+    """
+    frames = np.load(path, mmap_mode="r" if mmap else None, allow_pickle=False)
+    if frames.dtype == _FRAME_DTYPE_F4:
+        return frames.astype(FRAME_DTYPE)
+    if frames.dtype != FRAME_DTYPE:
+        raise ValueError(f"Unexpected landmark timeline schema in {path}")
+    return frames
+
+
+def timeline_path(video_path: str) -> str:
+    """
+    Location of the landmark timeline stored next to a video.
+    """
+    base, _ = os.path.splitext(video_path)
+    return f"{base}.landmarks.npy"
@@ -1,15 +1,53 @@
 import os
-import openai
-import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from utils.llm_cache import LLMCache, make_cache_key
+from utils.prompt_builder import PromptBuilder, count_tokens
+from utils.llm_client import chat_completion, stream_chat_completion
+from utils.structured_output import parse_structured
 
-# Configure API key
-openai.api_key = os.getenv("OPENAI_API_KEY")
+logger = logging.getLogger(__name__)
+
+# Cache for generated question sets, shared across requests and workers
+QUESTION_CACHE = LLMCache()
+
+# Session-level evaluation settings
+EVAL_CONCURRENCY = int(os.getenv("EVAL_CONCURRENCY", "5"))
+EVAL_PACK_TOKEN_BUDGET = int(os.getenv("EVAL_PACK_TOKEN_BUDGET", "2000"))
+# Expected reply shapes; near-misses are repaired or coerced (see utils.structured_output)
+QUESTIONS_SCHEMA = {"type": "array", "items": {"type": "string"}, "minItems": 1}
+EVALUATION_SCHEMA = {
+    "type": "object",
+    "required": ["score", "strengths", "improvements", "summary"],
+    "properties": {
+        "score": {"type": "integer", "minimum": 1, "maximum": 10},
+        "strengths": {"type": "array", "items": {"type": "string"}},
+        "improvements": {"type": "array", "items": {"type": "string"}},
+        "summary": {"type": "string"},
+    },
+}
+# Prompt tokens for a single-answer evaluation; long answers are shortened to fit
+EVAL_PROMPT_TOKEN_BUDGET = int(os.getenv("EVAL_PROMPT_TOKEN_BUDGET", "1500"))
+
+def _fixup(max_tokens: int):
+    """
+    Returns the callable parse_structured uses to send a fix-up prompt:
+    a short follow-up asking the model to correct its reply, in place of
+    regenerating it.
+    """
+    return lambda prompt: chat_completion(
+        model="gpt-3.5-turbo",
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0,
+        max_tokens=max_tokens
+    )
 
 def generate_interview_questions(
     job_description: str = "",
     resume_text: str = "",
     prompt_type: str = "technical",
-    num_questions: int = 5
+    num_questions: int = 5,
+    persona: str = ""
 ) -> list:
     """
     Generate a list of interview questions based on type:
@@ -17,12 +55,15 @@ def generate_interview_questions(
       - behavioral: draws on the job_description for culture/fit
       - resume: draws on the candidate's resume_text
 
+    persona, if given, is appended to the system message to set the
+    interviewer's tone and difficulty.
+
     Returns:
         list: A list of question strings.
 
     Raises:
         ValueError: If prompt_type is invalid.
-        Exception: On API errors or JSON parsing failures.
+        Exception: On API errors or replies that cannot be parsed or repaired.
     """
     prompt_type = prompt_type.lower()
     if prompt_type == "technical":
@@ -50,32 +91,73 @@ def generate_interview_questions(
     )
 
     try:
-        response = openai.ChatCompletion.create(
+        content = chat_completion(
             model="gpt-3.5-turbo",
             messages=[
-                {"role": "system", "content": f"You are an {role}."},
+                {"role": "system", "content": f"You are an {role}. {persona}".strip()},
                 {"role": "user", "content": prompt}
             ],
             temperature=0.7,
             max_tokens=200
         )
-
-        content = response.choices[0].message.content.strip()
-        questions = json.loads(content)
-        if not isinstance(questions, list):
-            raise ValueError("Expected a JSON array of questions.")
-        return questions
+        return parse_structured(content, QUESTIONS_SCHEMA, fixup=_fixup(200))
 
     except Exception as e:
         raise Exception(f"Error generating interview questions ({prompt_type}): {e}")
 
-def evaluate_answer(answer_text: str, question_text: str) -> dict:
+def generate_questions(
+    job_description: str = "",
+    resume: str = "",
+    prompt_type: str = "technical",
+    persona: str = "",
+    num_questions: int = 5,
+    bypass_cache: bool = False
+) -> list:
+    """
+    Cached front for generate_interview_questions.
+
+    The cache key is a hash of the normalized inputs, so repeated requests
+    for the same JD/resume, persona and type are served without an LLM call.
+    Only the inputs that shape the prompt are part of the key.
+
+    Parameters:
+        bypass_cache (bool): Always call the LLM and refresh the cached entry.
+
+    Returns:
+        list: A list of question strings.
+    """
+    prompt_type = prompt_type.lower()
+    key = make_cache_key(
+        "interview_questions",
+        job_description=job_description if prompt_type != "resume" else "",
+        resume=resume if prompt_type == "resume" else "",
+        prompt_type=prompt_type,
+        persona=persona,
+        num_questions=num_questions
+    )
+    return QUESTION_CACHE.get_or_compute(
+        key,
+        lambda: generate_interview_questions(
+            job_description=job_description,
+            resume_text=resume,
+            prompt_type=prompt_type,
+            num_questions=num_questions,
+            persona=persona
+        ),
+        bypass=bypass_cache
+    )
+
+def evaluate_answer(answer_text: str, question_text: str, usage: dict = None, on_token=None) -> dict:
     """
     Evaluate a candidate's answer to a specific question.
 
     Parameters:
         answer_text (str): Transcribed answer text.
         question_text (str): The interview question.
+        usage (dict): If given, updated with the prompt token report
+            (see utils.prompt_builder.PromptBuilder.build).
+        on_token (callable): If given, the response is streamed and each
+            piece of the raw JSON text is passed to it as it arrives.
 
     Returns:
         dict: Evaluation including score, strengths, improvements, and summary.
@@ -83,34 +165,153 @@ def evaluate_answer(answer_text: str, question_text: str) -> dict:
     Raises:
         Exception: On API errors or parsing failures.
     """
-    # Construct evaluative prompt that asks for JSON output
+    # Construct evaluative prompt that asks for JSON output; the answer is
+    # shortened if the prompt would exceed EVAL_PROMPT_TOKEN_BUDGET
+    prompt, report = (
+        PromptBuilder(EVAL_PROMPT_TOKEN_BUDGET)
+        .add(
+            f"Evaluate the following interview answer. Respond with valid JSON containing the keys:\n"
+            f"- score (integer 1-10),\n"
+            f"- strengths (list of strings),\n"
+            f"- improvements (list of strings),\n"
+            f"- summary (string)\n\n"
+            f"Question: {question_text}\n"
+        )
+        .add_text(answer_text, prefix="Answer: ")
+        .build()
+    )
+    logger.info(f"Evaluation prompt tokens: {report}")
+    if usage is not None:
+        usage.update(report)
+    messages = [
+        {"role": "system", "content": "You are an expert interview coach and evaluator."},
+        {"role": "user", "content": prompt}
+    ]
+    try:
+        if on_token is None:
+            content = chat_completion(model="gpt-3.5-turbo", messages=messages, temperature=0.7, max_tokens=300)
+        else:
+            pieces = []
+            for piece in stream_chat_completion(model="gpt-3.5-turbo", messages=messages,
+                                                temperature=0.7, max_tokens=300):
+                pieces.append(piece)
+                on_token(piece)
+            content = "".join(pieces)
+        return parse_structured(content, EVALUATION_SCHEMA, fixup=_fixup(300))
+
+    except Exception as e:
+        raise Exception(f"Error evaluating answer: {e}")
+
+
+def _pack_items(items: list, token_budget: int) -> list:
+    """
+    Groups consecutive (index, question, answer) items so that each group's
+    question and answer text stays within token_budget.
+    """
+    packs, current, used = [], [], 0
+    for item in items:
+        cost = count_tokens(item[1]) + count_tokens(item[2])
+        if current and used + cost > token_budget:
+            packs.append(current)
+            current, used = [], 0
+        current.append(item)
+        used += cost
+    if current:
+        packs.append(current)
+    return packs
+
+
+def evaluate_answers_packed(pairs: list) -> list:
+    """
+    Evaluate several (question_text, answer_text) pairs in a single request.
+
+    Returns:
+        list: One evaluation dict per pair, in input order.
+
+    Raises:
+        Exception: On API errors or a reply that cannot be parsed or repaired
+            into one evaluation per pair.
+    """
+    blocks = "\n\n".join(
+        f"[{i + 1}]\nQuestion: {question}\nAnswer: {answer}"
+        for i, (question, answer) in enumerate(pairs)
+    )
     prompt = (
-        f"Evaluate the following interview answer. Respond with valid JSON containing the keys:\n"
+        f"Evaluate each of the following {len(pairs)} interview answers. Respond with a valid JSON array "
+        f"with one object per answer, in the same order, each containing the keys:\n"
         f"- score (integer 1-10),\n"
         f"- strengths (list of strings),\n"
         f"- improvements (list of strings),\n"
         f"- summary (string)\n\n"
-        f"Question: {question_text}\n"
-        f"Answer: {answer_text}\n"
+        f"{blocks}\n"
     )
     try:
-        response = openai.ChatCompletion.create(
+        content = chat_completion(
             model="gpt-3.5-turbo",
             messages=[
                 {"role": "system", "content": "You are an expert interview coach and evaluator."},
                 {"role": "user", "content": prompt}
             ],
             temperature=0.7,
-            max_tokens=300
+            max_tokens=300 * len(pairs)
         )
-        content = response.choices[0].message.content.strip()
-        # Parse JSON
-        evaluation = json.loads(content)
-        # Basic validation
-        required_keys = {"score", "strengths", "improvements", "summary"}
-        if not required_keys.issubset(evaluation.keys()):
-            raise ValueError("Missing keys in evaluation JSON.")
-        return evaluation
+        schema = {"type": "array", "items": EVALUATION_SCHEMA, "minItems": len(pairs), "maxItems": len(pairs)}
+        return parse_structured(content, schema, fixup=_fixup(300 * len(pairs)))
 
     except Exception as e:
-        raise Exception(f"Error evaluating answer: {e}")
+        raise Exception(f"Error evaluating answers: {e}")
+
+
+def evaluate_session(
+    qa_pairs: list,
+    max_concurrency: int = EVAL_CONCURRENCY,
+    pack: bool = False,
+    token_budget: int = EVAL_PACK_TOKEN_BUDGET
+) -> list:
+    """
+    Evaluate all answers of an interview concurrently.
+
+    Parameters:
+        qa_pairs (list): (question_text, answer_text) tuples in question order.
+            Pairs with an empty answer are reported as errors without an LLM call.
+        max_concurrency (int): Maximum number of LLM requests in flight.
+        pack (bool): Group several pairs per request while they fit token_budget.
+            A pack whose reply cannot be parsed falls back to one call per pair.
+        token_budget (int): Estimated prompt tokens of Q/A text per packed request.
+
+    Returns:
+        list: One dict per pair, in question order, with "question_number" and
+        either "evaluation" or "error".
+    """
+    results = [None] * len(qa_pairs)
+    items = []
+    for i, (question, answer) in enumerate(qa_pairs):
+        if not answer:
+            results[i] = {"question_number": i + 1, "error": "No answer recorded"}
+        else:
+            items.append((i, question, answer))
+
+    def run_single(item):
+        i, question, answer = item
+        try:
+            results[i] = {"question_number": i + 1, "evaluation": evaluate_answer(answer, question)}
+        except Exception as e:
+            results[i] = {"question_number": i + 1, "error": str(e)}
+
+    def run_pack(group):
+        if len(group) == 1:
+            return run_single(group[0])
+        try:
+            evaluations = evaluate_answers_packed([(q, a) for _, q, a in group])
+        except Exception:
+            for item in group:
+                run_single(item)
+            return
+        for (i, _, _), evaluation in zip(group, evaluations):
+            results[i] = {"question_number": i + 1, "evaluation": evaluation}
+
+    groups = _pack_items(items, token_budget) if pack else [[item] for item in items]
+    if groups:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(groups)))) as pool:
+            list(pool.map(run_pack, groups))
+    return results
@@ -1,15 +1,23 @@
 import os
+import json
 import uuid
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, url_for
 from services.resume_parser import extract_resume_text
-from services.llm_integration import generate_questions, evaluate_answer
-from services.video_processor import process_video_answer
+from services.llm_integration import generate_questions, evaluate_answer, evaluate_session, QUESTION_CACHE
+from services.video_processor import process_video_answer, load_answer_transcript, save_answer_feedback, transcribe_segment
+from services.chunked_upload import ChunkedUploadStore
+from services.session_store import get_session_store
+from services.question_prefetcher import QuestionPrefetcher
+from utils.prompt_loader import PROMPTS
+from utils.llm_client import client_stats
+from utils.structured_output import structured_output_stats
+from services.job_queue import JobQueue, STATUS_SUCCEEDED, STATUS_FAILED
 
 # Blueprint for all routes
 main_bp = Blueprint("main", __name__)
 
-# Session context
-SESSIONS = {}
+# Session context, shared across worker processes (see SESSION_STORE_URL)
+SESSIONS = get_session_store()
 
 UPLOAD_FOLDER = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "static", "uploads"))
 TEMP_VIDEO_FOLDER = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "static", "temp_videos"))
@@ -17,14 +25,60 @@ TEMP_VIDEO_FOLDER = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(TEMP_VIDEO_FOLDER, exist_ok=True)
 
-# Helper function: load difficulty persona text
+# Job event streams end after this long; clients reconnect with Last-Event-ID
+SSE_TIMEOUT = float(os.getenv("SSE_TIMEOUT", "600"))
+SSE_KEEPALIVE = float(os.getenv("SSE_KEEPALIVE", "15"))
+
+
+# Chunked answer uploads, transcribed incrementally while recording
+UPLOADS = ChunkedUploadStore(transcribe=transcribe_segment)
+
+
+# Background jobs: answer videos are processed off the request thread
+def run_video_answer_job(payload, progress):
+    transcription = None
+    if payload.get("upload_id"):
+        live = UPLOADS.finish_transcript(payload["upload_id"])
+        transcription = live["text"] if live else None
+    return process_video_answer(
+        video_path=payload["video_path"],
+        question_text=payload["question_text"],
+        interview_id=payload["interview_id"],
+        question_number=payload["question_number"],
+        progress=progress,
+        transcription=transcription
+    )
+
+JOBS = JobQueue()
+JOBS.register("video_answer", run_video_answer_job)
+JOBS.recover()
+
+# Helper function: load difficulty persona text (parsed once, reloaded on change)
 def load_persona(level):
-    level = level.lower()
-    mode_file = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "static", "Modes", f"{level.capitalize()}.txt"))
-    if not os.path.exists(mode_file):
-        raise FileNotFoundError(f"Persona mode file not found: {mode_file}")
-    with open(mode_file, "r", encoding="utf-8") as f:
-        return f.read().strip()
+    return PROMPTS.get_persona(level)
+
+# Helper function: URLs of a job's routes, as actually mounted by the app
+def job_urls(job_id):
+    return {
+        "status_url": url_for("main.job_status", job_id=job_id),
+        "events_url": url_for("main.job_events", job_id=job_id),
+        "result_url": url_for("main.job_result", job_id=job_id)
+    }
+
+# Helper function: a 1-based question number of the session, or None if invalid
+def parse_question_number(value, session):
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        return None
+    return number if 1 <= number <= len(session.get("questions") or []) else None
+
+# Question sets generated in the background once a resume or job description arrives
+QUESTIONS_PER_SET = 5
+PREFETCH = QuestionPrefetcher(
+    generate=lambda **inputs: generate_questions(num_questions=QUESTIONS_PER_SET, **inputs),
+    persona_for=load_persona
+)
 
 
 # === 1. Upload Resume ===
@@ -41,14 +95,15 @@ def upload_resume():
     resume_text = extract_resume_text(file)
 
     # Save session state
-    SESSIONS[session_id] = {
+    SESSIONS.create(session_id, {
         "resume_text": resume_text,
         "job_description": None,
         "questions": [],
         "current_question_index": 0,
         "persona": None,
         "question_type": None,
-    }
+    })
+    PREFETCH.schedule(session_id, resume_text=resume_text)
 
     return jsonify({"message": "Resume uploaded successfully", "session_id": session_id}), 200
 
@@ -63,10 +118,10 @@ def upload_job_description():
     if not session_id or not job_description:
         return jsonify({"error": "Session ID and job description are required"}), 400
 
-    if session_id not in SESSIONS:
+    if not SESSIONS.update(session_id, job_description=job_description):
         return jsonify({"error": "Invalid session ID"}), 400
-
-    SESSIONS[session_id]["job_description"] = job_description
+    session = SESSIONS.get(session_id)
+    PREFETCH.schedule(session_id, resume_text=session["resume_text"], job_description=job_description)
 
     return jsonify({"message": "Job description saved successfully"}), 200
 
@@ -86,23 +141,37 @@ def generate_interview_questions():
     if not session:
         return jsonify({"error": "Invalid session ID"}), 400
 
-    persona_text = load_persona(level)
+    try:
+        persona_text = load_persona(level)
+    except FileNotFoundError:
+        return jsonify({"error": f"Invalid level; expected one of: {', '.join(PROMPTS.persona_levels())}"}), 400
     resume_text = session["resume_text"]
     job_description = session["job_description"]
 
-    # Generate questions
-    questions = generate_questions(
-        job_description=job_description,
-        resume=resume_text,
-        prompt_type=question_type,
-        persona=level.lower(),
-        num_questions=5
-    )
+    # Use the set prefetched after upload (waiting if it is still being
+    # generated); otherwise generate it now
+    bypass_cache = bool(data.get("bypass_cache", False))
+    questions = None
+    if not bypass_cache:
+        questions = PREFETCH.get(session_id, level, question_type,
+                                 resume_text=resume_text, job_description=job_description)
+    if questions is None:
+        questions = generate_questions(
+            job_description=job_description,
+            resume=resume_text,
+            prompt_type=question_type,
+            persona=persona_text,
+            num_questions=QUESTIONS_PER_SET,
+            bypass_cache=bypass_cache
+        )
 
     # Update session
-    session["questions"] = questions
-    session["persona"] = level.lower()
-    session["question_type"] = question_type
+    SESSIONS.update(
+        session_id,
+        questions=questions,
+        persona=level.lower(),
+        question_type=question_type
+    )
 
     return jsonify({
         "message": "Questions generated successfully",
@@ -110,24 +179,46 @@ def generate_interview_questions():
         "first_question": questions[0] if questions else None
     }), 200
 
+# === Question Cache Stats ===
+@main_bp.route('/api/cache_stats', methods=['GET'])
+def cache_stats():
+    return jsonify(QUESTION_CACHE.stats()), 200
+
+# === Question Prefetch Stats ===
+@main_bp.route('/api/prefetch_stats', methods=['GET'])
+def prefetch_stats():
+    """
+    Background question generation counters: sets scheduled, served ready or
+    in flight, misses, stale or failed sets, and prefetches skipped by the
+    per-session budget or the queue limit.
+    """
+    return jsonify(PREFETCH.stats()), 200
+
+# === LLM Client Stats ===
+@main_bp.route('/api/llm_stats', methods=['GET'])
+def llm_stats():
+    """
+    Per-provider LLM client counters (calls, retries, failures, in-flight)
+    and circuit breaker state, plus how JSON replies were parsed (directly,
+    repaired, via a fix-up prompt or not at all).
+    """
+    return jsonify(dict(client_stats(), structured_output=structured_output_stats())), 200
+
 # === 4. Get Next Question ===
 @main_bp.route('/api/next_question', methods=['POST'])
 def next_question():
     data = request.json
     session_id = data.get("session_id")
 
-    session = SESSIONS.get(session_id)
-    if not session:
+    # Claim the next index atomically so concurrent requests never share a question
+    index = SESSIONS.advance_question(session_id)
+    if index is None:
         return jsonify({"error": "Invalid session ID"}), 400
 
-    index = session["current_question_index"]
-    questions = session["questions"]
-
-    if index >= len(questions):
+    if index < 0:
         return jsonify({"finished": True, "message": "All questions completed!"}), 200
 
-    question = questions[index]
-    session["current_question_index"] += 1
+    question = SESSIONS.get(session_id)["questions"][index]
 
     return jsonify({
         "finished": False,
@@ -154,14 +245,190 @@ def submit_answer():
 
     question_text = session["questions"][question_number - 1]
 
-    result = process_video_answer(
-        video_path=temp_video_path,
-        question_text=question_text,
-        interview_id=session_id,
-        question_number=question_number
+    job_id = JOBS.enqueue("video_answer", {
+        "video_path": temp_video_path,
+        "question_text": question_text,
+        "interview_id": session_id,
+        "question_number": question_number
+    })
+
+    return jsonify({
+        "message": "Answer accepted for processing",
+        "job_id": job_id,
+        **job_urls(job_id)
+    }), 202
+
+# === 5b. Chunked Answer Upload (init / append / finalize) ===
+@main_bp.route('/api/answer_uploads', methods=['POST'])
+def init_answer_upload():
+    data = request.json or request.form
+    session_id = data.get("session_id")
+
+    session = SESSIONS.get(session_id)
+    if not session:
+        return jsonify({"error": "Invalid session ID"}), 400
+    question_number = parse_question_number(data.get("question_number"), session)
+    if question_number is None:
+        return jsonify({"error": "Invalid question number"}), 400
+
+    upload_id = UPLOADS.init({"session_id": session_id, "question_number": question_number})
+    return jsonify({
+        "upload_id": upload_id,
+        "chunk_url": url_for("main.answer_upload_status", upload_id=upload_id) + "/chunks/<index>",
+        "finalize_url": url_for("main.finalize_answer_upload", upload_id=upload_id)
+    }), 201
+
+@main_bp.route('/api/answer_uploads/<upload_id>', methods=['GET'])
+def answer_upload_status(upload_id):
+    state = UPLOADS.status(upload_id)
+    if not state:
+        return jsonify({"error": "Invalid upload ID"}), 404
+    return jsonify(state), 200
+
+@main_bp.route('/api/answer_uploads/<upload_id>/chunks/<int:index>', methods=['PUT', 'POST'])
+def append_answer_chunk(upload_id, index):
+    chunk = request.files['chunk'].read() if 'chunk' in request.files else request.get_data()
+    try:
+        state = UPLOADS.append(upload_id, index, chunk)
+    except ValueError as e:
+        return jsonify({"error": str(e), "next_index": UPLOADS.status(upload_id)["next_index"]}), 409
+    if not state:
+        return jsonify({"error": "Invalid upload ID"}), 404
+    return jsonify({"next_index": state["next_index"], "bytes": state["bytes"]}), 200
+
+@main_bp.route('/api/answer_uploads/<upload_id>/finalize', methods=['POST'])
+def finalize_answer_upload(upload_id):
+    state = UPLOADS.status(upload_id)
+    if not state:
+        return jsonify({"error": "Invalid upload ID"}), 404
+    session_id = state["meta"]["session_id"]
+    session = SESSIONS.get(session_id)
+    if not session:
+        return jsonify({"error": "Invalid session ID"}), 400
+    # Checked before the upload is finalized, so a rejected call changes nothing
+    question_number = parse_question_number(state["meta"]["question_number"], session)
+    if question_number is None:
+        return jsonify({"error": "Invalid question number"}), 400
+
+    def start_job(recording_path, state):
+        return JOBS.enqueue("video_answer", {
+            "video_path": recording_path,
+            "question_text": session["questions"][question_number - 1],
+            "interview_id": session_id,
+            "question_number": question_number,
+            "upload_id": upload_id
+        })
+
+    # A retried or concurrent finalize returns the job already processing the answer
+    _, state = UPLOADS.finalize(upload_id, start_job=start_job)
+    job_id = state["job_id"]
+
+    return jsonify({
+        "message": "Answer accepted for processing",
+        "job_id": job_id,
+        **job_urls(job_id)
+    }), 202
+
+# === 6. Job Status / Result ===
+@main_bp.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = JOBS.get(job_id)
+    if not job:
+        return jsonify({"error": "Invalid job ID"}), 404
+
+    job.pop("result")
+    return jsonify(job), 200
+
+@main_bp.route('/api/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    job = JOBS.get(job_id)
+    if not job:
+        return jsonify({"error": "Invalid job ID"}), 404
+
+    if job["status"] == STATUS_FAILED:
+        return jsonify({"job_id": job_id, "status": job["status"], "error": job["error"]}), 500
+    if job["status"] != STATUS_SUCCEEDED:
+        return jsonify({"job_id": job_id, "status": job["status"], "stage": job["stage"]}), 202
+
+    return jsonify(job["result"]), 200
+
+def _sse(event: str, data, event_id: str = None) -> str:
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+@main_bp.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """
+    Streams a job as Server-Sent Events:
+      stage  - {"stage", "at", ...} per completed stage; "transcribed" carries the transcript
+      token  - {"text"} evaluation output as the LLM streams it
+      result - the job result, after which the stream ends
+      error  - {"error"} if the job failed
+    Event IDs are "<stages sent>:<partial characters sent>", so a client
+    reconnecting with Last-Event-ID only receives what it missed.
+    """
+    if not JOBS.get(job_id):
+        return jsonify({"error": "Invalid job ID"}), 404
+
+    try:
+        stages_sent, partial_sent = (int(n) for n in request.headers.get("Last-Event-ID", "0:0").split(":"))
+    except ValueError:
+        stages_sent, partial_sent = 0, 0
+
+    def generate():
+        nonlocal stages_sent, partial_sent
+        for job in JOBS.watch(job_id, timeout=SSE_TIMEOUT, keepalive=SSE_KEEPALIVE):
+            if job is None:
+                yield ": keep-alive\n\n"
+                continue
+            for stage in job["stages"][stages_sent:]:
+                stages_sent += 1
+                yield _sse("stage", stage, f"{stages_sent}:{partial_sent}")
+            partial = job["partial"] or ""
+            if len(partial) > partial_sent:
+                text, partial_sent = partial[partial_sent:], len(partial)
+                yield _sse("token", {"text": text}, f"{stages_sent}:{partial_sent}")
+            if job["status"] == STATUS_SUCCEEDED:
+                yield _sse("result", job["result"])
+            elif job["status"] == STATUS_FAILED:
+                yield _sse("error", {"error": job["error"]})
+
+    return Response(generate(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# === 7. Evaluate / Re-score Whole Session ===
+@main_bp.route('/api/evaluate_session', methods=['POST'])
+def evaluate_whole_session():
+    data = request.json
+    session_id = data.get("session_id")
+    session = SESSIONS.get(session_id)
+    if not session:
+        return jsonify({"error": "Invalid session ID"}), 400
+
+    questions = session["questions"]
+    qa_pairs = [
+        (question, load_answer_transcript(session_id, number))
+        for number, question in enumerate(questions, start=1)
+    ]
+
+    results = evaluate_session(
+        qa_pairs,
+        max_concurrency=int(data.get("max_concurrency", 5)),
+        pack=bool(data.get("pack", False))
     )
 
-    return jsonify(result), 200
+    for result in results:
+        if "evaluation" in result:
+            save_answer_feedback(session_id, result["question_number"], result["evaluation"])
+
+    return jsonify({
+        "session_id": session_id,
+        "evaluated": sum(1 for r in results if "evaluation" in r),
+        "results": results
+    }), 200
 
 # === Optional: Summary or Final Endpoint Later ===
 @main_bp.route('/api/session_summary', methods=['POST'])
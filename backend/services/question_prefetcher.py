@@ -0,0 +1,182 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "1") == "1"
+# Combinations to prefetch, most likely first: every type of the first level, then the next level
+PREFETCH_LEVELS = [l.strip().lower() for l in os.getenv("PREFETCH_LEVELS", "medium").split(",") if l.strip()]
+PREFETCH_TYPES = [t.strip().lower() for t in os.getenv("PREFETCH_TYPES", "technical,behavioral,resume").split(",") if t.strip()]
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "2"))
+# Speculative generations one session may start (foreground requests are not counted)
+PREFETCH_PER_SESSION = int(os.getenv("PREFETCH_PER_SESSION", "4"))
+# Generations waiting for a worker across all sessions; beyond this, prefetching is skipped
+PREFETCH_MAX_QUEUED = int(os.getenv("PREFETCH_MAX_QUEUED", "20"))
+# Sessions whose prefetched sets are kept, least recently used dropped first
+PREFETCH_MAX_SESSIONS = int(os.getenv("PREFETCH_MAX_SESSIONS", "200"))
+PREFETCH_TTL = int(os.getenv("PREFETCH_TTL", "3600"))
+# How long a foreground request waits on an in-flight generation before generating itself
+PREFETCH_WAIT_SECONDS = float(os.getenv("PREFETCH_WAIT_SECONDS", "60"))
+
+
+def _fingerprint(*parts) -> str:
+    return hashlib.sha256("\x00".join(p or "" for p in parts).encode("utf-8")).hexdigest()
+
+
+class QuestionPrefetcher:
+    """
+    Speculatively generates question sets for a session as soon as its
+    resume or job description arrives, so the foreground request usually
+    finds its set ready or already being generated.
+
+    generate(job_description, resume, prompt_type, persona) produces a set
+    and persona_for(level) returns a level's persona text. Each session
+    keeps one Future per (level, question_type), tagged with a fingerprint
+    of the inputs it was generated from; get() waits on a matching
+    in-flight Future instead of starting a duplicate call, and ignores sets
+    made from inputs that have since changed.
+    """
+
+    def __init__(self, generate, persona_for, levels: list = PREFETCH_LEVELS, types: list = PREFETCH_TYPES,
+                 workers: int = PREFETCH_WORKERS, per_session: int = PREFETCH_PER_SESSION,
+                 max_queued: int = PREFETCH_MAX_QUEUED, max_sessions: int = PREFETCH_MAX_SESSIONS,
+                 ttl: int = PREFETCH_TTL, enabled: bool = PREFETCH_ENABLED):
+        self.generate = generate
+        self.persona_for = persona_for
+        self.levels = levels
+        self.types = types
+        self.per_session = per_session
+        self.max_queued = max_queued
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.enabled = enabled
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="question-prefetch")
+        self.sessions = OrderedDict()
+        self.queued = 0
+        self.lock = threading.Lock()
+        self._stats = {"scheduled": 0, "ready_hits": 0, "inflight_hits": 0, "misses": 0,
+                       "stale": 0, "failed": 0, "skipped_budget": 0, "skipped_queue": 0}
+
+    def _inputs(self, question_type: str, level: str, resume_text: str, job_description: str):
+        # Resume questions only read the resume; the others only the job description
+        text = resume_text if question_type == "resume" else job_description
+        if not text:
+            return None
+        persona = self.persona_for(level)
+        return text, persona, _fingerprint(question_type, level, text, persona)
+
+    def _session(self, session_id: str) -> dict:
+        # Caller holds self.lock
+        now = time.time()
+        for expired in [sid for sid, s in self.sessions.items() if now - s["touched"] > self.ttl]:
+            self._drop(expired)
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = self.sessions[session_id] = {"started": 0, "entries": {}, "touched": now}
+            while len(self.sessions) > self.max_sessions:
+                self._drop(next(iter(self.sessions)))
+        session["touched"] = now
+        self.sessions.move_to_end(session_id)
+        return session
+
+    def _drop(self, session_id: str) -> None:
+        # Caller holds self.lock; a cancelled future never reaches _run to leave the queue
+        for _, future in self.sessions.pop(session_id)["entries"].values():
+            if future.cancel():
+                self.queued -= 1
+
+    def _run(self, question_type: str, level: str, text: str, persona: str) -> list:
+        with self.lock:
+            self.queued -= 1
+        try:
+            return self.generate(
+                job_description=text if question_type != "resume" else "",
+                resume=text if question_type == "resume" else "",
+                prompt_type=question_type,
+                persona=persona
+            )
+        except Exception as e:
+            with self.lock:
+                self._stats["failed"] += 1
+            logger.warning(f"Prefetch of {level}/{question_type} questions failed: {e}")
+            raise
+
+    def schedule(self, session_id: str, resume_text: str = None, job_description: str = None) -> int:
+        """
+        Starts background generation of the likely (level, question_type)
+        sets that the given inputs allow, within the session's budget and
+        the global queue limit. Returns the number of generations started.
+        """
+        if not self.enabled:
+            return 0
+        started = 0
+        with self.lock:
+            session = self._session(session_id)
+            for level in self.levels:
+                for question_type in self.types:
+                    try:
+                        inputs = self._inputs(question_type, level, resume_text, job_description)
+                    except FileNotFoundError:
+                        continue
+                    if inputs is None:
+                        continue
+                    text, persona, fingerprint = inputs
+                    entry = session["entries"].get((level, question_type))
+                    if entry is not None and entry[0] == fingerprint:
+                        continue
+                    if session["started"] >= self.per_session:
+                        self._stats["skipped_budget"] += 1
+                        return started
+                    if self.queued >= self.max_queued:
+                        self._stats["skipped_queue"] += 1
+                        return started
+                    future = self.pool.submit(self._run, question_type, level, text, persona)
+                    self.queued += 1
+                    session["entries"][(level, question_type)] = (fingerprint, future)
+                    session["started"] += 1
+                    self._stats["scheduled"] += 1
+                    started += 1
+        return started
+
+    def get(self, session_id: str, level: str, question_type: str, resume_text: str = None,
+            job_description: str = None, timeout: float = PREFETCH_WAIT_SECONDS):
+        """
+        Returns the prefetched set for (level, question_type), waiting for it
+        if it is still being generated, or None if there is none for the
+        current inputs (or it failed), in which case the caller generates.
+        """
+        level, question_type = level.lower(), question_type.lower()
+        with self.lock:
+            session = self.sessions.get(session_id)
+            entry = session["entries"].get((level, question_type)) if session else None
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+        inputs = self._inputs(question_type, level, resume_text, job_description)
+        fingerprint, future = entry
+        if inputs is None or inputs[2] != fingerprint:
+            with self.lock:
+                self._stats["stale"] += 1
+            return None
+
+        with self.lock:
+            self._stats["ready_hits" if future.done() else "inflight_hits"] += 1
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            logger.warning(f"Prefetch of {level}/{question_type} questions still running after {timeout:.0f}s")
+            return None
+        except Exception:
+            # Cancelled or failed; the caller generates in the foreground
+            return None
+
+    def stats(self) -> dict:
+        with self.lock:
+            stats = dict(self._stats)
+            stats.update(sessions=len(self.sessions), queued=self.queued)
+        return stats
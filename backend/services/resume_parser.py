@@ -1,22 +1,66 @@
+import io
 import os
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 from PyPDF2 import PdfReader
+from utils.llm_cache import LLMCache
+
+RESUME_CACHE_DB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "static", "cache", "resume_cache.db"))
+# Documents with fewer pages are extracted inline; pool start-up would dominate
+PARALLEL_MIN_PAGES = int(os.getenv("RESUME_PARALLEL_MIN_PAGES", "4"))
+RESUME_WORKERS = int(os.getenv("RESUME_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Extracted text keyed by the PDF's content hash
+RESUME_CACHE = LLMCache(db_path=RESUME_CACHE_DB_PATH, ttl=30 * 24 * 3600)
+
+_pool = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=RESUME_WORKERS)
+    return _pool
+
+
+def _extract_page_range(pdf_bytes: bytes, start: int, end: int) -> list:
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+def _extract_pages(pdf_bytes: bytes) -> list:
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+    page_count = len(reader.pages)
+    if page_count < PARALLEL_MIN_PAGES or RESUME_WORKERS < 2:
+        return [page.extract_text() or "" for page in reader.pages]
+
+    # One contiguous page range per worker, so each parses the PDF once
+    chunk = -(-page_count // RESUME_WORKERS)
+    ranges = [(start, min(start + chunk, page_count)) for start in range(0, page_count, chunk)]
+    pool = _get_pool()
+    futures = [pool.submit(_extract_page_range, pdf_bytes, start, end) for start, end in ranges]
+    return [text for future in futures for text in future.result()]
+
 
 def extract_resume_text(pdf_file_stream) -> str:
     """
     Extracts text from a PDF file stream (from request.files['file']).
 
+    Pages of longer documents are extracted in a process pool, and results
+    are cached by the SHA-256 of the PDF bytes, so re-uploading the same
+    resume returns immediately.
+
     Args:
         pdf_file_stream: FileStorage object from Flask (request.files)
 
     Returns:
         str: Extracted text from all PDF pages
     """
-    reader = PdfReader(pdf_file_stream)
-    text = ""
+    pdf_bytes = pdf_file_stream.read()
+    key = hashlib.sha256(pdf_bytes).hexdigest()
 
-    for page in reader.pages:
-        page_text = page.extract_text()
-        if page_text:
-            text += page_text + "\n"
+    def extract():
+        pages = _extract_pages(pdf_bytes)
+        return "\n".join(text for text in pages if text).strip()
 
-    return text.strip()
+    return RESUME_CACHE.get_or_compute(key, extract)
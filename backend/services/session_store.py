@@ -0,0 +1,246 @@
+import os
+import json
+import time
+import sqlite3
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# SESSION_STORE_URL selects the backend: redis://... or a SQLite file path
+SESSION_STORE_URL = os.getenv(
+    "SESSION_STORE_URL",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "static", "sessions.db"))
+)
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL", str(24 * 3600)))
+
+
+class SQLiteSessionStore:
+    """
+    Interview sessions in a SQLite database in WAL mode, shared by every
+    worker process on the host. Sessions expire `ttl` seconds after their
+    last access.
+    """
+
+    def __init__(self, db_path: str, ttl: int = SESSION_TTL_SECONDS):
+        self.db_path = db_path
+        self.ttl = ttl
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS sessions (
+                    id TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    current_question_index INTEGER NOT NULL DEFAULT 0,
+                    expires_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def create(self, session_id: str, data: dict) -> None:
+        data = dict(data)
+        index = data.pop("current_question_index", 0)
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM sessions WHERE expires_at < ?", (now,))
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (id, data, current_question_index, expires_at) VALUES (?, ?, ?, ?)",
+                (session_id, json.dumps(data), index, now + self.ttl)
+            )
+        finally:
+            conn.close()
+
+    def get(self, session_id: str):
+        """
+        Returns the session dict, or None if it does not exist or has expired.
+        """
+        if not session_id:
+            return None
+        now = time.time()
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT data, current_question_index FROM sessions WHERE id = ? AND expires_at >= ?",
+                (session_id, now)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE sessions SET expires_at = ? WHERE id = ?", (now + self.ttl, session_id))
+        finally:
+            conn.close()
+        session = json.loads(row[0])
+        session["current_question_index"] = row[1]
+        return session
+
+    def update(self, session_id: str, **fields) -> bool:
+        """
+        Atomically merges fields into the session. Returns False if the
+        session does not exist.
+        """
+        if not session_id:
+            return False
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT data FROM sessions WHERE id = ? AND expires_at >= ?", (session_id, now)
+            ).fetchone()
+            if row is None:
+                conn.execute("ROLLBACK")
+                return False
+            data = json.loads(row[0])
+            index = fields.pop("current_question_index", None)
+            data.update(fields)
+            conn.execute(
+                "UPDATE sessions SET data = ?, expires_at = ?, "
+                "current_question_index = COALESCE(?, current_question_index) WHERE id = ?",
+                (json.dumps(data), now + self.ttl, index, session_id)
+            )
+            conn.execute("COMMIT")
+            return True
+        finally:
+            conn.close()
+
+    def advance_question(self, session_id: str):
+        """
+        Atomically claims the next question index.
+
+        Returns:
+            int: The claimed zero-based index, -1 when all questions are done,
+            or None if the session does not exist.
+        """
+        if not session_id:
+            return None
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT data, current_question_index FROM sessions WHERE id = ? AND expires_at >= ?",
+                (session_id, now)
+            ).fetchone()
+            if row is None:
+                conn.execute("ROLLBACK")
+                return None
+            index = row[1]
+            if index >= len(json.loads(row[0]).get("questions") or []):
+                conn.execute("ROLLBACK")
+                return -1
+            conn.execute(
+                "UPDATE sessions SET current_question_index = ?, expires_at = ? WHERE id = ?",
+                (index + 1, now + self.ttl, session_id)
+            )
+            conn.execute("COMMIT")
+            return index
+        finally:
+            conn.close()
+
+
+class RedisSessionStore:
+    """
+    Interview sessions in Redis, for sharing across hosts. The session body
+    is a JSON string and the question index a separate counter, both with
+    a sliding TTL.
+    """
+
+    # Increment the index only while it is below the number of questions
+    _ADVANCE_SCRIPT = """
+    local data = redis.call('GET', KEYS[1])
+    if not data then return nil end
+    local count = tonumber(ARGV[1])
+    local index = tonumber(redis.call('GET', KEYS[2]) or '0')
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+    redis.call('EXPIRE', KEYS[2], ARGV[2])
+    if index >= count then return -1 end
+    redis.call('SET', KEYS[2], index + 1, 'EX', ARGV[2])
+    return index
+    """
+
+    def __init__(self, url: str, ttl: int = SESSION_TTL_SECONDS):
+        if redis is None:
+            raise ImportError("The redis package is required for a redis:// SESSION_STORE_URL")
+        self.ttl = ttl
+        self.client = redis.Redis.from_url(url)
+        self._advance = self.client.register_script(self._ADVANCE_SCRIPT)
+
+    @staticmethod
+    def _keys(session_id: str):
+        return f"session:{session_id}", f"session:{session_id}:index"
+
+    def create(self, session_id: str, data: dict) -> None:
+        data = dict(data)
+        index = data.pop("current_question_index", 0)
+        data_key, index_key = self._keys(session_id)
+        pipe = self.client.pipeline()
+        pipe.set(data_key, json.dumps(data), ex=self.ttl)
+        pipe.set(index_key, index, ex=self.ttl)
+        pipe.execute()
+
+    def get(self, session_id: str):
+        if not session_id:
+            return None
+        data_key, index_key = self._keys(session_id)
+        pipe = self.client.pipeline()
+        pipe.get(data_key)
+        pipe.get(index_key)
+        pipe.expire(data_key, self.ttl)
+        pipe.expire(index_key, self.ttl)
+        data, index, _, _ = pipe.execute()
+        if data is None:
+            return None
+        session = json.loads(data)
+        session["current_question_index"] = int(index or 0)
+        return session
+
+    def update(self, session_id: str, **fields) -> bool:
+        if not session_id:
+            return False
+        data_key, index_key = self._keys(session_id)
+        index = fields.pop("current_question_index", None)
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(data_key)
+                    raw = pipe.get(data_key)
+                    if raw is None:
+                        pipe.unwatch()
+                        return False
+                    data = json.loads(raw)
+                    data.update(fields)
+                    pipe.multi()
+                    pipe.set(data_key, json.dumps(data), ex=self.ttl)
+                    if index is not None:
+                        pipe.set(index_key, index, ex=self.ttl)
+                    else:
+                        pipe.expire(index_key, self.ttl)
+                    pipe.execute()
+                    return True
+                except redis.WatchError:
+                    continue
+
+    def advance_question(self, session_id: str):
+        session = self.get(session_id)
+        if session is None:
+            return None
+        result = self._advance(keys=list(self._keys(session_id)), args=[len(session.get("questions") or []), self.ttl])
+        return None if result is None else int(result)
+
+
+def get_session_store(url: str = SESSION_STORE_URL):
+    """
+    Returns the session store selected by url (redis:// or a SQLite path).
+    """
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisSessionStore(url)
+    return SQLiteSessionStore(url)
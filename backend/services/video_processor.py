@@ -1,11 +1,14 @@
+import io
 import os
+import wave
 import subprocess
-import openai
+import numpy as np
 import json
 from services.llm_integration import evaluate_answer
+from utils.llm_client import transcribe_file
 
-# Ensure your OpenAI API key is set in the environment
-openai.api_key = os.getenv("OPENAI_API_KEY")
+# Pipe ffmpeg output straight to the transcriber instead of writing audio.wav
+STREAM_AUDIO = os.getenv("STREAM_AUDIO", "1") == "1"
 
 
 def get_question_dir(interview_id: str, question_number: int) -> str:
@@ -19,6 +22,31 @@ def get_question_dir(interview_id: str, question_number: int) -> str:
     return base_dir
 
 
+def load_answer_transcript(interview_id: str, question_number: int) -> str:
+    """
+    Returns the saved transcript for a question, or an empty string if the
+    question has not been answered yet.
+    """
+    transcript_path = os.path.abspath(
+        os.path.join(os.path.dirname(__file__), "..", "static", "interviews", interview_id,
+                     f"question_{question_number}", "transcript.txt")
+    )
+    if not os.path.exists(transcript_path):
+        return ""
+    with open(transcript_path, "r", encoding="utf-8") as f:
+        return f.read().strip()
+
+
+def save_answer_feedback(interview_id: str, question_number: int, feedback: dict) -> str:
+    """
+    Writes feedback.json for a question and returns its path.
+    """
+    feedback_path = os.path.join(get_question_dir(interview_id, question_number), "feedback.json")
+    with open(feedback_path, "w", encoding="utf-8") as f:
+        json.dump(feedback, f, indent=2)
+    return feedback_path
+
+
 def extract_audio(video_path: str, audio_path: str) -> None:
     """
     Uses ffmpeg to extract a mono, 16kHz WAV audio file from the given video.
@@ -33,20 +61,61 @@ def extract_audio(video_path: str, audio_path: str) -> None:
     subprocess.run(cmd, check=True)
 
 
-def transcribe_audio(audio_path: str) -> str:
+def extract_audio_stream(video_path: str) -> io.BytesIO:
+    """
+    Uses ffmpeg to decode mono, 16kHz 16-bit PCM to stdout and wraps it
+    in an in-memory WAV buffer. Nothing is written to disk.
+    """
+    cmd = [
+        "ffmpeg", "-i", video_path,
+        "-f", "s16le", "-acodec", "pcm_s16le",
+        "-ar", "16000",
+        "-ac", "1",
+        "pipe:1"
+    ]
+    proc = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    return pcm_to_wav_buffer(proc.stdout)
+
+
+def pcm_to_wav_buffer(pcm) -> io.BytesIO:
+    """
+    Wraps mono 16kHz PCM (16-bit bytes, or a float32 array in [-1, 1]) in
+    an in-memory WAV buffer that transcribe_audio accepts.
+    """
+    if isinstance(pcm, np.ndarray):
+        pcm = (np.clip(pcm, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(16000)
+        wav.writeframes(pcm)
+    buffer.seek(0)
+    # The transcription API infers the upload format from the file name
+    buffer.name = "audio.wav"
+    return buffer
+
+
+def transcribe_segment(audio) -> dict:
+    """
+    Transcribes one float32 16kHz segment of a live upload (see
+    services.chunked_upload.LiveTranscript).
+    """
+    return {"text": transcribe_audio(pcm_to_wav_buffer(audio))}
+
+
+def transcribe_audio(audio) -> str:
     """
-    Uses OpenAI Whisper (via the OpenAI API) to transcribe the given audio file.
+    Uses OpenAI Whisper (via the OpenAI API) to transcribe the given audio.
+    Accepts a file path or an open binary file-like object such as the
+    buffer returned by extract_audio_stream.
     Returns the transcription text.
     """
-    with open(audio_path, "rb") as audio_file:
-        result = openai.Audio.transcribe(
-            model="whisper-1",
-            file=audio_file
-        )
-    return result.get("text", "").strip()
+    return transcribe_file(audio, model="whisper-1").strip()
 
 
-def process_video_answer(video_path: str, question_text: str, interview_id: str, question_number: int) -> dict:
+def process_video_answer(video_path: str, question_text: str, interview_id: str, question_number: int,
+                         progress=None, transcription: str = None) -> dict:
     """
     Full pipeline:
       1. Store video under static folder
@@ -54,37 +123,59 @@ def process_video_answer(video_path: str, question_text: str, interview_id: str,
       3. Transcribe and save transcript
       4. Evaluate and save feedback
     Returns paths and feedback results.
+
+    progress, if given, is called with the name of each completed stage
+    (the transcript is passed along with "transcribed"), and its token
+    method, if any, receives the evaluation as it streams in.
+    The pipeline can be re-run for the same answer after an interruption.
+    If transcription is given (e.g. from a live chunked upload), audio
+    extraction and transcription are skipped.
     """
+    progress = progress or (lambda stage, **details: None)
     question_dir = get_question_dir(interview_id, question_number)
 
-    # Move video to structured folder
+    # Move video to structured folder (already moved if this is a retry)
     video_dest = os.path.join(question_dir, "video.mp4")
-    os.replace(video_path, video_dest)
+    if os.path.exists(video_path):
+        os.replace(video_path, video_dest)
+    progress("video_stored")
 
-    # 1. Extract audio
+    # 1. Extract audio (in memory when streaming)
     audio_path = os.path.join(question_dir, "audio.wav")
-    extract_audio(video_dest, audio_path)
+    if transcription is None:
+        if STREAM_AUDIO:
+            audio = extract_audio_stream(video_dest)
+        else:
+            extract_audio(video_dest, audio_path)
+            audio = audio_path
+    progress("audio_extracted")
 
     try:
         # 2. Transcribe
-        transcription = transcribe_audio(audio_path)
+        if transcription is None:
+            transcription = transcribe_audio(audio)
 
         # 3. Save transcript
         transcript_path = os.path.join(question_dir, "transcript.txt")
         with open(transcript_path, "w", encoding="utf-8") as f:
             f.write(transcription)
+        progress("transcribed", transcript=transcription)
 
         # 4. Evaluate
-        feedback = evaluate_answer(transcription, question_text)
+        prompt_usage = {}
+        feedback = evaluate_answer(transcription, question_text, usage=prompt_usage,
+                                   on_token=getattr(progress, "token", None))
 
         # 5. Save feedback
         feedback_path = os.path.join(question_dir, "feedback.json")
         with open(feedback_path, "w", encoding="utf-8") as f:
             json.dump(feedback, f, indent=2)
+        progress("evaluated")
 
         return {
             "transcription": transcription,
             "feedback": feedback,
+            "prompt_tokens": prompt_usage,
             "question_dir": question_dir
         }
 
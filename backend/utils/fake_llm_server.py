@@ -0,0 +1,234 @@
+"""
+Fake LLM provider for offline load and failure testing of utils.llm_client.
+
+Serves the endpoints the app uses (OpenAI chat completions and audio
+transcriptions, Cohere generate, streamed or not) with canned responses
+after a configurable latency, failing a configurable share of requests
+and optionally malforming a share of the JSON replies.
+
+Usage (from backend):
+    python -m utils.fake_llm_server --latency 0.8 --jitter 0.4 --error-rate 0.1 --hang-rate 0.02
+    OPENAI_BASE_URL=http://127.0.0.1:6012/v1 COHERE_BASE_URL=http://127.0.0.1:6012/v1 python app.py
+
+    # Throughput of the client layer against the running fake server
+    python -m utils.fake_llm_server --load 200 --concurrency 16
+"""
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FAKE_EVALUATION = {
+    "score": 7,
+    "strengths": ["Clear structure", "Relevant example"],
+    "improvements": ["Quantify the impact"],
+    "summary": "A solid answer that would benefit from concrete numbers.",
+}
+FAKE_COHERE_QUESTIONS = "1. Fake question one?\n2. Fake question two?"
+FAKE_FEEDBACK = (
+    "1. Answer correctness: the answer addresses the question with a relevant example. "
+    "2. Prosody: energy and pitch are steady; slow down slightly in the second half."
+)
+FAKE_QUESTIONS = [
+    "Describe a system you designed end to end.",
+    "How do you debug a production incident?",
+    "Tell me about a time you disagreed with a teammate.",
+]
+
+
+def _messy(content: str) -> str:
+    # The deviations models make in practice: prose, code fences, trailing commas, Python literals
+    return random.choice([
+        lambda c: f"Sure! Here is the JSON you asked for:\n```json\n{c}\n```\nLet me know if you need more.",
+        lambda c: re.sub(r"([\]}])$", r",\1", c.replace("]", ",]")),
+        lambda c: c.replace('"', "'"),
+        lambda c: c[:max(1, len(c) * 2 // 3)],
+    ])(content)
+
+
+def _chat_content(body: dict) -> str:
+    # Answer in the shape each prompt in llm_integration asks for
+    prompt = body.get("messages", [{}])[-1].get("content", "")
+    if prompt.startswith("Convert the text below into JSON"):
+        # Structured-output fix-up prompt (see utils.structured_output)
+        if '\n{"type": "array", "items": {"type": "string"}' in prompt:
+            return json.dumps(FAKE_QUESTIONS)
+        count = re.search(r'"minItems": (\d+)', prompt)
+        return json.dumps([FAKE_EVALUATION] * int(count.group(1)) if count else FAKE_EVALUATION)
+    if "JSON array of question strings" in prompt:
+        return json.dumps(FAKE_QUESTIONS)
+    if "JSON array" in prompt:
+        count = max(1, prompt.count("Question:"))
+        return json.dumps([FAKE_EVALUATION] * count)
+    if "valid JSON" in prompt:
+        return json.dumps(FAKE_EVALUATION)
+    return "This is a fake completion."
+
+
+class FakeProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Set from the command line (see main)
+    latency = 0.5
+    jitter = 0.0
+    error_rate = 0.0
+    error_status = 503
+    hang_rate = 0.0
+    hang_seconds = 300.0
+    token_latency = 0.02
+    messy_rate = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict, headers: dict = None) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, content_type: str, chunks) -> None:
+        # Chunked transfer encoding, one HTTP chunk per token, like the real APIs
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for chunk in chunks:
+            data = chunk.encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+            time.sleep(self.token_latency)
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_POST(self):
+        raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+        roll = random.random()
+        if roll < self.hang_rate:
+            time.sleep(self.hang_seconds)
+        elif roll < self.hang_rate + self.error_rate:
+            headers = {"Retry-After": "1"} if self.error_status == 429 else None
+            self._send_json(self.error_status, {"error": {"message": "Injected failure"}}, headers)
+            return
+
+        body = json.loads(raw or b"{}") if self.path.endswith(("/chat/completions", "/generate")) else {}
+        content = _chat_content(body) if self.path.endswith("/chat/completions") else ""
+        if content.lstrip().startswith(("[", "{")) and random.random() < self.messy_rate:
+            content = _messy(content)
+        if self.path.endswith("/chat/completions") and body.get("stream"):
+            tokens = re.findall(r"\S+\s*", content)
+            self._stream("text/event-stream", [
+                f"data: {json.dumps({'choices': [{'index': 0, 'delta': {'content': token}}]})}\n\n"
+                for token in tokens
+            ] + ["data: [DONE]\n\n"])
+        elif self.path.endswith("/generate") and body.get("stream"):
+            tokens = re.findall(r"\S+\s*", FAKE_FEEDBACK)
+            self._stream("application/stream+json", [
+                json.dumps({"text": token, "is_finished": False}) + "\n" for token in tokens
+            ] + [json.dumps({"is_finished": True, "finish_reason": "COMPLETE"}) + "\n"])
+        elif self.path.endswith("/chat/completions"):
+            self._send_json(200, {
+                "object": "chat.completion",
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                             "finish_reason": "stop"}],
+            })
+        elif self.path.endswith("/audio/transcriptions"):
+            self._send_json(200, {"text": "This is a fake transcription of the uploaded answer."})
+        elif self.path.endswith("/generate"):
+            text = FAKE_FEEDBACK if "Transcript Segments" in body.get("prompt", "") else FAKE_COHERE_QUESTIONS
+            self._send_json(200, {"generations": [{"text": text}]})
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+
+def serve(host: str, port: int, **settings) -> ThreadingHTTPServer:
+    """
+    Starts the fake provider in a background thread and returns the server
+    (call shutdown() to stop it). settings override FakeProviderHandler's
+    latency/jitter/error/hang/messy attributes.
+    """
+    handler = type("ConfiguredFakeProviderHandler", (FakeProviderHandler,), settings)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_load(requests_total: int, concurrency: int) -> dict:
+    """
+    Sends chat completions through utils.llm_client and reports throughput,
+    latency percentiles and the client's retry and circuit counters.
+    """
+    from utils.llm_client import chat_completion, client_stats
+
+    def one(_):
+        start = time.perf_counter()
+        try:
+            chat_completion([{"role": "user", "content": "Say hello."}], max_tokens=10)
+            ok = True
+        except Exception:
+            ok = False
+        return ok, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(requests_total)))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(latency for _, latency in results)
+    return {
+        "requests": requests_total,
+        "succeeded": sum(ok for ok, _ in results),
+        "seconds": round(elapsed, 2),
+        "requests_per_second": round(requests_total / elapsed, 1),
+        "p50_seconds": round(latencies[len(latencies) // 2], 3),
+        "p95_seconds": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3),
+        "client": client_stats(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fake OpenAI/Cohere provider for offline testing.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6012)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds before each response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- seconds added to the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with an error")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="share of requests that stall")
+    parser.add_argument("--hang-seconds", type=float, default=300.0)
+    parser.add_argument("--token-latency", type=float, default=0.02, help="seconds between streamed tokens")
+    parser.add_argument("--messy-rate", type=float, default=0.0,
+                        help="share of JSON replies sent malformed (fenced, truncated, trailing commas, ...)")
+    parser.add_argument("--load", type=int, default=0,
+                        help="instead of serving, send this many requests to OPENAI_BASE_URL")
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    if args.load:
+        print(json.dumps(run_load(args.load, args.concurrency), indent=2))
+        return
+
+    server = serve(args.host, args.port, latency=args.latency, jitter=args.jitter,
+                   error_rate=args.error_rate, error_status=args.error_status,
+                   hang_rate=args.hang_rate, hang_seconds=args.hang_seconds,
+                   token_latency=args.token_latency, messy_rate=args.messy_rate)
+    print(f"Fake LLM provider on http://{args.host}:{args.port}/v1")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+import os
+import re
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+
+CACHE_DB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "static", "cache", "llm_cache.db"))
+CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+CACHE_MEMORY_ITEMS = int(os.getenv("LLM_CACHE_MEMORY_ITEMS", "256"))
+CACHE_DISK_ITEMS = int(os.getenv("LLM_CACHE_DISK_ITEMS", "10000"))
+CACHE_DISABLED = os.getenv("LLM_CACHE_DISABLED", "0") == "1"
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        return re.sub(r"\s+", " ", value).strip()
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def make_cache_key(namespace: str, **inputs) -> str:
+    """
+    Hashes the normalized inputs (collapsed whitespace, sorted keys) into a
+    stable cache key, so cosmetic differences in the JD or resume still hit.
+    """
+    payload = json.dumps({"ns": namespace, "inputs": _normalize(inputs)}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    Two-tier cache for LLM responses: an in-process LRU in front of a
+    SQLite store shared by all worker processes. Entries expire after
+    `ttl` seconds and each tier is capped by entry count.
+    """
+
+    def __init__(self, db_path: str = CACHE_DB_PATH, ttl: int = CACHE_TTL_SECONDS,
+                 memory_items: int = CACHE_MEMORY_ITEMS, disk_items: int = CACHE_DISK_ITEMS,
+                 disabled: bool = CACHE_DISABLED):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.memory_items = memory_items
+        self.disk_items = disk_items
+        self.disabled = disabled
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0}
+
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache (accessed_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _memory_get(self, key: str, now: float):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            created_at, value = entry
+            if now - created_at > self.ttl:
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            return value
+
+    def _memory_put(self, key: str, value, created_at: float) -> None:
+        with self._lock:
+            self._memory[key] = (created_at, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def get(self, key: str):
+        """
+        Returns the cached value for key, or None on a miss or expired entry.
+        """
+        now = time.time()
+        value = self._memory_get(key, now)
+        if value is not None:
+            self._stats["memory_hits"] += 1
+            return value
+
+        with self._connect() as conn:
+            row = conn.execute("SELECT value, created_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] > self.ttl:
+                conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                row = None
+            if row is not None:
+                conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+
+        if row is None:
+            self._stats["misses"] += 1
+            return None
+
+        value = json.loads(row[0])
+        self._memory_put(key, value, row[1])
+        self._stats["disk_hits"] += 1
+        return value
+
+    def put(self, key: str, value) -> None:
+        """
+        Stores a JSON-serialisable value in both tiers and evicts the least
+        recently used disk entries beyond the size limit.
+        """
+        now = time.time()
+        self._memory_put(key, value, now)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now)
+            )
+            conn.execute("DELETE FROM cache WHERE created_at < ?", (now - self.ttl,))
+            conn.execute(
+                "DELETE FROM cache WHERE key IN ("
+                "SELECT key FROM cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.disk_items,)
+            )
+
+    def get_or_compute(self, key: str, compute, bypass: bool = False):
+        """
+        Returns the cached value for key, calling compute() and caching its
+        result on a miss. With bypass (or a disabled cache) compute() always
+        runs and its result refreshes the cache.
+        """
+        if bypass or self.disabled:
+            self._stats["bypassed"] += 1
+            value = compute()
+            if not self.disabled:
+                self.put(key, value)
+            return value
+
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def stats(self) -> dict:
+        """
+        Returns hit/miss counters and the hit rate for this process.
+        """
+        stats = dict(self._stats)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else 0.0
+        stats["memory_items"] = len(self._memory)
+        return stats
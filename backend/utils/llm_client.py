@@ -0,0 +1,383 @@
+import os
+import json
+import time
+import random
+import logging
+import threading
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Deadline for a whole call, including queueing for a slot and all retries
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_TRANSCRIBE_TIMEOUT = float(os.getenv("LLM_TRANSCRIBE_TIMEOUT", "120"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+# Full-jitter exponential backoff: sleep uniform(0, min(max, base * 2**attempt))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+# Consecutive failed attempts that open a provider's circuit, and how long it stays open
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "30"))
+
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+# Point the base URLs at fake_llm_server.py to run without the real APIs
+PROVIDER_SETTINGS = {
+    "openai": {
+        "base_url": os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"),
+        "api_key": os.getenv("OPENAI_API_KEY"),
+        "concurrency": int(os.getenv("OPENAI_CONCURRENCY", "8")),
+    },
+    "cohere": {
+        "base_url": os.getenv("COHERE_BASE_URL", "https://api.cohere.ai/v1"),
+        "api_key": os.getenv("COHERE_API_KEY"),
+        "concurrency": int(os.getenv("COHERE_CONCURRENCY", "8")),
+    },
+}
+
+
+class LLMError(Exception):
+    """
+    A provider call that failed after retries, or could not be retried.
+    status is the HTTP status when the provider answered.
+    """
+
+    def __init__(self, message: str, status: int = None):
+        super().__init__(message)
+        self.status = status
+
+
+class CircuitOpenError(LLMError):
+    """Raised without calling the provider while its circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Opens after `failures` consecutive failed attempts and rejects calls for
+    `reset_seconds`. Then one probe call is let through (half-open): its
+    success closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self, failures: int = LLM_BREAKER_FAILURES, reset_seconds: float = LLM_BREAKER_RESET):
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self.consecutive = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self.lock:
+            if self.opened_at is None:
+                return "closed"
+            if self.probing or time.monotonic() - self.opened_at >= self.reset_seconds:
+                return "half_open"
+            return "open"
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.probing or time.monotonic() - self.opened_at < self.reset_seconds:
+                return False
+            self.probing = True
+            return True
+
+    def record_success(self) -> None:
+        with self.lock:
+            self.consecutive = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self) -> None:
+        with self.lock:
+            self.consecutive += 1
+            if self.probing or self.consecutive >= self.failures:
+                if self.opened_at is None or self.probing:
+                    logger.warning(f"Circuit opened after {self.consecutive} consecutive failures.")
+                self.opened_at = time.monotonic()
+                self.probing = False
+
+    def end_probe(self) -> None:
+        """
+        Ends a probe whose outcome was never recorded (the attempt raised an
+        unexpected exception): the circuit opens again for reset_seconds
+        instead of staying half-open and rejecting every call.
+        """
+        with self.lock:
+            if self.probing:
+                self.probing = False
+                self.opened_at = time.monotonic()
+
+
+class Provider:
+    """
+    One upstream API: a pooled HTTP session (connections are reused across
+    calls and threads), a concurrency limit, and a circuit breaker.
+
+    post() enforces a deadline for the whole call. Each attempt's read
+    timeout is capped by the time left, so a stalled upstream cannot hold a
+    worker past the deadline.
+    """
+
+    def __init__(self, name: str, base_url: str, api_key: str = None, concurrency: int = 8):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.concurrency = concurrency
+        self.breaker = CircuitBreaker()
+        self.stats_lock = threading.Lock()
+        self.counters = {"calls": 0, "attempts": 0, "retries": 0, "failures": 0, "rejected": 0, "in_flight": 0}
+
+    def _count(self, key: str, delta: int = 1) -> None:
+        with self.stats_lock:
+            self.counters[key] += delta
+
+    def stats(self) -> dict:
+        with self.stats_lock:
+            stats = dict(self.counters)
+        stats.update(circuit=self.breaker.state, concurrency=self.concurrency)
+        return stats
+
+    @contextmanager
+    def _slot(self, timeout: float):
+        self._count("calls")
+        if not self.slots.acquire(timeout=timeout):
+            self._count("failures")
+            raise LLMError(f"{self.name}: no free request slot within {timeout:.0f}s")
+        self._count("in_flight")
+        try:
+            yield
+        finally:
+            self._count("in_flight", -1)
+            self.slots.release()
+
+    def _send(self, path: str, deadline: float, retries: int, stream: bool = False, **kwargs):
+        """
+        Retry loop shared by post() and stream_lines(). Returns the first
+        response with a status below 400; with stream=True only its headers
+        have been read.
+        """
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._count("failures")
+                raise LLMError(f"{self.name}: deadline passed before the request was sent")
+            if not self.breaker.allow():
+                self._count("rejected")
+                raise CircuitOpenError(f"{self.name}: circuit open after repeated failures")
+            self._count("attempts")
+            retry_after = None
+            try:
+                response = self.session.post(
+                    self.base_url + path, headers=self.headers, stream=stream,
+                    timeout=(min(LLM_CONNECT_TIMEOUT, remaining), remaining), **kwargs
+                )
+                if response.status_code < 400:
+                    self.breaker.record_success()
+                    return response
+                error = LLMError(
+                    f"{self.name} {path} returned {response.status_code}: {response.text[:200]}",
+                    status=response.status_code
+                )
+                if response.status_code not in RETRY_STATUSES:
+                    # The provider is up; the request itself was rejected
+                    self.breaker.record_success()
+                    raise error
+                retry_after = _retry_after(response)
+                self.breaker.record_failure()
+            except requests.RequestException as e:
+                error = LLMError(f"{self.name} {path} failed: {e}")
+                self.breaker.record_failure()
+            finally:
+                self.breaker.end_probe()
+
+            delay = retry_after if retry_after is not None else random.uniform(
+                0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt)
+            )
+            if attempt >= retries or time.monotonic() + delay >= deadline:
+                self._count("failures")
+                raise error
+            logger.warning(f"{error}; retrying in {delay:.2f}s")
+            self._count("retries")
+            time.sleep(delay)
+            attempt += 1
+
+    def post(self, path: str, json: dict = None, data: dict = None, files: dict = None,
+             timeout: float = LLM_TIMEOUT, retries: int = LLM_MAX_RETRIES) -> dict:
+        """
+        POSTs to base_url + path and returns the decoded JSON response.
+        Connection errors, timeouts and RETRY_STATUSES are retried with
+        jittered backoff (or the server's Retry-After) while the deadline
+        allows; file payloads must be bytes so they can be re-sent.
+
+        Raises:
+            CircuitOpenError: if the provider's circuit is open
+            LLMError: on other failures, or when the deadline passes
+        """
+        deadline = time.monotonic() + timeout
+        with self._slot(timeout):
+            response = self._send(path, deadline, retries, json=json, data=data, files=files)
+            try:
+                return response.json()
+            except ValueError as e:
+                raise LLMError(f"{self.name} {path} returned invalid JSON: {e}")
+
+    def stream_lines(self, path: str, json: dict = None, timeout: float = LLM_TIMEOUT,
+                     retries: int = LLM_MAX_RETRIES):
+        """
+        POSTs a streaming request and yields the response body line by line
+        as it arrives. Failures are retried like post() until the response
+        starts; once lines have been yielded, an error is raised instead,
+        since the caller has already consumed part of the output. The
+        deadline covers the whole stream.
+        """
+        deadline = time.monotonic() + timeout
+        with self._slot(timeout):
+            response = self._send(path, deadline, retries, stream=True, json=json)
+            try:
+                # chunk_size=None hands over data as it arrives instead of in 512-byte reads
+                for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                    if time.monotonic() > deadline:
+                        raise LLMError(f"{self.name} {path}: stream exceeded the {timeout:.0f}s deadline")
+                    if line:
+                        yield line
+            except requests.RequestException as e:
+                self.breaker.record_failure()
+                raise LLMError(f"{self.name} {path} stream failed: {e}")
+            finally:
+                response.close()
+
+
+def _retry_after(response) -> float:
+    try:
+        return max(0.0, float(response.headers.get("Retry-After", "")))
+    except ValueError:
+        return None
+
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+
+def configure_provider(name: str, **settings) -> None:
+    """
+    Overrides PROVIDER_SETTINGS for a provider (base_url, api_key,
+    concurrency) before its first use.
+    """
+    with _providers_lock:
+        PROVIDER_SETTINGS[name] = dict(PROVIDER_SETTINGS.get(name, {}), **settings)
+        _providers.pop(name, None)
+
+
+def get_provider(name: str) -> Provider:
+    with _providers_lock:
+        provider = _providers.get(name)
+        if provider is None:
+            provider = _providers[name] = Provider(name, **PROVIDER_SETTINGS[name])
+        return provider
+
+
+def client_stats() -> dict:
+    """
+    Per-provider call counters, in-flight requests and circuit state.
+    """
+    with _providers_lock:
+        providers = list(_providers.values())
+    return {provider.name: provider.stats() for provider in providers}
+
+
+def chat_completion(messages: list, model: str = "gpt-3.5-turbo", temperature: float = 0.7,
+                    max_tokens: int = None, timeout: float = LLM_TIMEOUT) -> str:
+    """
+    Runs an OpenAI chat completion and returns the message content.
+    """
+    payload = {"model": model, "messages": messages, "temperature": temperature}
+    if max_tokens is not None:
+        payload["max_tokens"] = max_tokens
+    body = get_provider("openai").post("/chat/completions", json=payload, timeout=timeout)
+    return body["choices"][0]["message"]["content"]
+
+
+def transcribe_file(audio, model: str = "whisper-1", filename: str = "audio.wav",
+                    timeout: float = LLM_TRANSCRIBE_TIMEOUT) -> str:
+    """
+    Transcribes audio with the OpenAI transcription API. Accepts a file
+    path, bytes or a binary file-like object. Returns the text.
+    The API infers the format from the file name, so a path's or file
+    object's own name is used in place of `filename`.
+    """
+    if isinstance(audio, (str, os.PathLike)):
+        filename = os.path.basename(audio)
+        with open(audio, "rb") as f:
+            audio = f.read()
+    elif not isinstance(audio, bytes):
+        filename = os.path.basename(getattr(audio, "name", "") or filename)
+        audio = audio.read()
+    body = get_provider("openai").post(
+        "/audio/transcriptions", data={"model": model}, files={"file": (filename, audio)}, timeout=timeout
+    )
+    return body.get("text", "")
+
+
+def generate_text(prompt: str, model: str = "command", max_tokens: int = 300, temperature: float = 0.7,
+                  timeout: float = LLM_TIMEOUT) -> str:
+    """
+    Runs a Cohere generation and returns the text of the first generation.
+    """
+    payload = {"prompt": prompt, "model": model, "max_tokens": max_tokens, "temperature": temperature}
+    body = get_provider("cohere").post("/generate", json=payload, timeout=timeout)
+    return body["generations"][0]["text"]
+
+
+def stream_chat_completion(messages: list, model: str = "gpt-3.5-turbo", temperature: float = 0.7,
+                           max_tokens: int = None, timeout: float = LLM_TIMEOUT):
+    """
+    Streaming chat_completion: yields pieces of the message content as the
+    provider sends them.
+    """
+    payload = {"model": model, "messages": messages, "temperature": temperature, "stream": True}
+    if max_tokens is not None:
+        payload["max_tokens"] = max_tokens
+    for line in get_provider("openai").stream_lines("/chat/completions", json=payload, timeout=timeout):
+        # Server-sent events: "data: {chunk}" lines, ending with "data: [DONE]"
+        if not line.startswith("data:"):
+            continue
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            return
+        # Usage and content-filter chunks carry an empty choices list
+        choices = json.loads(data).get("choices")
+        if not choices:
+            continue
+        delta = choices[0].get("delta", {}).get("content")
+        if delta:
+            yield delta
+
+
+def stream_generate_text(prompt: str, model: str = "command", max_tokens: int = 300, temperature: float = 0.7,
+                         timeout: float = LLM_TIMEOUT):
+    """
+    Streaming generate_text: yields pieces of the generation as the
+    provider sends them.
+    """
+    payload = {"prompt": prompt, "model": model, "max_tokens": max_tokens,
+               "temperature": temperature, "stream": True}
+    for line in get_provider("cohere").stream_lines("/generate", json=payload, timeout=timeout):
+        # One JSON object per line; the last one has is_finished set
+        event = json.loads(line)
+        if event.get("is_finished"):
+            return
+        if event.get("text"):
+            yield event["text"]
@@ -0,0 +1,252 @@
+import os
+import re
+import logging
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1500"))
+TOKEN_ENCODING = os.getenv("PROMPT_TOKEN_ENCODING", "cl100k_base")
+# Segment lists are merged pairwise down to this many before the middle is elided
+MIN_MERGED_SEGMENTS = 8
+# Segment text is not shortened below this many tokens each; segments are elided instead
+MIN_SEGMENT_TOKENS = 20
+
+# Hesitations that carry no content; "you know," / "I mean," / "like," only with the comma
+FILLER_PATTERN = re.compile(
+    r"\b(?:u+m+|u+h+|e+r+m+|h+m+)\b[,.]?\s*|\b(?:you know|i mean|like),\s*",
+    re.IGNORECASE
+)
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+")
+
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding():
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        if tiktoken is not None:
+            try:
+                _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+            except Exception as e:
+                logger.warning(f"Token encoding {TOKEN_ENCODING} unavailable, estimating: {e}")
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """
+    Tokens in text, counted locally with tiktoken when it is installed and
+    estimated at ~4 characters per token otherwise.
+    """
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def strip_fillers(text: str) -> str:
+    return re.sub(r"\s{2,}", " ", FILLER_PATTERN.sub("", text)).strip()
+
+
+def _elide_middle(units: list, budget: int, joiner: str, marker) -> list:
+    """
+    Keeps units alternately from the head and the tail while they fit the
+    budget, and puts marker(n_omitted) in place of the rest.
+    """
+    costs = [count_tokens(unit + joiner) for unit in units]
+    if sum(costs) <= budget:
+        return units
+    head, tail = 0, len(units)
+    used = count_tokens(marker(len(units)) + joiner)
+    take_head = True
+    while head < tail:
+        i = head if take_head else tail - 1
+        if used + costs[i] > budget:
+            break
+        used += costs[i]
+        if take_head:
+            head += 1
+        else:
+            tail -= 1
+        take_head = not take_head
+    return units[:head] + [marker(tail - head)] + units[tail:]
+
+
+def fit_text(text: str, budget: int):
+    """
+    Shortens free text to about `budget` tokens: fillers are dropped first,
+    then whole sentences (or words, for unpunctuated text) are elided from
+    the middle, keeping the opening and the conclusion.
+
+    Returns (text, steps) where steps names the reductions applied.
+    """
+    steps = []
+    if count_tokens(text) <= budget:
+        return text, steps
+    text = strip_fillers(text)
+    steps.append("fillers")
+    if count_tokens(text) <= budget:
+        return text, steps
+
+    sentences = SENTENCE_PATTERN.split(text)
+    if len(sentences) > 2:
+        kept = _elide_middle(sentences, budget, " ", lambda n: f"[... {n} sentences omitted ...]")
+        steps.append("elide_sentences")
+        text = " ".join(kept)
+    if count_tokens(text) > budget:
+        kept = _elide_middle(text.split(), budget, " ", lambda n: f"[... {n} words omitted ...]")
+        steps.append("elide_words")
+        text = " ".join(kept)
+    return text, steps
+
+
+def _merge_pairs(segments: list) -> list:
+    return [
+        {
+            "start": segments[i]["start"],
+            "end": segments[min(i + 1, len(segments) - 1)]["end"],
+            "text": " ".join(seg["text"].strip() for seg in segments[i:i + 2]),
+        }
+        for i in range(0, len(segments), 2)
+    ]
+
+
+def fit_segments(segments: list, budget: int, render):
+    """
+    Fits timestamped transcript segments ({"start", "end", "text"}) to
+    about `budget` tokens. render(segments) returns one prompt line per
+    segment, so per-segment statistics are recomputed after merging.
+
+    Reductions, in order, until the lines fit: drop fillers, merge adjacent
+    segments pairwise (down to MIN_MERGED_SEGMENTS), shorten each segment's
+    text to an equal share (see fit_text), then elide segments from the
+    middle with a marker giving the omitted time span.
+
+    Returns (lines, steps).
+    """
+    steps = []
+
+    def cost(lines):
+        return count_tokens("\n".join(lines))
+
+    lines = render(segments)
+    if cost(lines) <= budget:
+        return lines, steps
+
+    segments = [dict(seg, text=strip_fillers(seg["text"])) for seg in segments]
+    steps.append("fillers")
+    lines = render(segments)
+
+    def text_share(segments, lines):
+        # Tokens left per segment for text once the per-line overhead
+        # (timestamps, statistics) is paid
+        overhead = sum(count_tokens(line) - count_tokens(seg["text"]) for seg, line in zip(segments, lines))
+        return (budget - overhead) // len(segments)
+
+    # Merging only saves per-line overhead, so it stops once shortening the
+    # text at the current resolution would do
+    while (cost(lines) > budget and len(segments) > MIN_MERGED_SEGMENTS
+           and text_share(segments, lines) < MIN_SEGMENT_TOKENS):
+        segments = _merge_pairs(segments)
+        lines = render(segments)
+        if "merge" not in steps:
+            steps.append("merge")
+
+    if cost(lines) > budget:
+        share = text_share(segments, lines)
+        if share >= MIN_SEGMENT_TOKENS:
+            segments = [dict(seg, text=fit_text(seg["text"], share)[0]) for seg in segments]
+            lines = render(segments)
+            steps.append("shorten_segments")
+
+    if cost(lines) > budget:
+        def marker(n_omitted):
+            kept_head = (len(segments) - n_omitted + 1) // 2
+            omitted = segments[kept_head:kept_head + n_omitted]
+            if not omitted:
+                return "[... nothing omitted ...]"
+            return (f"[... {n_omitted} segments omitted "
+                    f"({omitted[0]['start']:.1f}s-{omitted[-1]['end']:.1f}s) ...]")
+        lines = _elide_middle(lines, budget, "\n", marker)
+        steps.append("elide_segments")
+    return lines, steps
+
+
+class PromptBuilder:
+    """
+    Assembles a prompt from fixed sections and fitted sections (free text or
+    transcript segments) so the whole prompt stays within a token budget.
+    Fitted sections share whatever the fixed sections leave, in proportion
+    to their full size.
+
+    build() returns (prompt, report) where report has the token counts that
+    were sent, so callers can log or return them with the response.
+    """
+
+    def __init__(self, token_budget: int = PROMPT_TOKEN_BUDGET):
+        self.token_budget = token_budget
+        self.parts = []
+
+    def add(self, text: str) -> "PromptBuilder":
+        self.parts.append(("fixed", text, None))
+        return self
+
+    def add_text(self, text: str, prefix: str = "", suffix: str = "\n") -> "PromptBuilder":
+        self.parts.append(("text", text, (prefix, suffix)))
+        return self
+
+    def add_segments(self, segments: list, render) -> "PromptBuilder":
+        self.parts.append(("segments", segments, render))
+        return self
+
+    def build(self):
+        rendered = {}
+        fixed_tokens = 0
+        full_tokens = {}
+        for i, (kind, payload, extra) in enumerate(self.parts):
+            if kind == "fixed":
+                fixed_tokens += count_tokens(payload)
+            elif kind == "text":
+                full_tokens[i] = count_tokens(extra[0] + payload + extra[1])
+            else:
+                rendered[i] = extra(payload)
+                full_tokens[i] = count_tokens("\n".join(rendered[i]) + "\n")
+
+        available = max(0, self.token_budget - fixed_tokens)
+        total_fitted = sum(full_tokens.values())
+        steps = []
+        pieces = []
+        for i, (kind, payload, extra) in enumerate(self.parts):
+            if kind == "fixed":
+                pieces.append(payload)
+                continue
+            share = full_tokens[i] if total_fitted <= available else available * full_tokens[i] // total_fitted
+            if kind == "text":
+                prefix, suffix = extra
+                text, part_steps = payload, []
+                if full_tokens[i] > share:
+                    text, part_steps = fit_text(payload, max(1, share - count_tokens(prefix + suffix)))
+                pieces.append(prefix + text + suffix)
+            else:
+                lines = rendered[i]
+                part_steps = []
+                if full_tokens[i] > share:
+                    lines, part_steps = fit_segments(payload, share, extra)
+                pieces.append("\n".join(lines) + "\n")
+            steps.extend(part_steps)
+
+        prompt = "".join(pieces)
+        report = {
+            "budget": self.token_budget,
+            "original_tokens": fixed_tokens + total_fitted,
+            "tokens": count_tokens(prompt),
+            "steps": list(dict.fromkeys(steps)),
+            "counter": "tiktoken" if _get_encoding() is not None else "estimate",
+        }
+        return prompt, report
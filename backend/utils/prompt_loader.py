@@ -1,15 +1,132 @@
 import os
 import re
+import glob
+import time
+import threading
 
-def load_prompt_template(prompt_type: str) -> str:
-    path = os.path.join(os.path.dirname(__file__), "..", "static", "prompts.txt")
-    with open(path, "r", encoding="utf-8") as f:
-        content = f.read()
+STATIC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "static"))
+PROMPTS_FILE = os.path.join(STATIC_DIR, "prompts.txt")
+MODES_DIR = os.path.join(STATIC_DIR, "Modes")
+# Minimum seconds between mtime checks, so lookups normally touch no files
+RELOAD_CHECK_INTERVAL = float(os.getenv("PROMPT_RELOAD_INTERVAL", "2"))
+
+SECTION_PATTERN = re.compile(r"^\[([^\]\n]+)\]", re.MULTILINE)
+
+
+def parse_prompt_sections(content: str) -> dict:
+    """
+    Splits a prompts.txt body into {section_name: text}, keyed by the
+    lower-cased name between square brackets.
+    """
+    sections = {}
+    matches = list(SECTION_PATTERN.finditer(content))
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(content)
+        sections[match.group(1).strip().lower()] = content[match.end():end].strip()
+    return sections
+
+
+class PromptRegistry:
+    """
+    Parses prompts.txt and the Modes/*.txt personas once into dicts and
+    re-parses a source only when its mtime changes.
+    """
+
+    def __init__(self, prompts_file: str = PROMPTS_FILE, modes_dir: str = MODES_DIR,
+                 check_interval: float = RELOAD_CHECK_INTERVAL):
+        self.prompts_file = prompts_file
+        self.modes_dir = modes_dir
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._prompts = {}
+        self._personas = {}
+        self._mtimes = {}
+        self._last_check = 0.0
+        self.reload(force=True)
+
+    @staticmethod
+    def _mtime(path: str):
+        try:
+            return os.stat(path).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def _mode_files(self) -> dict:
+        return {
+            os.path.splitext(os.path.basename(path))[0].lower(): path
+            for path in glob.glob(os.path.join(self.modes_dir, "*.txt"))
+        }
+
+    def reload(self, force: bool = False) -> None:
+        """
+        Re-parses any source whose mtime changed (or everything with force).
+        """
+        with self._lock:
+            self._last_check = time.monotonic()
+
+            mtime = self._mtime(self.prompts_file)
+            if force or mtime != self._mtimes.get(self.prompts_file):
+                if mtime is None:
+                    self._prompts = {}
+                else:
+                    with open(self.prompts_file, "r", encoding="utf-8") as f:
+                        self._prompts = parse_prompt_sections(f.read())
+                self._mtimes[self.prompts_file] = mtime
 
-    pattern = rf"\[{prompt_type.lower()}\](.*?)(?=\n\[|\Z)"
-    match = re.search(pattern, content, re.DOTALL | re.IGNORECASE)
+            mode_files = self._mode_files()
+            mode_mtimes = {path: self._mtime(path) for path in mode_files.values()}
+            known = {path for path in self._mtimes if path != self.prompts_file}
+            if force or known != set(mode_mtimes) or any(self._mtimes.get(p) != m for p, m in mode_mtimes.items()):
+                personas = {}
+                for level, path in mode_files.items():
+                    with open(path, "r", encoding="utf-8") as f:
+                        personas[level] = f.read().strip()
+                self._personas = personas
+                for path in known - set(mode_mtimes):
+                    self._mtimes.pop(path, None)
+                self._mtimes.update(mode_mtimes)
 
-    if not match:
-        raise ValueError(f"Prompt '{prompt_type}' not found in prompts.txt")
+    def _maybe_reload(self) -> None:
+        if time.monotonic() - self._last_check >= self.check_interval:
+            self.reload()
 
-    return match.group(1).strip()
+    def get_prompt(self, prompt_type: str) -> str:
+        """
+        Returns the prompt section for prompt_type (case-insensitive).
+
+        Raises:
+            ValueError: If no such section exists.
+        """
+        self._maybe_reload()
+        prompt = self._prompts.get((prompt_type or "").strip().lower())
+        if prompt is None:
+            raise ValueError(f"Prompt '{prompt_type}' not found in prompts.txt")
+        return prompt
+
+    def get_persona(self, level: str) -> str:
+        """
+        Returns the persona text for a difficulty level such as Easy/Medium/Hard.
+
+        Raises:
+            FileNotFoundError: If no Modes/<Level>.txt exists.
+        """
+        self._maybe_reload()
+        persona = self._personas.get((level or "").strip().lower())
+        if persona is None:
+            raise FileNotFoundError(f"Persona mode file not found for level: {level}")
+        return persona
+
+    def prompt_names(self) -> list:
+        self._maybe_reload()
+        return sorted(self._prompts)
+
+    def persona_levels(self) -> list:
+        self._maybe_reload()
+        return sorted(self._personas)
+
+
+PROMPTS = PromptRegistry()
+
+
+def load_prompt_template(prompt_type: str) -> str:
+    return PROMPTS.get_prompt(prompt_type)
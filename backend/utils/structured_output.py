@@ -0,0 +1,366 @@
+"""
+Tolerant parsing of JSON replies from LLMs.
+
+Models often wrap JSON in code fences or prose, leave trailing commas,
+use Python literals or get cut off at max_tokens. parse_structured()
+extracts and repairs the JSON, then validates it against a small JSON
+Schema subset (type, properties, required, items, minItems, maxItems,
+minimum, maximum), coercing near-misses such as "7/10" for an integer or
+{"questions": [...]} for an array. Only when that fails is a short fix-up
+prompt sent (if a fixup callable is given), instead of regenerating the
+whole reply.
+"""
+import os
+import re
+import json
+import threading
+
+# Fix-up prompts sent per reply before giving up
+LLM_FIXUP_RETRIES = int(os.getenv("LLM_FIXUP_RETRIES", "1"))
+
+_SMART_QUOTES = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+_CLOSERS = {"{": "}", "[": "]"}
+_ESCAPES = {'"': '\\"', "\n": "\\n", "\r": "\\r", "\t": "\\t"}
+_WORDS = {"true": "true", "false": "false", "null": "null", "True": "true", "False": "false", "None": "null"}
+_FENCE = re.compile(r"```(?:json|JSON)?\s*\n?(.*?)(?:```|$)", re.DOTALL)
+_NUMBER = re.compile(r"-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?")
+_WORD = re.compile(r"[A-Za-z_][\w-]*")
+_BULLET = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s*")
+
+_stats_lock = threading.Lock()
+_stats = {"parsed": 0, "extracted": 0, "repaired": 0, "fixups": 0, "fixed": 0, "failed": 0}
+
+
+class StructuredOutputError(ValueError):
+    """
+    Raised when a reply cannot be turned into a value matching the schema.
+    `errors` lists the individual problems.
+    """
+
+    def __init__(self, errors: list):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+def _count(key: str) -> None:
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def structured_output_stats() -> dict:
+    """
+    How replies were parsed: directly, after extraction from surrounding
+    text, after repair, after a fix-up prompt, or not at all.
+    """
+    with _stats_lock:
+        return dict(_stats)
+
+
+def repair_json(text: str) -> str:
+    """
+    Rewrites near-JSON into JSON: single-quoted or smart-quoted strings,
+    unquoted keys and bare words, Python literals, comments, missing or
+    trailing commas, mismatched brackets and output truncated mid-value.
+    """
+    text = text.translate(_SMART_QUOTES)
+    out, stack, last = [], [], ""
+    i, n = 0, len(text)
+
+    def drop_trailing_comma():
+        for k in range(len(out) - 1, -1, -1):
+            if out[k].strip():
+                if out[k] == ",":
+                    del out[k]
+                return
+
+    def begin_value():
+        # Two values in a row are missing the comma between them
+        if last and (last in '"}]' or last.isalnum()):
+            out.append(",")
+
+    while i < n:
+        ch = text[i]
+        if ch in "\"'":
+            j, buf = i + 1, []
+            # In a single-quoted string, a quote followed by a letter is an apostrophe (it's)
+            while j < n and (text[j] != ch or (ch == "'" and text[j + 1:j + 2].isalpha())):
+                if text[j] == "\\" and j + 1 < n:
+                    buf.append("'" if text[j + 1] == "'" else text[j:j + 2])
+                    j += 2
+                    continue
+                # A double quote here can only be inside a single-quoted string
+                buf.append(_ESCAPES.get(text[j], text[j]))
+                j += 1
+            begin_value()
+            out.append('"' + "".join(buf) + '"')
+            last, i = '"', j + 1
+        elif ch == "/" and text[i:i + 2] == "//":
+            end = text.find("\n", i)
+            i = n if end == -1 else end
+        elif ch == "/" and text[i:i + 2] == "/*":
+            end = text.find("*/", i + 2)
+            i = n if end == -1 else end + 2
+        elif ch in "{[":
+            begin_value()
+            stack.append(ch)
+            out.append(ch)
+            last, i = ch, i + 1
+        elif ch in "}]":
+            if stack:
+                drop_trailing_comma()
+                out.append(_CLOSERS[stack.pop()])
+                last = out[-1]
+            i += 1
+        elif ch == ",":
+            if last and last not in ",:[{":
+                out.append(ch)
+                last = ch
+            i += 1
+        elif ch == ":":
+            out.append(ch)
+            last, i = ch, i + 1
+        elif ch.isspace():
+            out.append(ch)
+            i += 1
+        elif ch == "-" or ch.isdigit():
+            match = _NUMBER.match(text, i)
+            if match is None:
+                i += 1
+                continue
+            begin_value()
+            out.append(match.group())
+            last, i = "0", match.end()
+        elif ch.isalpha() or ch == "_":
+            match = _WORD.match(text, i)
+            word, i = match.group(), match.end()
+            is_key = text[i:].lstrip().startswith(":")
+            begin_value()
+            out.append(_WORDS[word] if word in _WORDS and not is_key else json.dumps(word))
+            last = '"' if is_key or word not in _WORDS else "l"
+        else:
+            # Stray prose or punctuation between values
+            i += 1
+
+    drop_trailing_comma()
+    if last == ":":
+        out.append("null")
+    out.extend(_CLOSERS[opener] for opener in reversed(stack))
+    return "".join(out).strip()
+
+
+def _balanced_span(text: str, opener: str):
+    # From the first opener to its matching closer (or the end, if truncated)
+    start = text.find(opener)
+    if start == -1:
+        return None
+    depth, quote, escaped = 0, None, False
+    for k in range(start, len(text)):
+        ch = text[k]
+        if quote:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == quote:
+                quote = None
+        elif ch == '"':
+            quote = ch
+        elif ch in "{[":
+            depth += 1
+        elif ch in "}]":
+            depth -= 1
+            if depth == 0:
+                return text[start:k + 1]
+    return text[start:]
+
+
+def _candidates(text: str, schema: dict) -> list:
+    openers = "[{" if schema.get("type") == "array" else "{["
+    candidates = [text.strip()]
+    candidates += [block.strip() for block in _FENCE.findall(text)]
+    candidates += [span for span in (_balanced_span(text, opener) for opener in openers) if span]
+    return list(dict.fromkeys(c for c in candidates if c))
+
+
+def _type_name(value) -> str:
+    return {dict: "object", list: "array", str: "string", bool: "boolean", type(None): "null"}.get(
+        type(value), "number")
+
+
+def _norm_key(key: str) -> str:
+    return re.sub(r"[\s-]+", "_", str(key).strip().lower())
+
+
+def coerce(value, schema: dict, path: str = "$"):
+    """
+    Returns value converted to match schema where that is unambiguous
+    (numbers from numeric strings, strings from numbers, arrays from
+    bullet lists or a wrapping object, keys matched case-insensitively,
+    numbers clamped to minimum/maximum). Raises StructuredOutputError
+    listing what still does not match.
+    """
+    kind = schema.get("type")
+    if kind == "object":
+        if isinstance(value, list) and len(value) == 1 and isinstance(value[0], dict):
+            value = value[0]
+        if not isinstance(value, dict):
+            raise StructuredOutputError([f"{path}: expected object, got {_type_name(value)}"])
+        properties = schema.get("properties", {})
+        by_norm = {_norm_key(key): key for key in value}
+        result, errors = {}, []
+        for key, item in value.items():
+            if key not in properties and _norm_key(key) not in properties:
+                result[key] = item
+        for name, subschema in properties.items():
+            key = name if name in value else by_norm.get(_norm_key(name))
+            if key is None:
+                if name in schema.get("required", []):
+                    errors.append(f"{path}.{name}: missing")
+                continue
+            try:
+                result[name] = coerce(value[key], subschema, f"{path}.{name}")
+            except StructuredOutputError as e:
+                errors.extend(e.errors)
+        if errors:
+            raise StructuredOutputError(errors)
+        return result
+
+    if kind == "array":
+        items = schema.get("items", {})
+        if isinstance(value, dict):
+            lists = [item for item in value.values() if isinstance(item, list)]
+            if len(lists) == 1:
+                value = lists[0]
+            elif items.get("type") == "object":
+                value = [value]
+        if isinstance(value, str) and items.get("type") == "string":
+            value = [_BULLET.sub("", line).strip() for line in value.splitlines()]
+            value = [line for line in value if line]
+        elif not isinstance(value, list):
+            value = [value]
+        result, errors = [], []
+        for k, item in enumerate(value):
+            try:
+                result.append(coerce(item, items, f"{path}[{k}]"))
+            except StructuredOutputError as e:
+                errors.extend(e.errors)
+        if len(result) < schema.get("minItems", 0):
+            errors.append(f"{path}: expected at least {schema['minItems']} items, got {len(result)}")
+        if "maxItems" in schema and len(result) > schema["maxItems"]:
+            errors.append(f"{path}: expected at most {schema['maxItems']} items, got {len(result)}")
+        if errors:
+            raise StructuredOutputError(errors)
+        return result
+
+    if kind == "string":
+        if isinstance(value, str):
+            return value.strip()
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return str(value)
+        if isinstance(value, list) and all(isinstance(item, str) for item in value):
+            return " ".join(item.strip() for item in value)
+        raise StructuredOutputError([f"{path}: expected string, got {_type_name(value)}"])
+
+    if kind in ("integer", "number"):
+        number = None
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            number = value
+        elif isinstance(value, str):
+            match = _NUMBER.search(value)
+            number = float(match.group()) if match else None
+        if number is None:
+            raise StructuredOutputError([f"{path}: expected {kind}, got {_type_name(value)}"])
+        if kind == "integer":
+            number = int(round(number))
+        if "minimum" in schema:
+            number = max(schema["minimum"], number)
+        if "maximum" in schema:
+            number = min(schema["maximum"], number)
+        return number
+
+    return value
+
+
+def _bullet_lines(text: str) -> list:
+    lines = [line for line in text.splitlines() if _BULLET.match(line) and _BULLET.sub("", line).strip()]
+    return [_BULLET.sub("", line).strip() for line in lines]
+
+
+def _distance(error: StructuredOutputError) -> tuple:
+    return any(e.startswith("$: expected") for e in error.errors), len(error.errors)
+
+
+def _parse(content: str, schema: dict):
+    candidates = _candidates(content or "", schema)
+    best = None
+    for repair in (False, True):
+        for k, candidate in enumerate(candidates):
+            # Repairing prose would turn its words into values
+            if repair and candidate[0] not in "{[":
+                continue
+            try:
+                value = json.loads(repair_json(candidate) if repair else candidate)
+            except ValueError:
+                continue
+            try:
+                value = coerce(value, schema)
+            except StructuredOutputError as e:
+                # Report the closest candidate: right top-level type, then fewest problems
+                if best is None or _distance(e) < _distance(best):
+                    best = e
+                continue
+            _count("repaired" if repair else "extracted" if k else "parsed")
+            return value
+    # A plain numbered or bulleted list where a list of strings was asked for
+    if schema.get("type") == "array" and schema.get("items", {}).get("type") == "string":
+        lines = _bullet_lines(content or "")
+        if lines:
+            try:
+                value = coerce(lines, schema)
+                _count("repaired")
+                return value
+            except StructuredOutputError as e:
+                best = best or e
+    raise best or StructuredOutputError(["no JSON value found in the reply"])
+
+
+def fixup_prompt(content: str, schema: dict, errors: list) -> str:
+    """
+    The follow-up prompt asking the model to correct its own reply.
+    """
+    return (
+        f"Convert the text below into JSON matching this JSON Schema:\n{json.dumps(schema)}\n"
+        f"Problems found: {'; '.join(errors)}\n"
+        f"Keep its content and change only what is needed. Reply with the corrected JSON only.\n\n"
+        f"Text:\n{content}"
+    )
+
+
+def parse_structured(content: str, schema: dict, fixup=None, retries: int = LLM_FIXUP_RETRIES):
+    """
+    Parses an LLM reply into a value matching schema (see coerce).
+
+    Parameters:
+        fixup (callable): If given, called with a fix-up prompt (see
+            fixup_prompt) when the reply cannot be repaired locally; it
+            returns the model's corrected reply, which is parsed in turn.
+        retries (int): Maximum number of fix-up prompts.
+
+    Raises:
+        StructuredOutputError: If no attempt yields a matching value.
+    """
+    try:
+        return _parse(content, schema)
+    except StructuredOutputError as e:
+        error = e
+    for _ in range(retries if fixup is not None else 0):
+        _count("fixups")
+        content = fixup(fixup_prompt(content, schema, error.errors))
+        try:
+            value = _parse(content, schema)
+            _count("fixed")
+            return value
+        except StructuredOutputError as e:
+            error = e
+    _count("failed")
+    raise error
@@ -1,9 +1,15 @@
 import os
+import sys
 import json
 import logging
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import librosa
-import cohere
+
+# Shared prompt builder from the backend utils
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'backend')))
+from utils.prompt_builder import PromptBuilder
+from utils.llm_client import configure_provider, generate_text, stream_generate_text
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -14,29 +20,146 @@ logger = logging.getLogger(__name__)
 COHERE_API_KEY = os.environ.get("COHERE_API_KEY", "O34WBadHOatc1tlLhoHnkLNx8Ov2nfU0MOgaa1Sy")
 if not COHERE_API_KEY:
     logger.error("COHERE_API_KEY not set in environment.")
-co = cohere.Client(COHERE_API_KEY)
+configure_provider("cohere", api_key=COHERE_API_KEY)
+
+
+# Frame-level series stored in feature sidecars
+SERIES_FIELDS = ('rms', 'pitch', 'voiced_flag', 'voiced_prob')
+HOP_SECONDS = 0.010
+# Points per series in the decimated summary returned by the API
+SUMMARY_POINTS = int(os.environ.get("FEATURE_SUMMARY_POINTS", "200"))
+# Longer transcripts are merged into this many spans for the feedback prompt
+PROMPT_MAX_SEGMENTS = int(os.environ.get("PROMPT_MAX_SEGMENTS", "40"))
+# Token budget for the whole feedback prompt; the transcript is shortened to fit
+FEEDBACK_PROMPT_TOKENS = int(os.environ.get("FEEDBACK_PROMPT_TOKENS", "1500"))
+
+# Pitch engines for analyze_audio:
+#   pyin_full   - pYIN over C2-C7 (original setting; slowest)
+#   pyin_speech - pYIN limited to the speaking range
+#   pyin_voiced - pyin_speech evaluated only on high-energy regions
+#   yin         - plain YIN over the speaking range, voicing from energy
+PITCH_ENGINES = ("pyin_full", "pyin_speech", "pyin_voiced", "yin")
+PITCH_ENGINE = os.environ.get("PITCH_ENGINE", "pyin_full")
+# Processes for chunk-parallel pYIN (1 = run inline)
+PITCH_WORKERS = int(os.environ.get("PITCH_WORKERS", "1"))
+# pYIN/YIN need more than two periods of fmin in the 25 ms (400-sample) frame
+# at 16 kHz, i.e. fmin above 80 Hz; 81 Hz still covers low male voices
+SPEECH_FMIN, SPEECH_FMAX = 81.0, 400.0
+# Frames quieter than this relative to the loudest frame are treated as silence
+ENERGY_GATE_DB = -35.0
+# Frames of padding around high-energy regions, and of context around chunks
+REGION_PAD_FRAMES = 5
+CHUNK_CONTEXT_FRAMES = 25
+CHUNK_FRAMES = 1000
+
+_pitch_pool = None
+
+
+def _get_pitch_pool(workers: int) -> ProcessPoolExecutor:
+    global _pitch_pool
+    if _pitch_pool is None or _pitch_pool._max_workers != workers:
+        if _pitch_pool is not None:
+            _pitch_pool.shutdown(wait=False)
+        _pitch_pool = ProcessPoolExecutor(max_workers=workers)
+    return _pitch_pool
+
+
+def _pyin_segment(segment, sr, frame_len, hop_len, fmin, fmax):
+    return librosa.pyin(segment, fmin=fmin, fmax=fmax, sr=sr, frame_length=frame_len, hop_length=hop_len)
 
 
-def analyze_audio(audio_path: str) -> dict:
+def _energy_regions(active: np.ndarray) -> list:
     """
-    Extract prosodic features from an audio file:
+    Contiguous (start, stop) frame ranges where active is True, each grown
+    by REGION_PAD_FRAMES and merged with its neighbours when they touch.
+    """
+    padded = np.convolve(active.astype(np.int8), np.ones(2 * REGION_PAD_FRAMES + 1, dtype=np.int8), mode="same") > 0
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], padded.astype(np.int8), [0]))))
+    return list(zip(edges[::2], edges[1::2]))
+
+
+def _pyin_spans(y, sr, spans, n_frames, frame_len, hop_len, fmin, fmax, workers):
+    """
+    Runs pYIN on each (start, stop) frame span and writes the results into
+    full-length arrays; frames outside the spans stay unvoiced. With
+    workers > 1 spans are split into CHUNK_FRAMES chunks, each decoded with
+    CHUNK_CONTEXT_FRAMES of context on both sides, across processes.
+    """
+    f0 = np.full(n_frames, np.nan)
+    voiced_flag = np.zeros(n_frames, dtype=bool)
+    voiced_prob = np.zeros(n_frames)
+
+    context = 0
+    if workers > 1:
+        spans = [(s, min(s + CHUNK_FRAMES, stop)) for start, stop in spans for s in range(start, stop, CHUNK_FRAMES)]
+        context = CHUNK_CONTEXT_FRAMES
+    jobs = []
+    for start, stop in spans:
+        lo, hi = max(0, start - context), min(n_frames, stop + context)
+        # With centred frames, samples [lo*hop, (hi-1)*hop] yield exactly frames lo..hi-1
+        jobs.append((start, stop, lo, y[lo * hop_len:(hi - 1) * hop_len + 1]))
+
+    args = [(segment, sr, frame_len, hop_len, fmin, fmax) for _, _, _, segment in jobs]
+    if workers > 1 and len(jobs) > 1:
+        results = _get_pitch_pool(workers).map(_pyin_segment, *zip(*args))
+    else:
+        results = (_pyin_segment(*a) for a in args)
+
+    for (start, stop, lo, _), (seg_f0, seg_flag, seg_prob) in zip(jobs, results):
+        keep = slice(start - lo, stop - lo)
+        f0[start:stop] = seg_f0[keep]
+        voiced_flag[start:stop] = seg_flag[keep]
+        voiced_prob[start:stop] = seg_prob[keep]
+    return f0, voiced_flag, voiced_prob
+
+
+def estimate_pitch(y: np.ndarray, sr: int, rms: np.ndarray, frame_len: int, hop_len: int,
+                   engine: str = None, workers: int = None):
+    """
+    Frame-level f0 (NaN where unvoiced), voiced flags and voicing
+    probabilities aligned with `rms`, using one of PITCH_ENGINES.
+    """
+    engine = engine or PITCH_ENGINE
+    workers = workers or PITCH_WORKERS
+    if engine not in PITCH_ENGINES:
+        raise ValueError(f"Unknown pitch engine '{engine}'. Expected one of {PITCH_ENGINES}")
+    n_frames = len(rms)
+    loud = librosa.amplitude_to_db(rms, ref=np.max) > ENERGY_GATE_DB
+
+    if engine == "yin":
+        f0 = librosa.yin(y, fmin=SPEECH_FMIN, fmax=SPEECH_FMAX, sr=sr,
+                         frame_length=frame_len, hop_length=hop_len)[:n_frames]
+        # YIN reports fmax when no period is found
+        voiced_flag = loud & (f0 < SPEECH_FMAX * 0.99)
+        f0 = np.where(voiced_flag, f0, np.nan)
+        return f0, voiced_flag, voiced_flag.astype(float)
+
+    if engine == "pyin_full":
+        fmin, fmax = librosa.note_to_hz('C2'), librosa.note_to_hz('C7')
+    else:
+        fmin, fmax = SPEECH_FMIN, SPEECH_FMAX
+    spans = _energy_regions(loud) if engine == "pyin_voiced" else [(0, n_frames)]
+    return _pyin_spans(y, sr, spans, n_frames, frame_len, hop_len, fmin, fmax, workers)
+
+
+def analyze_audio(audio, sr: int = 16000, pitch_engine: str = None, workers: int = None) -> dict:
+    """
+    Extract prosodic features from an audio file path or an in-memory
+    mono float32 signal sampled at `sr`:
       - RMS energy
-      - Pitch (f0) via PYIN
+      - Pitch (f0) via the selected pitch engine (PITCH_ENGINE by default)
       - Speaking rate (onset times)
     Returns a dict of lists.
     """
-    y, sr = librosa.load(audio_path, sr=16000)
+    if isinstance(audio, np.ndarray):
+        y = audio
+    else:
+        y, sr = librosa.load(audio, sr=16000)
     frame_len = int(0.025 * sr)
-    hop_len = int(0.010 * sr)
+    hop_len = int(HOP_SECONDS * sr)
 
     rms = librosa.feature.rms(y=y, frame_length=frame_len, hop_length=hop_len)[0]
-    f0, voiced_flag, voiced_prob = librosa.pyin(
-        y,
-        fmin=librosa.note_to_hz('C2'),
-        fmax=librosa.note_to_hz('C7'),
-        frame_length=frame_len,
-        hop_length=hop_len
-    )
+    f0, voiced_flag, voiced_prob = estimate_pitch(y, sr, rms, frame_len, hop_len, pitch_engine, workers)
     onsets = librosa.onset.onset_detect(y=y, sr=sr, hop_length=hop_len)
     onset_times = librosa.frames_to_time(onsets, sr=sr, hop_length=hop_len)
 
@@ -49,6 +172,96 @@ def analyze_audio(audio_path: str) -> dict:
     }
 
 
+def save_features(audio_features: dict, path: str) -> str:
+    """
+    Writes the frame-level features as a compressed .npz sidecar: float16
+    series (NaN for unvoiced pitch), a boolean voiced mask and float32
+    onset times. Returns the path.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    np.savez_compressed(
+        path,
+        hop_seconds=np.float64(HOP_SECONDS),
+        rms=np.asarray(audio_features['rms'], dtype=np.float16),
+        pitch=np.array(audio_features['pitch'], dtype=np.float64).astype(np.float16),
+        voiced_flag=np.asarray(audio_features['voiced_flag'], dtype=bool),
+        voiced_prob=np.asarray(audio_features['voiced_prob'], dtype=np.float16),
+        onset_times=np.asarray(audio_features['onset_times'], dtype=np.float32),
+    )
+    logger.info(f"Audio features saved to {path}")
+    return path
+
+
+def load_feature_range(path: str, start: float = 0.0, end: float = None, fields=SERIES_FIELDS) -> dict:
+    """
+    Full-resolution series between start and end seconds from a feature
+    sidecar. Only the requested fields are read from the archive.
+    """
+    unknown = set(fields) - set(SERIES_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown feature fields: {sorted(unknown)}")
+    if not np.isfinite(start) or (end is not None and not np.isfinite(end)):
+        raise ValueError("start and end must be finite numbers of seconds")
+    with np.load(path) as data:
+        hop = float(data['hop_seconds'])
+        first = max(0, int(start / hop + 1e-6))
+        last = None if end is None else max(first, int(np.ceil(end / hop - 1e-6)))
+        out = {'hop_seconds': hop, 'start': round(first * hop, 4)}
+        for name in fields:
+            values = data[name][first:last]
+            if values.dtype == bool:
+                out[name] = values.tolist()
+            else:
+                out[name] = [None if np.isnan(v) else round(float(v), 4) for v in values]
+        onsets = data['onset_times']
+        out['onset_times'] = onsets[(onsets >= start) & ((onsets < end) if end is not None else True)].tolist()
+    return out
+
+
+def _decimate(values: np.ndarray, points: int) -> list:
+    # Block means ignoring NaNs; blocks with no values stay None
+    values = values.astype(np.float64)
+    step = max(1, -(-len(values) // points))
+    blocks = np.pad(values, (0, (-len(values)) % step), constant_values=np.nan).reshape(-1, step)
+    counts = (~np.isnan(blocks)).sum(axis=1)
+    means = np.where(counts > 0, np.nansum(blocks, axis=1) / np.maximum(counts, 1), np.nan)
+    return [None if np.isnan(v) else round(float(v), 4) for v in means]
+
+
+def feature_stats(audio_features: dict) -> dict:
+    """
+    Mean RMS energy, median pitch (Hz) and speaking rate (onsets/sec).
+    """
+    rms = np.asarray(audio_features['rms'], dtype=np.float64)
+    pitch = np.array(audio_features['pitch'], dtype=np.float64)
+    duration = len(rms) * HOP_SECONDS
+    return {
+        'mean_rms': float(rms.mean()) if len(rms) else 0.0,
+        'median_pitch': float(np.nanmedian(pitch)) if np.any(~np.isnan(pitch)) else None,
+        'speaking_rate': len(audio_features['onset_times']) / duration if duration else 0.0,
+    }
+
+
+def summarize_features(audio_features: dict, points: int = SUMMARY_POINTS) -> dict:
+    """
+    Compact view of the features for the API and feedback document: at
+    most `points` block-averaged values per series, the onset times and
+    overall statistics.
+    """
+    n_frames = len(audio_features['rms'])
+    step = max(1, -(-n_frames // points))
+    return {
+        'frames': n_frames,
+        'hop_seconds': HOP_SECONDS,
+        'step_seconds': round(step * HOP_SECONDS, 4),
+        'rms': _decimate(np.asarray(audio_features['rms']), points),
+        'pitch': _decimate(np.array(audio_features['pitch'], dtype=np.float64), points),
+        'voiced_ratio': _decimate(np.asarray(audio_features['voiced_flag'], dtype=np.float64), points),
+        'onset_times': [round(t, 3) for t in audio_features['onset_times']],
+        'stats': feature_stats(audio_features),
+    }
+
+
 def load_transcript(transcript_path: str) -> list:
     """
     Load Whisper JSON transcript and return list of segments:
@@ -59,39 +272,152 @@ def load_transcript(transcript_path: str) -> list:
     return [{'start': seg['start'], 'end': seg['end'], 'text': seg['text']} for seg in data.get('segments', [])]
 
 
-def cohere_process_feedback(segments: list, audio_features: dict) -> str:
+def group_segments(segments: list, max_segments: int = PROMPT_MAX_SEGMENTS) -> list:
+    """
+    Merges consecutive segments into at most max_segments spans of roughly
+    equal segment count.
+    """
+    if len(segments) <= max_segments:
+        return segments
+    groups = np.arange(len(segments)) * max_segments // len(segments)
+    bounds = np.flatnonzero(np.diff(np.concatenate(([-1], groups, [max_segments]))))
+    return [
+        {
+            'start': segments[a]['start'],
+            'end': segments[b - 1]['end'],
+            'text': " ".join(seg['text'].strip() for seg in segments[a:b]),
+        }
+        for a, b in zip(bounds[:-1], bounds[1:])
+    ]
+
+
+def segment_prosody(segments: list, audio_features: dict) -> list:
+    """
+    Energy, pitch, voicing and rate statistics for every transcript segment.
+
+    Segment boundaries are mapped onto the 10 ms frame grid with
+    np.searchsorted, and window sums come from cumulative sums, so all
+    segments are computed at once in O(frames + segments). Statistics are
+    None where a segment has no frames (or no voiced frames, for pitch).
+    """
+    if not segments:
+        return []
+    rms = np.asarray(audio_features['rms'], dtype=np.float64)
+    pitch = np.array(audio_features['pitch'], dtype=np.float64)
+    onsets = np.asarray(audio_features['onset_times'], dtype=np.float64)
+    frame_times = np.arange(len(rms)) * HOP_SECONDS
+
+    starts = np.array([seg['start'] for seg in segments], dtype=np.float64)
+    ends = np.maximum(np.array([seg['end'] for seg in segments], dtype=np.float64), starts)
+    first = np.searchsorted(frame_times, starts, side='left')
+    last = np.searchsorted(frame_times, ends, side='left')
+
+    def window_sum(values):
+        csum = np.concatenate(([0.0], np.cumsum(values, dtype=np.float64)))
+        return csum[last] - csum[first]
+
+    voiced = ~np.isnan(pitch)
+    voiced_pitch = np.where(voiced, pitch, 0.0)
+    n_frames = last - first
+    n_voiced = window_sum(voiced)
+    mean_rms = window_sum(rms) / np.maximum(n_frames, 1)
+    mean_pitch = window_sum(voiced_pitch) / np.maximum(n_voiced, 1)
+    pitch_std = np.sqrt(np.maximum(window_sum(voiced_pitch ** 2) / np.maximum(n_voiced, 1) - mean_pitch ** 2, 0.0))
+    durations = ends - starts
+    n_onsets = np.searchsorted(onsets, ends, side='left') - np.searchsorted(onsets, starts, side='left')
+    n_words = np.array([len(seg['text'].split()) for seg in segments])
+    pauses = starts - np.concatenate(([0.0], ends[:-1]))
+
+    def value(x, ok, digits):
+        return round(float(x), digits) if ok else None
+
+    return [
+        {
+            'start': seg['start'],
+            'end': seg['end'],
+            'text': seg['text'],
+            'mean_rms': value(mean_rms[i], n_frames[i] > 0, 4),
+            'mean_pitch': value(mean_pitch[i], n_voiced[i] > 0, 1),
+            'pitch_std': value(pitch_std[i], n_voiced[i] > 0, 1),
+            'voiced_ratio': value(n_voiced[i] / max(n_frames[i], 1), n_frames[i] > 0, 2),
+            'onset_rate': value(n_onsets[i] / max(durations[i], 1e-9), durations[i] > 0, 2),
+            'word_rate': value(n_words[i] / max(durations[i], 1e-9), durations[i] > 0, 2),
+            'pause_before': value(max(pauses[i], 0.0), True, 2),
+        }
+        for i, seg in enumerate(segments)
+    ]
+
+
+def _format_segment(stats: dict) -> str:
+    line = f"[{stats['start']:.2f}-{stats['end']:.2f}] {stats['text'].strip()}"
+    parts = []
+    if stats['mean_rms'] is not None:
+        parts.append(f"energy {stats['mean_rms']:.3f}")
+    if stats['mean_pitch'] is not None:
+        parts.append(f"pitch {stats['mean_pitch']:.0f}±{stats['pitch_std']:.0f} Hz")
+    if stats['voiced_ratio'] is not None:
+        parts.append(f"voiced {stats['voiced_ratio']:.0%}")
+    if stats['word_rate'] is not None:
+        parts.append(f"{stats['word_rate']:.1f} words/s")
+    if stats['pause_before'] and stats['pause_before'] >= 0.5:
+        parts.append(f"pause {stats['pause_before']:.1f}s before")
+    return f"{line}\n    ({', '.join(parts)})" if parts else line
+
+
+def cohere_process_feedback(segments: list, audio_features: dict, usage: dict = None, on_token=None) -> str:
     """
     Send combined transcript segments and audio features to Cohere for comprehensive feedback.
+    The prompt is kept within FEEDBACK_PROMPT_TOKENS; if usage is given it is
+    updated with the token report of the prompt that was sent. If on_token
+    is given, the feedback is streamed and each piece is passed to it.
     Returns the generated feedback text.
     """
     # Build prompt
-    prompt = (
+    builder = PromptBuilder(FEEDBACK_PROMPT_TOKENS).add(
         "You are an expert interviewer and speech analyst. "
         "Evaluate the candidate's response based on:\n"
         "1. Answer correctness and relevance.\n"
-        "2. Prosodic features (tone, energy, pitch, pacing).\n"
+        "2. Prosodic features (tone, energy, pitch, pacing), using the per-segment statistics.\n"
         "Provide feedback for each category.\n\n"
         "Transcript Segments:\n"
     )
+    # Untimed entries (e.g. the question) go first as-is; timed segments carry
+    # their own prosody statistics instead of raw frame series, and are
+    # merged or elided by the builder when over budget
     for seg in segments:
-        prompt += f"[{seg['start']:.2f}-{seg['end']:.2f}] {seg['text']}\n"
-    prompt += "\nAudio Features Summary:\n"
+        if seg['end'] <= seg['start']:
+            builder.add(f"{seg['text']}\n")
+    timed = [seg for seg in segments if seg['end'] > seg['start']]
+    builder.add_segments(
+        group_segments(timed),
+        lambda segs: [_format_segment(stats) for stats in segment_prosody(segs, audio_features)]
+    )
     # Summary stats
-    rms_vals = np.array(audio_features['rms'])
-    pitch_vals = np.array([p for p in audio_features['pitch'] if p is not None])
-    rate = len(audio_features['onset_times']) / (len(rms_vals) * (10/1000))
-    prompt += f"- Mean RMS energy: {rms_vals.mean():.3f}\n"
-    prompt += f"- Median pitch: {np.median(pitch_vals):.1f} Hz\n"
-    prompt += f"- Speaking rate: {rate:.2f} onsets/sec\n"
+    stats = feature_stats(audio_features)
+    builder.add(
+        "\nAudio Features Summary:\n"
+        f"- Mean RMS energy: {stats['mean_rms']:.3f}\n"
+        f"- Median pitch: {stats['median_pitch'] or float('nan'):.1f} Hz\n"
+        f"- Speaking rate: {stats['speaking_rate']:.2f} onsets/sec\n"
+    )
+    prompt, report = builder.build()
+    logger.info(f"Feedback prompt tokens: {report}")
+    if usage is not None:
+        usage.update(report)
 
     # Call Cohere
-    response = co.generate(
-        prompt=prompt,
-        model='command',
-        max_tokens=300,
-        temperature=0.7
-    )
-    return response.generations[0].text.strip()
+    if on_token is None:
+        return generate_text(
+            prompt=prompt,
+            model='command',
+            max_tokens=300,
+            temperature=0.7
+        ).strip()
+    pieces = []
+    for piece in stream_generate_text(prompt=prompt, model='command', max_tokens=300, temperature=0.7):
+        pieces.append(piece)
+        on_token(piece)
+    return "".join(pieces).strip()
 
 
 def save_feedback(feedback: dict, out_dir: str = 'feedback') -> str:
@@ -0,0 +1,131 @@
+import os
+import sys
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from video_processing import extract_audio_pcm, transcribe_pcm, save_transcript, write_wav
+from whisper_server import SharedAudio
+from Au_trans_feat_extract import analyze_audio
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Gesture analysis lives in the backend services folder
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'backend', 'services')))
+try:
+    from facial_gesture_analysis import coach_video_file
+    gesture_analysis_available = True
+except ImportError:
+    coach_video_file = None
+    gesture_analysis_available = False
+
+# Decode audio into shared memory so the Whisper server reads it in place
+SHARED_AUDIO = os.environ.get("SHARED_AUDIO", "1") == "1"
+
+# Playback WAVs are written off the request path
+_wav_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="wav")
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def _finish_audio(decoded, wav_path):
+    # Runs on the WAV writer once both audio branches are done with the buffer
+    try:
+        if wav_path:
+            write_wav(decoded.array if isinstance(decoded, SharedAudio) else decoded, wav_path)
+            logger.info(f"Playback audio saved to {wav_path}.")
+    except Exception as e:
+        logger.error(f"Failed to write playback audio: {e}")
+    finally:
+        if isinstance(decoded, SharedAudio):
+            decoded.release()
+
+
+def run_analysis_pipeline(video_path: str, wav_path: str = None, live: dict = None, progress=None) -> dict:
+    """
+    Analyzes an answer video with every branch running concurrently:
+      - gesture: frames decoded once by cv2 and fed to InterviewAnalyzer
+      - transcript: Whisper on the in-memory audio signal
+      - prosody: analyze_audio on the same signal
+    The audio track is decoded once by ffmpeg into a single buffer (shared
+    memory when SHARED_AUDIO is set) that both audio branches read without
+    copying, so total latency is roughly the slowest branch.
+
+    If wav_path is given, a playback WAV is written from the same buffer in
+    the background after the analysis finishes.
+
+    live is the result of a chunked upload's incremental transcription
+    ({"text", "segments", "audio"}); audio extraction and Whisper are then
+    skipped because both already ran while the answer was uploading.
+
+    progress, if given, is called as progress(stage, **details) when the
+    audio is decoded ("audio_extracted"), the transcript is saved
+    ("transcribed", with transcript_path) and the prosody features are
+    ready ("features_ready"); it may be called from worker threads.
+
+    Returns:
+        dict with 'transcript_path', 'audio_features', 'gestures' (None if
+        gesture analysis is unavailable) and per-branch 'timings' in seconds.
+    """
+    base_name = os.path.splitext(os.path.basename(video_path))[0]
+    progress = progress or (lambda stage, **details: None)
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=3, thread_name_prefix="analysis") as pool:
+        # Frame decoding does not depend on the audio, start it first
+        gesture_future = None
+        if gesture_analysis_available:
+            gesture_future = pool.submit(_timed, coach_video_file, video_path)
+        else:
+            logger.warning("Gesture analysis unavailable; skipping video frames.")
+
+        if live is not None:
+            decoded, extract_time = live["audio"], 0.0
+        else:
+            decoded, extract_time = _timed(extract_audio_pcm, video_path, SHARED_AUDIO)
+        audio = decoded.array if isinstance(decoded, SharedAudio) else decoded
+        try:
+            if audio.size == 0:
+                raise ValueError(f"No audio decoded from {video_path}")
+            progress("audio_extracted")
+
+            if live is not None:
+                transcript_future = pool.submit(_timed, save_transcript, live, base_name)
+            else:
+                transcript_future = pool.submit(_timed, transcribe_pcm, decoded, base_name)
+            prosody_future = pool.submit(_timed, analyze_audio, audio)
+
+            transcript_path, transcript_time = transcript_future.result()
+            progress("transcribed", transcript_path=transcript_path)
+            audio_features, prosody_time = prosody_future.result()
+            progress("features_ready")
+        except BaseException:
+            wav_path = None
+            raise
+        finally:
+            # Drop our view so the shared buffer can be released
+            del audio
+            _wav_writer.submit(_finish_audio, decoded, wav_path)
+        gestures, gesture_time = gesture_future.result() if gesture_future else (None, 0.0)
+
+    timings = {
+        "audio_extraction": round(extract_time, 3),
+        "transcription": round(transcript_time, 3),
+        "prosody": round(prosody_time, 3),
+        "gestures": round(gesture_time, 3),
+        "total": round(time.perf_counter() - start, 3),
+    }
+    logger.info(f"Analysis pipeline timings for {base_name}: {timings}")
+
+    return {
+        "transcript_path": transcript_path,
+        "audio_features": audio_features,
+        "gestures": gestures,
+        "timings": timings,
+    }
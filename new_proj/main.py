@@ -1,27 +1,47 @@
 import os
+import sys
 import json
+import queue
+import threading
 from datetime import datetime
-import cohere
+from functools import partial
 from flask import (
-    Flask, request, redirect, url_for, session,
+    Flask, Response, request, redirect, url_for, session,
     render_template, abort, jsonify, send_from_directory
 )
-from video_processing import process_video
-from Au_trans_feat_extract import analyze_audio, load_transcript, cohere_process_feedback, save_feedback
+from analysis_pipeline import run_analysis_pipeline
+from whisper_server import transcribe
+from Au_trans_feat_extract import (
+    load_transcript, cohere_process_feedback, save_feedback,
+    save_features, summarize_features, load_feature_range, SERIES_FIELDS
+)
 
-# Cohere setup
-COHERE_API_KEY = os.environ.get("COHERE_API_KEY", "O34WBadHOatc1tlLhoHnkLNx8Ov2nfU0MOgaa1Sy")
-co = cohere.Client(COHERE_API_KEY)
+# Modules shared with the backend (LLM cache, resume parser, chunked uploads)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'backend')))
+from utils.llm_cache import LLMCache, make_cache_key
+# Cohere calls go through the shared client (key configured in Au_trans_feat_extract)
+from utils.llm_client import generate_text, client_stats
+from services.chunked_upload import ChunkedUploadStore
+QUESTION_CACHE = LLMCache(db_path=os.path.join(os.getcwd(), 'cache', 'questions.db'))
+# Live segments are short and only their text is kept, so they share the Whisper server's batched decoder
+UPLOADS = ChunkedUploadStore(root=os.path.join(os.getcwd(), 'chunk_uploads'),
+                             transcribe=partial(transcribe, text_only=True))
 
 # Resume extraction dependencies
 try:
     import PyPDF2
+    from services.resume_parser import extract_resume_text
     resume_extraction_available = True
 except ImportError:
     PyPDF2 = None
     docx = None
     resume_extraction_available = False
 
+# Keep a WAV copy of each answer for playback
+SAVE_PLAYBACK_AUDIO = os.environ.get("SAVE_PLAYBACK_AUDIO", "1") == "1"
+# Comment lines sent on idle feedback streams so proxies keep them open
+SSE_KEEPALIVE = float(os.environ.get("SSE_KEEPALIVE", "15"))
+
 app = Flask(__name__)
 app.secret_key = os.environ.get("SECRET_KEY", "averylongandsecuresecretforthisapplication")
 users = {"user": "llm_password@001"}
@@ -32,12 +52,8 @@ def extract_text_from_resume(file):
         return "Extraction unavailable"
     name = file.filename.lower()
     if name.endswith('.pdf'):
-        temp = 'temp_resume.pdf'; file.save(temp)
-        try:
-            reader = PyPDF2.PdfReader(temp)
-            return ''.join(page.extract_text() or '' for page in reader.pages)
-        finally:
-            os.remove(temp)
+        # In-memory, page-parallel and cached by content hash
+        return extract_resume_text(file.stream)
     if name.endswith('.docx'):
         temp = 'temp_resume.docx'; file.save(temp)
         try:
@@ -48,13 +64,16 @@ def extract_text_from_resume(file):
     return "Unsupported format"
 
 
-def generate_questions_with_cohere(prompt: str) -> list[str]:
-    res = co.generate(prompt=prompt, max_tokens=300, temperature=0.9, model="command")
-    content = res.generations[0].text
-    return [l.strip() for l in content.split('\n') if l.strip()]
+def generate_questions_with_cohere(prompt: str, bypass_cache: bool = False) -> list[str]:
+    def generate():
+        content = generate_text(prompt=prompt, max_tokens=300, temperature=0.9, model="command")
+        return [l.strip() for l in content.split('\n') if l.strip()]
+
+    key = make_cache_key("cohere_questions", prompt=prompt, model="command", max_tokens=300)
+    return QUESTION_CACHE.get_or_compute(key, generate, bypass=bypass_cache)
 
 
-def generate_interview_questions(job_description="", resume_text="", prompt_type="technical"):
+def generate_interview_questions(job_description="", resume_text="", prompt_type="technical", bypass_cache=False):
     pt = prompt_type.lower()
     if pt == "technical":
         role, focus, base = (
@@ -79,7 +98,7 @@ def generate_interview_questions(job_description="", resume_text="", prompt_type
     if not base:
         raise ValueError(f"{prompt_type} input required.")
     prompt = f"You are an {role}. Based on: \"{base}\"\nGenerate 1 {focus}."
-    return generate_questions_with_cohere(prompt)
+    return generate_questions_with_cohere(prompt, bypass_cache=bypass_cache)
 
 
 def extract_form_data(req):
@@ -119,7 +138,7 @@ def interview():
     if it in ['technical', 'behavioral'] and not jd:
         return render_template('error.html', message="Job description required.")
     try:
-        qs = generate_interview_questions(jd, rt, it)
+        qs = generate_interview_questions(jd, rt, it, bypass_cache=request.form.get('bypass-cache') == '1')
     except Exception as e:
         return render_template('error.html', message=str(e))
     if not qs:
@@ -128,6 +147,14 @@ def interview():
     session['current_question'] = qs[0]
     return render_template('interview.html', question=qs[0])
 
+@app.route('/cache_stats')
+def cache_stats():
+    return jsonify(QUESTION_CACHE.stats()), 200
+
+@app.route('/llm_stats')
+def llm_stats():
+    return jsonify(client_stats()), 200
+
 @app.route('/results')
 def results():
     return render_template('results.html')
@@ -148,46 +175,192 @@ def save_video():
     fname = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.webm"
     vpath = os.path.join(vid_dir, fname)
     vid.save(vpath)
+    return process_saved_video(fname, vpath)
+
+
+def process_saved_video(fname, vpath):
+    """
+    Analyzes a saved answer video, stores the feedback and returns the
+    JSON response (or, with ?stream=1, a Server-Sent Events stream; see
+    stream_saved_video).
+    """
+    question_text = session.get('current_question', '')
+    if request.args.get('stream') == '1':
+        return stream_saved_video(
+            lambda events: analyze_saved_video(fname, vpath, question_text=question_text, events=events)
+        )
+    try:
+        return jsonify(analyze_saved_video(fname, vpath, question_text=question_text)), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
+
+def analyze_saved_video(fname, vpath, live=None, question_text='', events=None):
+    """
+    Runs the analysis pipeline and Cohere feedback for a saved answer video
+    and saves the feedback JSON. events, if given, is called as
+    events(name, data) for each pipeline stage ("stage") and each piece of
+    streamed feedback ("token"). Returns the response payload.
+    """
+    on_token = (lambda text: events("token", {"text": text})) if events else None
+    events = events or (lambda name, data: None)
+
+    def progress(stage, **details):
+        if stage == "transcribed":
+            details["segments"] = load_transcript(details.pop("transcript_path"))
+        events("stage", dict(details, stage=stage))
+
+    # Transcript, audio features and gestures in one concurrent pass;
+    # the playback WAV is written in the background from the same buffer
+    audio_path = None
+    if SAVE_PLAYBACK_AUDIO:
+        audio_dir = os.path.join(os.getcwd(), 'audio')
+        os.makedirs(audio_dir, exist_ok=True)
+        audio_path = os.path.join(audio_dir, f"{os.path.splitext(fname)[0]}.wav")
+    analysis = run_analysis_pipeline(vpath, wav_path=audio_path, live=live, progress=progress)
+    transcript_path = analysis["transcript_path"]
+    audio_features = analysis["audio_features"]
+
+    # Full-resolution features go to a binary sidecar; JSON gets a decimated summary
+    features_path = save_features(
+        audio_features,
+        os.path.join(app.root_path, 'features', f"{os.path.splitext(fname)[0]}.npz")
+    )
+
+    # Load transcript segments and prepend question
+    transcript_segments = load_transcript(transcript_path)
+    if question_text:
+        transcript_segments.insert(0, { 'start': 0.0, 'end': 0.0, 'text': f"Question: {question_text}" })
+
+    # Generate combined LLM feedback
+    prompt_usage = {}
+    feedback_text = cohere_process_feedback(
+        transcript_segments, audio_features, usage=prompt_usage, on_token=on_token
+    )
+    events("stage", {"stage": "feedback_ready"})
+
+    # Assemble feedback dict
+    feedback = {
+        "video": fname,
+        "audio_path": f"/audio/{os.path.basename(audio_path)}" if audio_path else None,
+        "transcript_path": f"/transcripts/{os.path.basename(transcript_path)}",
+        "features_file": f"/features/{os.path.basename(features_path)}",
+        "audio_features": summarize_features(audio_features),
+        "transcript_segments": transcript_segments,
+        "gestures": analysis["gestures"],
+        "timings": analysis["timings"],
+        "prompt_tokens": prompt_usage,
+        "cohere_feedback": feedback_text
+    }
+
+    # Save feedback JSON
+    feedback_file = save_feedback(feedback)
+
+    return {
+        "message": "Processed successfully",
+        "video": fname,
+        "audio": feedback["audio_path"],
+        "transcript": feedback["transcript_path"],
+        "feedback_file": f"/feedback/{os.path.basename(feedback_file)}",
+        "feedback": feedback
+    }
+
+
+def stream_saved_video(analyze):
+    """
+    Runs analyze(events), a call to analyze_saved_video, in the background
+    and streams its progress as Server-Sent Events: "stage" per pipeline
+    stage ("transcribed" carries the transcript segments), "token" per
+    piece of Cohere feedback, then "result" with the usual response
+    payload, or "error".
+    """
+    events = queue.Queue()
+
+    def run():
+        try:
+            result = analyze(lambda name, data: events.put((name, data)))
+            events.put(("result", result))
+        except Exception as e:
+            events.put(("error", {"error": str(e)}))
+
+    threading.Thread(target=run, daemon=True).start()
+
+    def generate():
+        while True:
+            try:
+                name, data = events.get(timeout=SSE_KEEPALIVE)
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+                continue
+            yield f"event: {name}\ndata: {json.dumps(data, default=str)}\n\n"
+            if name in ("result", "error"):
+                return
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# Chunked upload: the recorder sends timeslices while the candidate talks,
+# and audio is decoded and transcribed as they arrive
+@app.route('/upload/init', methods=['POST'])
+def upload_init():
+    upload_id = UPLOADS.init({"question": session.get('current_question', '')})
+    return jsonify({"upload_id": upload_id}), 201
+
+@app.route('/upload/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    state = UPLOADS.status(upload_id)
+    if not state:
+        return jsonify({"error": "Unknown upload."}), 404
+    return jsonify(state), 200
+
+@app.route('/upload/<upload_id>/chunk/<int:index>', methods=['PUT', 'POST'])
+def upload_chunk(upload_id, index):
+    chunk = request.files['chunk'].read() if 'chunk' in request.files else request.get_data()
     try:
-        # Extract audio & transcript
-        audio_path, transcript_path = process_video(vpath)
-
-        # Analyze audio features
-        audio_features = analyze_audio(audio_path)
-
-        # Load transcript segments and prepend question
-        transcript_segments = load_transcript(transcript_path)
-        question_text = session.get('current_question', '')
-        if question_text:
-            transcript_segments.insert(0, { 'start': 0.0, 'end': 0.0, 'text': f"Question: {question_text}" })
-
-        # Generate combined LLM feedback
-        feedback_text = cohere_process_feedback(transcript_segments, audio_features)
-
-        # Assemble feedback dict
-        feedback = {
-            "video": fname,
-            "audio_path": f"/audio/{os.path.basename(audio_path)}",
-            "transcript_path": f"/transcripts/{os.path.basename(transcript_path)}",
-            "audio_features": audio_features,
-            "transcript_segments": transcript_segments,
-            "cohere_feedback": feedback_text
-        }
-
-        # Save feedback JSON
-        feedback_file = save_feedback(feedback)
-
-        # Return response
-        return jsonify({
-            "message": "Processed successfully",
-            "video": fname,
-            "audio": feedback["audio_path"],
-            "transcript": feedback["transcript_path"],
-            "feedback_file": f"/feedback/{os.path.basename(feedback_file)}",
-            "feedback": feedback
-        }), 200
+        state = UPLOADS.append(upload_id, index, chunk)
+    except ValueError as e:
+        return jsonify({"error": str(e), "next_index": UPLOADS.status(upload_id)["next_index"]}), 409
+    if not state:
+        return jsonify({"error": "Unknown upload."}), 404
+    return jsonify({"next_index": state["next_index"], "bytes": state["bytes"]}), 200
+
+@app.route('/upload/<upload_id>/finalize', methods=['POST'])
+def upload_finalize(upload_id):
+    """
+    Moves the recording to videos/ and analyzes it. Each step runs under
+    the upload's lock and stores its outcome in the upload state (the video
+    name, then the response payload), so a retried or concurrent call waits
+    for the first one and returns the same result.
+    """
+    def move(recording_path, state):
+        if not os.path.exists(recording_path):
+            raise FileNotFoundError(recording_path)
+        vid_dir = os.path.join(app.root_path, 'videos')
+        os.makedirs(vid_dir, exist_ok=True)
+        fname = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{upload_id[:8]}.webm"
+        os.replace(recording_path, os.path.join(vid_dir, fname))
+        return fname
 
+    try:
+        finalized = UPLOADS.finalize(upload_id, start_job=move, key="video")
+    except FileNotFoundError:
+        return jsonify({"error": "No video provided."}), 400
+    if not finalized:
+        return jsonify({"error": "Unknown upload."}), 404
+    fname = finalized[1]["video"]
+    vpath = os.path.join(app.root_path, 'videos', fname)
+    question_text = session.get('current_question', '')
+
+    def analyze(events=None):
+        def run(recording_path, state):
+            return analyze_saved_video(fname, vpath, UPLOADS.finish_transcript(upload_id), question_text,
+                                       events=events)
+        return UPLOADS.finalize(upload_id, start_job=run, key="result")[1]["result"]
+
+    if request.args.get('stream') == '1':
+        return stream_saved_video(analyze)
+    try:
+        return jsonify(analyze()), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -200,6 +373,28 @@ def serve_audio(filename):
 def serve_transcript(filename):
     return send_from_directory(os.path.join(app.root_path,'transcripts'), filename)
 
+@app.route('/features/<path:filename>')
+def serve_features(filename):
+    return send_from_directory(os.path.join(app.root_path,'features'), filename)
+
+@app.route('/features/<name>/range')
+def feature_range(name):
+    """
+    Full-resolution feature series for ?start=&end= (seconds), optionally
+    limited to ?fields=pitch,rms.
+    """
+    path = os.path.join(app.root_path, 'features', f"{os.path.splitext(os.path.basename(name))[0]}.npz")
+    if not os.path.exists(path):
+        abort(404)
+    try:
+        start = float(request.args.get('start', 0))
+        end = request.args.get('end', type=float)
+        fields = request.args.get('fields')
+        fields = [f.strip() for f in fields.split(',') if f.strip()] if fields else SERIES_FIELDS
+        return jsonify(load_feature_range(path, start, end, fields)), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
 
@@ -0,0 +1,121 @@
+"""
+Benchmarks pitch engines for analyze_audio against the original pyin_full setting.
+
+Usage (from new_proj):
+    python pitch_benchmark.py audio/answer.wav --engines pyin_speech pyin_voiced yin --workers 1 4
+    python pitch_benchmark.py --seconds 60
+"""
+import sys
+import time
+import argparse
+
+import numpy as np
+import librosa
+
+from Au_trans_feat_extract import PITCH_ENGINES, estimate_pitch
+
+REFERENCE_ENGINE = "pyin_full"
+
+
+def synthetic_speech(seconds: float, sr: int = 16000, seed: int = 0) -> np.ndarray:
+    """
+    Speech-like test signal: harmonic "syllables" with gliding f0 between
+    90 and 260 Hz, separated by pauses of low-level noise.
+    """
+    rng = np.random.default_rng(seed)
+    out = []
+    total = 0
+    while total < seconds * sr:
+        length = int(rng.uniform(0.15, 0.6) * sr)
+        f_start, f_end = rng.uniform(90, 260, size=2)
+        phase = 2 * np.pi * np.cumsum(np.linspace(f_start, f_end, length)) / sr
+        voiced = sum(np.sin(k * phase) / k for k in range(1, 6)) * np.hanning(length) * 0.3
+        pause = rng.normal(0, 0.003, int(rng.uniform(0.05, 0.4) * sr))
+        out += [voiced + rng.normal(0, 0.003, length), pause]
+        total += length + len(pause)
+    return np.concatenate(out)[:int(seconds * sr)].astype(np.float32)
+
+
+def compare_pitch(reference: tuple, result: tuple) -> dict:
+    """
+    Median-pitch error against the reference, plus frame-level voicing
+    agreement and median absolute error (cents) on frames both call voiced.
+    """
+    ref_f0, ref_voiced = reference[0], reference[1]
+    f0, voiced = result[0], result[1]
+    ref_median = float(np.nanmedian(ref_f0)) if ref_voiced.any() else float("nan")
+    median = float(np.nanmedian(f0)) if voiced.any() else float("nan")
+    both = ref_voiced & voiced & ~np.isnan(ref_f0) & ~np.isnan(f0)
+    cents = 1200 * np.abs(np.log2(f0[both] / ref_f0[both])) if both.any() else np.array([np.nan])
+    return {
+        "median_hz": round(median, 1),
+        "median_error_hz": round(abs(median - ref_median), 2),
+        "median_error_pct": round(100 * abs(median - ref_median) / ref_median, 2) if ref_median else float("nan"),
+        "voicing_agreement": round(float(np.mean(ref_voiced == voiced)), 3),
+        "frame_error_cents": round(float(np.median(cents)), 1),
+    }
+
+
+def benchmark_engines(y: np.ndarray, sr: int, settings: list) -> list:
+    """
+    Runs the reference engine once, then each (engine, workers) setting,
+    and returns one row per setting with runtime, speedup and errors.
+    """
+    frame_len = int(0.025 * sr)
+    hop_len = int(0.010 * sr)
+    rms = librosa.feature.rms(y=y, frame_length=frame_len, hop_length=hop_len)[0]
+
+    def run(engine, workers):
+        start = time.perf_counter()
+        result = estimate_pitch(y, sr, rms, frame_len, hop_len, engine, workers)
+        return result, time.perf_counter() - start
+
+    reference, reference_time = run(REFERENCE_ENGINE, 1)
+    rows = []
+    for engine, workers in [(REFERENCE_ENGINE, 1)] + settings:
+        result, elapsed = (reference, reference_time) if (engine, workers) == (REFERENCE_ENGINE, 1) else run(engine, workers)
+        row = {
+            "engine": engine,
+            "workers": workers,
+            "seconds": round(elapsed, 2),
+            "realtime_factor": round(len(y) / sr / elapsed, 1) if elapsed > 0 else float("inf"),
+            "speedup": round(reference_time / elapsed, 2) if elapsed > 0 else float("inf"),
+        }
+        row.update(compare_pitch(reference, result))
+        rows.append(row)
+    return rows
+
+
+def print_rows(rows: list) -> None:
+    columns = list(dict.fromkeys(key for row in rows for key in row))
+    print("\t".join(columns))
+    for row in rows:
+        print("\t".join(str(row.get(c, "")) for c in columns))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare pitch engines with the original pyin_full setting.")
+    parser.add_argument("audio", nargs="?", help="audio file; a synthetic signal is used when omitted")
+    parser.add_argument("--seconds", type=float, default=30, help="length of the synthetic signal")
+    parser.add_argument("--engines", nargs="*", default=[e for e in PITCH_ENGINES if e != REFERENCE_ENGINE],
+                        choices=PITCH_ENGINES)
+    parser.add_argument("--workers", type=int, nargs="*", default=[1], help="process counts for pYIN engines")
+    args = parser.parse_args(argv)
+
+    if args.audio:
+        y, sr = librosa.load(args.audio, sr=16000)
+    else:
+        sr = 16000
+        y = synthetic_speech(args.seconds, sr)
+
+    # YIN has no parallel mode, so it is measured once
+    settings = [
+        (engine, workers)
+        for engine in args.engines
+        for workers in (args.workers if engine != "yin" else [1])
+    ]
+    print_rows(benchmark_engines(y, sr, settings))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,47 +1,26 @@
 import os
 import json
-import whisper
+import wave
+import numpy as np
 import ffmpeg
 import logging
+from whisper_server import SharedAudio, transcribe
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Load Whisper model once
-try:
-    MODEL = whisper.load_model("base")
-    logger.info("Loaded Whisper model 'base'.")
-except Exception as e:
-    logger.error(f"Failed to load Whisper model: {e}")
-    MODEL = None
+# Keep word-level timings in saved transcripts (slower)
+WORD_TIMESTAMPS = os.environ.get("WHISPER_WORD_TIMESTAMPS", "0") == "1"
 
 # Local Python-based video → audio → timestamped transcript using ffmpeg-python
-
-
-import os
-import json
-import whisper
-import ffmpeg
-import logging
-
-# Configure logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-
-# Load Whisper model once
-try:
-    MODEL = whisper.load_model("base")
-    logger.info("Loaded Whisper model 'base'.")
-except Exception as e:
-    logger.error(f"Failed to load Whisper model: {e}")
-    MODEL = None
+# Whisper runs in the shared model server (whisper_server.py); this module is a thin client.
 
 def process_video(video_path: str):
     """
     1. Extracts audio (WAV) from the given video file using ffmpeg-python.
-    2. Runs Whisper locally to produce a simple transcript (no timestamps).
-    3. Saves the audio in /audio and the transcript text in /transcripts (as JSON with a 'text' key).
+    2. Runs Whisper to produce a transcript with timestamped segments.
+    3. Saves the audio in /audio and the transcript in /transcripts (see save_transcript).
 
     Returns:
         audio_path (str)
@@ -50,9 +29,7 @@ def process_video(video_path: str):
     base_name = os.path.splitext(os.path.basename(video_path))[0]
     base_dir = os.getcwd()
     audio_dir = os.path.join(base_dir, 'audio')
-    transcript_dir = os.path.join(base_dir, 'transcripts')
     os.makedirs(audio_dir, exist_ok=True)
-    os.makedirs(transcript_dir, exist_ok=True)
 
     # 1. Extract audio
     audio_path = os.path.join(audio_dir, f"{base_name}.wav")
@@ -76,30 +53,137 @@ def process_video(video_path: str):
         logger.error(msg)
         raise FileNotFoundError(msg)
 
-    # 2. Simple Whisper transcription
-    if MODEL is None:
-        raise RuntimeError("Whisper model not loaded.")
-    logger.info("Running simple transcription (no timestamps)...")
+    # 2. Whisper transcription
+    logger.info("Running transcription...")
     try:
-        result = MODEL.transcribe(audio_path)  # returns {'text': ..., ...}
-        transcript_text = result.get('text', '').strip()
+        result = transcribe(audio_path, **_transcribe_options())  # returns {'text': ..., 'segments': ...}
         logger.info("Transcription complete.")
     except Exception as e:
         logger.error(f"Transcription failed: {e}")
         raise
 
     # 3. Save transcript
-    transcript_path = os.path.join(transcript_dir, f"{base_name}.json")
     try:
-        with open(transcript_path, 'w', encoding='utf-8') as f:
-            json.dump({"text": transcript_text}, f, ensure_ascii=False, indent=2)
-        logger.info(f"Transcript saved to {transcript_path}.")
+        transcript_path = save_transcript(result, base_name)
     except Exception as e:
         logger.error(f"Failed to save transcript: {e}")
         raise
 
     return audio_path, transcript_path
 
+
+def extract_audio_pcm(video_path: str, shared: bool = False):
+    """
+    Decodes the audio track of the given video to mono 16 kHz PCM on
+    ffmpeg's stdout and returns it as a float32 array in [-1, 1].
+    Nothing is written to disk.
+
+    With shared=True the samples are converted straight into a SharedAudio
+    buffer instead, which the Whisper server and the feature extractor read
+    in place; the caller must release() it.
+    """
+    logger.info(f"Streaming audio from {video_path}...")
+    try:
+        out, _ = (
+            ffmpeg
+            .input(video_path)
+            .output('pipe:', format='s16le', acodec='pcm_s16le', ac=1, ar='16000')
+            .run(capture_stdout=True, capture_stderr=True)
+        )
+    except ffmpeg.Error as e:
+        err = e.stderr.decode() if hasattr(e, 'stderr') else str(e)
+        logger.error(f"ffmpeg extraction error: {err}")
+        raise
+    pcm = np.frombuffer(out, dtype=np.int16)
+    if not shared:
+        return pcm.astype(np.float32) / 32768.0
+    audio = SharedAudio(len(pcm))
+    np.multiply(pcm, np.float32(1 / 32768.0), out=audio.array, dtype=np.float32)
+    return audio
+
+
+def write_wav(audio: np.ndarray, audio_path: str, sr: int = 16000) -> str:
+    """
+    Writes a float32 PCM array as a 16-bit mono WAV file. Returns the path.
+    """
+    pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype('<i2')
+    with wave.open(audio_path, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sr)
+        wav.writeframes(pcm.tobytes())
+    return audio_path
+
+
+def transcribe_pcm(audio, base_name: str) -> str:
+    """
+    Runs Whisper directly on an in-memory 16 kHz float32 signal (an array
+    or a SharedAudio buffer) and saves the transcript in /transcripts
+    (see save_transcript).
+
+    Returns:
+        transcript_path (str)
+    """
+    logger.info("Running simple transcription from memory...")
+    try:
+        result = transcribe(audio, **_transcribe_options())
+        logger.info("Transcription complete.")
+    except Exception as e:
+        logger.error(f"Transcription failed: {e}")
+        raise
+    return save_transcript(result, base_name)
+
+
+def _transcribe_options() -> dict:
+    return {"word_timestamps": True} if WORD_TIMESTAMPS else {}
+
+
+def save_transcript(result: dict, base_name: str) -> str:
+    """
+    Saves a Whisper result in /transcripts as JSON with the full 'text' and
+    timestamped 'segments' ({'start', 'end', 'text'}, plus 'words' when
+    word-level timings were requested).
+
+    Returns:
+        transcript_path (str)
+    """
+    transcript_dir = os.path.join(os.getcwd(), 'transcripts')
+    os.makedirs(transcript_dir, exist_ok=True)
+
+    segments = []
+    for seg in result.get('segments', []):
+        entry = {"start": round(float(seg['start']), 2), "end": round(float(seg['end']), 2), "text": seg['text'].strip()}
+        if seg.get('words'):
+            entry["words"] = [
+                {"word": w['word'].strip(), "start": round(float(w['start']), 2), "end": round(float(w['end']), 2)}
+                for w in seg['words']
+            ]
+        segments.append(entry)
+
+    transcript_path = os.path.join(transcript_dir, f"{base_name}.json")
+    with open(transcript_path, 'w', encoding='utf-8') as f:
+        json.dump({"text": result.get('text', '').strip(), "segments": segments}, f, ensure_ascii=False, indent=2)
+    logger.info(f"Transcript saved to {transcript_path}.")
+    return transcript_path
+
+
+def process_video_stream(video_path: str):
+    """
+    Streaming variant of process_video:
+    1. Pipes the audio out of ffmpeg into memory (no WAV on disk).
+    2. Hands the in-memory signal directly to Whisper.
+    3. Saves the transcript in /transcripts (as JSON with a 'text' key).
+
+    Returns:
+        audio (np.ndarray): Mono 16 kHz float32 signal, reusable by analyze_audio
+        transcript_path (str)
+    """
+    base_name = os.path.splitext(os.path.basename(video_path))[0]
+    audio = extract_audio_pcm(video_path)
+    if audio.size == 0:
+        raise ValueError(f"No audio decoded from {video_path}")
+    return audio, transcribe_pcm(audio, base_name)
+
 # def process_video(video_path: str):
 #     """
 #     1. Extracts audio (WAV) from the given video file using ffmpeg-python.
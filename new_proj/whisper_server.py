@@ -0,0 +1,313 @@
+"""
+Local Whisper transcription service.
+
+One long-lived process owns the model; web workers connect over a local
+socket (multiprocessing.connection) and send audio, so they never load
+the weights themselves.
+
+Run it once per host:
+    python whisper_server.py
+
+Requests are pickled, so the socket is authenticated. The key is taken
+from WHISPER_AUTHKEY or, if that is unset, from WHISPER_AUTHKEY_FILE. The
+server creates that file with a random key, readable only by its owner,
+and web workers running as the same user read it.
+"""
+import os
+import queue
+import secrets
+import logging
+import threading
+from multiprocessing import AuthenticationError, resource_tracker, shared_memory
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+WHISPER_MODEL_NAME = os.environ.get("WHISPER_MODEL", "base")
+WHISPER_SERVER_HOST = os.environ.get("WHISPER_SERVER_HOST", "127.0.0.1")
+WHISPER_SERVER_PORT = int(os.environ.get("WHISPER_SERVER_PORT", "6011"))
+WHISPER_AUTHKEY_FILE = os.environ.get(
+    "WHISPER_AUTHKEY_FILE", os.path.join(os.path.expanduser("~"), ".whisper_server.key")
+)
+# Seconds a web worker waits for a transcription before giving up on the server
+WHISPER_TIMEOUT = float(os.environ.get("WHISPER_TIMEOUT", "600"))
+# Load the model in-process when no server is running
+WHISPER_LOCAL_FALLBACK = os.environ.get("WHISPER_LOCAL_FALLBACK", "1") == "1"
+MAX_BATCH = int(os.environ.get("WHISPER_MAX_BATCH", "8"))
+
+SAMPLE_RATE = 16000
+# Clips up to Whisper's 30 s window can be decoded together in one batch
+BATCH_MAX_SECONDS = 30
+
+
+def load_authkey(create: bool = False):
+    """
+    Returns the connection key: WHISPER_AUTHKEY if set, else the contents
+    of WHISPER_AUTHKEY_FILE. With create=True (the server), a missing file
+    is created with a random key and mode 0600. Returns None when there is
+    no key.
+
+    Raises:
+        PermissionError: if the key file is readable by other users
+    """
+    if os.environ.get("WHISPER_AUTHKEY"):
+        return os.environ["WHISPER_AUTHKEY"].encode()
+    if create:
+        try:
+            fd = os.open(WHISPER_AUTHKEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            pass
+        else:
+            with os.fdopen(fd, "w") as f:
+                f.write(secrets.token_hex(32))
+    try:
+        if os.stat(WHISPER_AUTHKEY_FILE).st_mode & 0o077:
+            raise PermissionError(f"{WHISPER_AUTHKEY_FILE} must be readable only by its owner (chmod 600)")
+        with open(WHISPER_AUTHKEY_FILE, "rb") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+class SharedAudio:
+    """
+    A float32 sample buffer in shared memory. The server maps it by name,
+    so the signal is handed over without pickling or copying. The creator
+    calls release() once every reader is done.
+    """
+
+    def __init__(self, n_samples: int):
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, n_samples) * 4)
+        self.array = np.ndarray((n_samples,), dtype=np.float32, buffer=self.shm.buf)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def release(self) -> None:
+        self.array = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # A view is still alive somewhere; the mapping goes away with it
+            logger.warning(f"Shared audio {self.shm.name} still referenced at release.")
+        self.shm.unlink()
+
+
+def _attach_shared(name: str, n_samples: int):
+    shm = shared_memory.SharedMemory(name=name)
+    # Only the creating process owns (and unlinks) the segment
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm, np.ndarray((n_samples,), dtype=np.float32, buffer=shm.buf)
+
+
+class _Job:
+    def __init__(self, audio, options, text_only=False):
+        self.audio = audio
+        self.options = options
+        self.text_only = text_only
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class WhisperServer:
+    """
+    Accepts transcription jobs from many connections and runs them on a
+    single model thread. Jobs waiting together are drained as a batch.
+    Short text-only clips without options always go through the batched
+    decoder, shared with whichever such clips are waiting. Every other job
+    is transcribed in turn with model.transcribe. Which path a clip takes
+    therefore depends only on the request, never on the load.
+    """
+
+    def __init__(self, model_name=WHISPER_MODEL_NAME, address=(WHISPER_SERVER_HOST, WHISPER_SERVER_PORT),
+                 authkey=None, max_batch=MAX_BATCH):
+        import whisper
+        self.whisper = whisper
+        self.model = whisper.load_model(model_name)
+        logger.info(f"Loaded Whisper model '{model_name}'.")
+        self.address = address
+        self.authkey = authkey or load_authkey(create=True)
+        self.max_batch = max_batch
+        self.jobs = queue.Queue()
+
+    def _batchable(self, job):
+        return (
+            job.text_only
+            and not job.options
+            and isinstance(job.audio, np.ndarray)
+            and len(job.audio) <= BATCH_MAX_SECONDS * SAMPLE_RATE
+        )
+
+    def _decode_batch(self, jobs):
+        whisper = self.whisper
+        mels = [
+            whisper.log_mel_spectrogram(whisper.pad_or_trim(job.audio)).to(self.model.device)
+            for job in jobs
+        ]
+        import torch
+        options = whisper.DecodingOptions(fp16=self.model.device.type == "cuda")
+        results = whisper.decode(self.model, torch.stack(mels), options)
+        for job, result in zip(jobs, results):
+            text = result.text.strip()
+            job.result = {
+                "text": text,
+                "language": result.language,
+                "segments": [{"start": 0.0, "end": len(job.audio) / SAMPLE_RATE, "text": text}],
+            }
+
+    def _run_model(self):
+        while True:
+            jobs = [self.jobs.get()]
+            while len(jobs) < self.max_batch:
+                try:
+                    jobs.append(self.jobs.get_nowait())
+                except queue.Empty:
+                    break
+
+            batch = [job for job in jobs if self._batchable(job)]
+            rest = [job for job in jobs if not self._batchable(job)]
+            if batch:
+                try:
+                    self._decode_batch(batch)
+                except Exception as e:
+                    logger.error(f"Batched decode failed, falling back: {e}")
+                    rest.extend(batch)
+                else:
+                    for job in batch:
+                        job.done.set()
+
+            for job in rest:
+                try:
+                    job.result = self.model.transcribe(job.audio, **job.options)
+                except Exception as e:
+                    job.error = str(e)
+                job.done.set()
+
+    def _serve_connection(self, conn):
+        with conn:
+            while True:
+                try:
+                    audio, options, text_only = conn.recv()
+                except (EOFError, OSError):
+                    return
+                shm = reply = None
+                if isinstance(audio, tuple) and audio[0] == "shm":
+                    # Zero-copy view of the client's buffer
+                    try:
+                        shm, audio = _attach_shared(audio[1], audio[2])
+                    except (OSError, ValueError) as e:
+                        # Already released by a client that gave up waiting
+                        reply = (None, f"Shared audio buffer unavailable: {e}")
+                if reply is None:
+                    job = _Job(audio, options or {}, text_only)
+                    self.jobs.put(job)
+                    job.done.wait()
+                    job.audio = audio = None
+                    if shm is not None:
+                        shm.close()
+                    reply = (job.result, job.error)
+                try:
+                    conn.send(reply)
+                except OSError as e:
+                    # The client timed out and closed its end
+                    logger.info(f"Dropping Whisper reply to a closed connection: {e}")
+                    return
+
+    def serve_forever(self):
+        threading.Thread(target=self._run_model, daemon=True).start()
+        # A larger backlog than the default of 1, so a burst of connecting workers is not stalled
+        with Listener(self.address, authkey=self.authkey, backlog=64) as listener:
+            logger.info(f"Whisper server listening on {self.address[0]}:{self.address[1]}")
+            while True:
+                try:
+                    conn = listener.accept()
+                except (AuthenticationError, OSError, EOFError) as e:
+                    # A client with the wrong key (or one that hung up) must not stop the server
+                    logger.warning(f"Rejected a connection: {e}")
+                    continue
+                threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+
+_local = threading.local()
+_local_model = None
+_local_model_lock = threading.Lock()
+
+
+def _server_connection():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        authkey = load_authkey()
+        if authkey is None:
+            raise ConnectionError(f"no key in WHISPER_AUTHKEY or {WHISPER_AUTHKEY_FILE}")
+        conn = Client((WHISPER_SERVER_HOST, WHISPER_SERVER_PORT), authkey=authkey)
+        _local.conn = conn
+    return conn
+
+
+def _get_local_model():
+    global _local_model
+    with _local_model_lock:
+        if _local_model is None:
+            import whisper
+            _local_model = whisper.load_model(WHISPER_MODEL_NAME)
+            logger.info(f"Loaded Whisper model '{WHISPER_MODEL_NAME}' in-process.")
+    return _local_model
+
+
+def transcribe(audio, text_only: bool = False, **options) -> dict:
+    """
+    Transcribes a 16 kHz float32 array, a SharedAudio buffer or an audio
+    file path through the shared Whisper server. Returns Whisper's result
+    dict. SharedAudio is passed by name, so the samples are not copied.
+
+    By default the audio goes through model.transcribe, which gives
+    timestamped segments and temperature fallback. With text_only=True, a
+    clip of up to 30 s without options is decoded in a single pass and may
+    share a batch with other requests. Its result then has one segment
+    spanning the whole clip.
+
+    If the server is unreachable and WHISPER_LOCAL_FALLBACK is set, the
+    model is loaded lazily in this process instead.
+
+    Raises:
+        TimeoutError: if the server does not answer within WHISPER_TIMEOUT
+    """
+    try:
+        conn = _server_connection()
+    except (ConnectionError, OSError) as e:
+        if not WHISPER_LOCAL_FALLBACK:
+            raise RuntimeError(f"Whisper server unavailable: {e}")
+        logger.warning(f"Whisper server unavailable ({e}); transcribing in-process.")
+        if isinstance(audio, SharedAudio):
+            audio = audio.array
+        return _get_local_model().transcribe(audio, **options)
+
+    if isinstance(audio, SharedAudio):
+        audio = ("shm", audio.name, len(audio.array))
+    try:
+        conn.send((audio, options, text_only))
+        answered = conn.poll(WHISPER_TIMEOUT)
+        if answered:
+            result, error = conn.recv()
+    except (EOFError, OSError):
+        # Server restarted; reconnect on the next call
+        _local.conn = None
+        raise
+    if not answered:
+        # A late reply would be read by the next call; start over with a new connection
+        conn.close()
+        _local.conn = None
+        raise TimeoutError(f"Whisper server did not answer within {WHISPER_TIMEOUT:g}s")
+    if error:
+        raise RuntimeError(error)
+    return result
+
+
+if __name__ == "__main__":
+    WhisperServer().serve_forever()